@@ -6,8 +6,9 @@ from flask_bcrypt import Bcrypt
 from flask_jwt_extended import JWTManager
 from flask_mail import Mail
 from config import Config  
+from app.database import RoutingSession, configure_engines, init_engines
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})  # Чтения @read_replica-маршрутов - с реплики
 migrate = Migrate()
 bcrypt = Bcrypt()
 jwt = JWTManager()
@@ -18,19 +19,40 @@ def create_app(config_class=Config):
     app.config.from_object(config_class)
     
     # Инициализация расширений
+    configure_engines(app)  # Пул, PRAGMA SQLite и реплика - до создания движков
     db.init_app(app)
+    init_engines(app, db)
     migrate.init_app(app, db)
     CORS(app)  # Для React
     bcrypt.init_app(app)
     jwt.init_app(app)
     mail.init_app(app)
     
+    from app.metrics import metrics  # /metrics, латентность и SQL по маршрутам, ?profile=1
+    metrics.init_app(app)
+    from app.query_budget import query_guard  # Лимит SQL-запросов маршрутов (@query_budget)
+    query_guard.init_app(app)
+    from app.jobs import report_jobs  # Очередь разбора PDF-отчетов
+    report_jobs.init_app(app)
+    from app.notifications import notifications  # Фоновая рассылка уведомлений
+    notifications.init_app(app)
+    from app.auth import password_checker  # Пул проверки паролей и блокировка подбора
+    password_checker.init_app(app)
+    
     # Регистрация blueprints
     from app.routes import api_bp  # Явный импорт для линтера
     app.register_blueprint(api_bp, url_prefix='/api')
     # Изменено: импорт из корня проекта
     from seed import seed_bp  # Импорт seed blueprint из корня
     app.register_blueprint(seed_bp)
+    from app.aggregates import stats_bp  # flask stats rebuild / check
+    app.register_blueprint(stats_bp)
+    from app.tiles import tiles_bp  # flask tiles clear
+    app.register_blueprint(tiles_bp)
+    from app.export import export_bp  # flask export ports|reports|measurements
+    app.register_blueprint(export_bp)
+    from app.jobs import jobs_bp  # flask jobs run
+    app.register_blueprint(jobs_bp)
     
     # Глобальные обработчики ошибок
     @app.errorhandler(404)
@@ -51,4 +73,5 @@ def create_app(config_class=Config):
     return app
 
 # Импорты моделей для shell-контекста
-from app.models import User, Port, Report
\ No newline at end of file
+from app.models import User, Port, Report
+from app import aggregates, timeseries, subscriptions, tiles, search  # noqa: F401 - регистрируют after_flush-обработчики и DDL поиска
\ No newline at end of file
@@ -0,0 +1,347 @@
+import json
+import math
+from collections import Counter
+import click
+from flask import Blueprint
+from sqlalchemy import event, select
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from app.models import Port, PortAggregate, MetricHistogram, committed_value
+
+# Агрегаты для GET /api/ports/stats. Поддерживаются инкрементально в after_flush
+# той же транзакции, что и запись портов, поэтому stats не сканирует таблицу.
+
+AGGREGATE_ID = 1
+TOP_N = 5
+TOP_BUFFER = 20  # Запас кучи, чтобы удаления и рост score не требовали пересчета
+HISTOGRAM_BUCKETS = 20
+# Ширина корзины гистограммы; последняя корзина открыта сверху
+HISTOGRAM_WIDTHS = {
+    'air_quality': 10.0,
+    'water_quality': 5.0,
+    'co2_emissions': 100.0,
+    'incidents': 1,
+}
+
+# Столбцы port, от которых зависят агрегаты
+PORT_FIELDS = tuple(HISTOGRAM_WIDTHS) + ('green_score', 'name')
+
+# Метрика -> поле ответа /ports/stats со списком значений по портам
+TREND_FIELDS = {
+    'air_quality': 'air_quality_trend',
+    'water_quality': 'water_quality_trend',
+    'co2_emissions': 'co2_trend',
+    'incidents': 'incidents_trend',
+}
+
+stats_bp = Blueprint('stats', __name__)
+
+
+def bucket_for(metric, value):
+    return min(int(math.floor(value / HISTOGRAM_WIDTHS[metric])), HISTOGRAM_BUCKETS - 1)
+
+
+class _Delta:
+    def __init__(self):
+        self.count = 0
+        self.score = 0.0
+        self.histogram = Counter()
+        self.upserts = {}  # id -> (score, name)
+        self.removals = set()
+
+    def add(self, values, sign):
+        self.count += sign
+        self.score += sign * values['green_score']
+        for metric in HISTOGRAM_WIDTHS:
+            self.histogram[(metric, bucket_for(metric, values[metric]))] += sign
+
+    def __bool__(self):
+        return bool(self.count or self.score or any(self.histogram.values())
+                    or self.upserts or self.removals)
+
+
+def _port_values(obj, committed=False):
+    if committed:
+        return {attr: committed_value(obj, attr) for attr in PORT_FIELDS}
+    return {attr: getattr(obj, attr) for attr in PORT_FIELDS}
+
+
+def _collect(session):
+    delta = _Delta()
+    for obj in session.new:
+        if isinstance(obj, Port):
+            delta.add(_port_values(obj), 1)
+            delta.upserts[obj.id] = (obj.green_score, obj.name)
+    for obj in session.dirty:
+        if isinstance(obj, Port) and session.is_modified(obj, include_collections=False):
+            old = _port_values(obj, committed=True)
+            new = _port_values(obj)
+            if old != new:
+                delta.add(old, -1)
+                delta.add(new, 1)
+                delta.upserts[obj.id] = (new['green_score'], new['name'])
+    for obj in session.deleted:
+        if isinstance(obj, Port):
+            delta.add(_port_values(obj, committed=True), -1)
+            delta.removals.add(obj.id)
+    return delta
+
+
+def _upsert_histogram(conn, counts):
+    table = MetricHistogram.__table__
+    rows = [{'metric': metric, 'bucket': bucket, 'count': count}
+            for (metric, bucket), count in counts.items() if count]
+    if not rows:
+        return
+    dialect = conn.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.metric, table.c.bucket],
+            set_={'count': table.c.count + stmt.excluded['count']}
+        )
+        conn.execute(stmt, rows)
+        return
+    for row in rows:
+        result = conn.execute(
+            table.update()
+            .where(table.c.metric == row['metric'], table.c.bucket == row['bucket'])
+            .values(count=table.c.count + row['count'])
+        )
+        if result.rowcount == 0:
+            conn.execute(table.insert().values(**row))
+
+
+def _apply_heap(heap, boundary, delta):
+    """Обновляет ограниченную кучу самых загрязненных портов.
+
+    Порядок - (green_score, id), как в _load_heap. Инвариант: каждый порт вне
+    кучи идет не раньше boundary = (score, id) (None - в куче все порты).
+    """
+    changed = delta.removals | set(delta.upserts)
+    heap = [entry for entry in heap if entry[1] not in changed]
+    for port_id, (score, name) in delta.upserts.items():
+        if boundary is None or (score, port_id) <= boundary:
+            heap.append([score, port_id, name])
+    heap.sort(key=lambda entry: (entry[0], entry[1]))
+    while len(heap) > TOP_BUFFER:
+        dropped = heap.pop()
+        key = (dropped[0], dropped[1])
+        boundary = key if boundary is None else min(boundary, key)
+    return heap, boundary
+
+
+def _load_heap(conn):
+    # Куча из индекса по green_score: ORDER BY ... LIMIT без полного скана
+    port = Port.__table__
+    rows = conn.execute(
+        select(port.c.green_score, port.c.id, port.c.name)
+        .order_by(port.c.green_score, port.c.id)
+        .limit(TOP_BUFFER + 1)
+    ).fetchall()
+    heap = [list(row) for row in rows[:TOP_BUFFER]]
+    boundary = (rows[TOP_BUFFER][0], rows[TOP_BUFFER][1]) if len(rows) > TOP_BUFFER else None
+    return heap, boundary
+
+
+def _boundary_values(boundary):
+    score, port_id = boundary if boundary is not None else (None, None)
+    return {'top_boundary': score, 'top_boundary_id': port_id}
+
+
+def _stored_boundary(row):
+    if row['top_boundary'] is None:
+        return None
+    return (row['top_boundary'], row['top_boundary_id'])
+
+
+def scan_aggregates(conn):
+    """Полный пересчет агрегатов по таблице port."""
+    port = Port.__table__
+    count = 0
+    score_sum = 0.0
+    histogram = Counter()
+    result = conn.execute(select(
+        port.c.air_quality, port.c.water_quality, port.c.co2_emissions,
+        port.c.incidents, port.c.green_score
+    )).mappings()
+    for row in result:
+        count += 1
+        score_sum += row['green_score']
+        for metric in HISTOGRAM_WIDTHS:
+            histogram[(metric, bucket_for(metric, row[metric]))] += 1
+    heap, boundary = _load_heap(conn)
+    return {
+        'port_count': count,
+        'score_sum': score_sum,
+        'histogram': histogram,
+        'top_polluted': heap,
+        'top_boundary': boundary,
+    }
+
+
+def rebuild_aggregates(conn):
+    scan = scan_aggregates(conn)
+    aggregate = PortAggregate.__table__
+    conn.execute(aggregate.delete())
+    conn.execute(aggregate.insert().values(
+        id=AGGREGATE_ID,
+        port_count=scan['port_count'],
+        score_sum=scan['score_sum'],
+        top_polluted=json.dumps(scan['top_polluted']),
+        **_boundary_values(scan['top_boundary']),
+    ))
+    conn.execute(MetricHistogram.__table__.delete())
+    _upsert_histogram(conn, scan['histogram'])
+    return scan
+
+
+def check_aggregates(conn):
+    """Сравнивает хранимые агрегаты с полным сканом, возвращает список расхождений."""
+    scan = scan_aggregates(conn)
+    stored = read_aggregates(conn)
+    problems = []
+    if stored is None:
+        return ['aggregates row is missing']
+    if stored['port_count'] != scan['port_count']:
+        problems.append(f"port_count: stored {stored['port_count']}, actual {scan['port_count']}")
+    if not math.isclose(stored['score_sum'], scan['score_sum'], abs_tol=1e-6):
+        problems.append(f"score_sum: stored {stored['score_sum']}, actual {scan['score_sum']}")
+    actual_histogram = {key: count for key, count in scan['histogram'].items() if count}
+    if stored['histogram'] != actual_histogram:
+        problems.append('histogram mismatch')
+    actual_top = [entry[1] for entry in scan['top_polluted'][:TOP_N]]
+    stored_top = [entry[1] for entry in stored['top_polluted'][:TOP_N]]
+    if stored_top != actual_top:
+        problems.append(f'top_polluted: stored {stored_top}, actual {actual_top}')
+    return problems
+
+
+def read_aggregates(conn):
+    aggregate = PortAggregate.__table__
+    row = conn.execute(select(aggregate).where(aggregate.c.id == AGGREGATE_ID)).mappings().first()
+    if row is None:
+        return None
+    histogram_table = MetricHistogram.__table__
+    histogram = {
+        (metric, bucket): count
+        for metric, bucket, count in conn.execute(
+            select(histogram_table.c.metric, histogram_table.c.bucket, histogram_table.c.count)
+            .where(histogram_table.c.count != 0)
+        )
+    }
+    return {
+        'port_count': row['port_count'],
+        'score_sum': row['score_sum'],
+        'top_polluted': json.loads(row['top_polluted']),
+        'top_boundary': _stored_boundary(row),
+        'histogram': histogram,
+    }
+
+
+def apply_port_changes(conn, delta):
+    aggregate = PortAggregate.__table__
+    # Счетчики - приращением в одном UPDATE, без чтения строки и FOR UPDATE: строку
+    # блокирует сам UPDATE, и куча ниже читается уже под этой блокировкой
+    increment = aggregate.update().where(aggregate.c.id == AGGREGATE_ID).values(
+        port_count=aggregate.c.port_count + delta.count,
+        score_sum=aggregate.c.score_sum + delta.score,
+    )
+    heap_columns = (aggregate.c.port_count, aggregate.c.top_polluted,
+                    aggregate.c.top_boundary, aggregate.c.top_boundary_id)
+    if conn.dialect.update_returning:
+        row = conn.execute(increment.returning(*heap_columns)).mappings().first()
+    else:
+        row = None
+        if conn.execute(increment).rowcount:
+            row = conn.execute(select(*heap_columns).where(aggregate.c.id == AGGREGATE_ID)).mappings().first()
+    if row is None:
+        # Агрегаты еще не построены: flush уже записал изменения, считаем с нуля
+        rebuild_aggregates(conn)
+        return
+
+    stored_heap, stored_boundary = json.loads(row['top_polluted']), _stored_boundary(row)
+    heap, boundary = _apply_heap(stored_heap, stored_boundary, delta)
+    if len(heap) < min(TOP_N, row['port_count']):
+        heap, boundary = _load_heap(conn)
+    if heap != stored_heap or boundary != stored_boundary:
+        # Большинство записей не задевает самые загрязненные порты - тогда куча не пишется
+        conn.execute(aggregate.update().where(aggregate.c.id == AGGREGATE_ID).values(
+            top_polluted=json.dumps(heap), **_boundary_values(boundary)))
+    _upsert_histogram(conn, delta.histogram)
+
+
+def apply_written_ports(conn, inserted=(), updated=()):
+    """Агрегаты для портов, записанных Core-запросами в обход flush (app/ingest.py).
+
+    ``inserted`` - dict со столбцами port, включая id и green_score; ``updated`` -
+    пары (old, new) таких dict. Одна дельта на все строки чанка.
+    """
+    delta = _Delta()
+    for row in inserted:
+        delta.add(row, 1)
+        delta.upserts[row['id']] = (row['green_score'], row['name'])
+    for old, new in updated:
+        if any(old[attr] != new[attr] for attr in PORT_FIELDS):
+            delta.add(old, -1)
+            delta.add(new, 1)
+            delta.upserts[new['id']] = (new['green_score'], new['name'])
+    if delta:
+        apply_port_changes(conn, delta)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _maintain_aggregates(session, flush_context):
+    delta = _collect(session)
+    if delta:
+        apply_port_changes(session.connection(), delta)
+
+
+def trend_values(conn):
+    """Списки значений метрик по портам (поля *_trend в /ports/stats, порядок по id).
+
+    Единственная часть ответа, которая читает таблицу целиком, поэтому только по
+    ?trends=1: четыре столбца, без ORM-объектов и сортировки по score.
+    """
+    port = Port.__table__
+    trends = {key: [] for key in TREND_FIELDS.values()}
+    rows = conn.execute(select(*(port.c[metric] for metric in TREND_FIELDS)).order_by(port.c.id))
+    for row in rows:
+        for metric, key in TREND_FIELDS.items():
+            trends[key].append(row._mapping[metric])
+    return trends
+
+
+def histogram_payload(histogram):
+    payload = {metric: [] for metric in HISTOGRAM_WIDTHS}
+    for (metric, bucket), count in sorted(histogram.items()):
+        if metric not in payload or count <= 0:
+            continue
+        width = HISTOGRAM_WIDTHS[metric]
+        payload[metric].append({
+            'from': bucket * width,
+            'to': (bucket + 1) * width if bucket < HISTOGRAM_BUCKETS - 1 else None,
+            'count': count,
+        })
+    return payload
+
+
+@stats_bp.cli.command('rebuild')
+def rebuild_command():
+    """Пересчитать агрегаты /ports/stats полным сканом."""
+    scan = rebuild_aggregates(db.session.connection())
+    db.session.commit()
+    click.echo(f"Aggregates rebuilt for {scan['port_count']} ports")
+
+
+@stats_bp.cli.command('check')
+def check_command():
+    """Сверить хранимые агрегаты с полным сканом таблицы port."""
+    problems = check_aggregates(db.session.connection())
+    db.session.rollback()
+    if problems:
+        for problem in problems:
+            click.echo(problem, err=True)
+        raise click.ClickException('Aggregates are out of sync, run "flask stats rebuild"')
+    click.echo('Aggregates match the port table')
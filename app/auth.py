@@ -0,0 +1,179 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from flask import current_app, jsonify
+from flask_jwt_extended import create_access_token, get_jwt, get_jwt_identity, verify_jwt_in_request
+from sqlalchemy import event, inspect
+from app import db, bcrypt
+from app.models import User
+
+# Авторизация по роли из подписанного claim токена: админские маршруты не ходят
+# в БД на каждый запрос. Если задан JWT_ROLE_RECHECK_SECONDS, роль периодически
+# сверяется с БД (понижение роли или удаление пользователя вступает в силу за TTL;
+# в процессе, который записал изменение, - сразу: кэш сбрасывается в after_flush).
+
+_role_cache = {}  # user_id -> (роль в БД, monotonic time истечения)
+_role_cache_lock = threading.Lock()
+
+
+def issue_token(user):
+    return create_access_token(identity=str(user.id), additional_claims={'role': user.role})
+
+
+def _current_role(user_id):
+    user = db.session.get(User, int(user_id))
+    return user.role if user is not None else None
+
+
+def forget_role(user_id):
+    """Сбрасывает закэшированную роль (после смены роли или удаления пользователя)."""
+    with _role_cache_lock:
+        _role_cache.pop(str(user_id), None)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _forget_changed_roles(session, flush_context):
+    for obj in session.dirty:
+        if isinstance(obj, User) and inspect(obj).attrs.role.history.has_changes():
+            forget_role(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, User):
+            forget_role(obj.id)
+
+
+def _checked_role(user_id, claimed):
+    ttl = current_app.config.get('JWT_ROLE_RECHECK_SECONDS', 0)
+    if not ttl:
+        return claimed
+    now = time.monotonic()
+    with _role_cache_lock:
+        cached = _role_cache.get(user_id)
+    if cached is not None and cached[1] > now:
+        return cached[0]
+    role = _current_role(user_id)
+    with _role_cache_lock:
+        _role_cache[user_id] = (role, now + ttl)
+    return role
+
+
+def token_role():
+    """Роль владельца токена текущего запроса (после verify_jwt_in_request)."""
+    user_id = get_jwt_identity()
+    claimed = get_jwt().get('role')
+    if claimed is None:
+        # Токены, выданные до появления claim: роль только из БД
+        return _current_role(user_id)
+    role = _checked_role(user_id, claimed)
+    # Повышение роли без нового токена не действует: нужны обе
+    return claimed if role == claimed else None
+
+
+def admin_required():
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            verify_jwt_in_request()
+            if token_role() != 'admin':
+                return jsonify({'error': 'Access denied'}), 403
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# --- Проверка паролей ---
+# bcrypt выполняется в отдельном ограниченном пуле потоков: шторм логинов занимает
+# не больше LOGIN_HASH_WORKERS ядер, лишние попытки сразу получают 503, а остальные
+# запросы API не стоят за хэшированием. После LOGIN_MAX_FAILURES неудач подряд имя
+# пользователя блокируется на LOGIN_LOCKOUT_SECONDS без вычисления bcrypt.
+
+class LoginBusy(Exception):
+    pass
+
+
+class _PasswordState:
+    def __init__(self, app):
+        self.app = app
+        self.lock = threading.Lock()
+        self.executor = None
+        self.slots = threading.BoundedSemaphore(app.config['LOGIN_HASH_MAX_PENDING'])
+        self.failures = {}  # username -> (число неудач, monotonic time первой неудачи)
+
+
+class PasswordChecker:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('BCRYPT_LOG_ROUNDS', 12)
+        app.config.setdefault('LOGIN_HASH_WORKERS', 2)
+        app.config.setdefault('LOGIN_HASH_MAX_PENDING', app.config['LOGIN_HASH_WORKERS'] * 8)
+        app.config.setdefault('LOGIN_HASH_WAIT_SECONDS', 1.0)
+        app.config.setdefault('LOGIN_MAX_FAILURES', 5)
+        app.config.setdefault('LOGIN_LOCKOUT_SECONDS', 300)
+        app.extensions['password_checker'] = _PasswordState(app)
+
+    def _state(self):
+        return current_app.extensions['password_checker']
+
+    def _executor(self, state):
+        with state.lock:
+            if state.executor is None:
+                state.executor = ThreadPoolExecutor(max_workers=state.app.config['LOGIN_HASH_WORKERS'],
+                                                    thread_name_prefix='bcrypt')
+            return state.executor
+
+    def _submit(self, fn, *args):
+        state = self._state()
+        if not state.slots.acquire(timeout=state.app.config['LOGIN_HASH_WAIT_SECONDS']):
+            raise LoginBusy()
+        try:
+            future = self._executor(state).submit(fn, *args)
+        except Exception:
+            state.slots.release()
+            raise
+        future.add_done_callback(lambda f: state.slots.release())
+        return future.result()
+
+    def verify(self, password_hash, password):
+        return self._submit(bcrypt.check_password_hash, password_hash, password)
+
+    def hash(self, password):
+        rounds = current_app.config['BCRYPT_LOG_ROUNDS']
+        return self._submit(bcrypt.generate_password_hash, password, rounds).decode('utf-8')
+
+    def locked_out(self, username):
+        """Секунд до снятия блокировки имени или 0."""
+        state = self._state()
+        config = state.app.config
+        with state.lock:
+            entry = state.failures.get(username)
+            if entry is None:
+                return 0
+            count, since = entry
+            left = since + config['LOGIN_LOCKOUT_SECONDS'] - time.monotonic()
+            if left <= 0:
+                del state.failures[username]
+                return 0
+            return int(left) + 1 if count >= config['LOGIN_MAX_FAILURES'] else 0
+
+    def record_failure(self, username):
+        state = self._state()
+        now = time.monotonic()
+        with state.lock:
+            count, since = state.failures.get(username, (0, now))
+            state.failures[username] = (count + 1, since)
+            if len(state.failures) > 10000:
+                # Подбор по множеству имен: выбрасываем истекшие записи
+                window = state.app.config['LOGIN_LOCKOUT_SECONDS']
+                state.failures = {name: entry for name, entry in state.failures.items()
+                                  if entry[1] + window > now}
+
+    def record_success(self, username):
+        state = self._state()
+        with state.lock:
+            state.failures.pop(username, None)
+
+
+password_checker = PasswordChecker()
@@ -0,0 +1,101 @@
+import functools
+from flask import current_app, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# Настройка движков БД: параметры пула и statement_timeout для PostgreSQL, PRAGMA
+# для SQLite, необязательная реплика для чтения. Модуль не импортирует app, потому
+# что RoutingSession нужна до создания db.
+
+REPLICA_BIND = 'replica'
+
+
+def _is_sqlite(uri):
+    return make_url(uri).get_backend_name() == 'sqlite'
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS из DB_* / SQLITE_* настроек (общие для основной БД и реплики)."""
+    if _is_sqlite(config['SQLALCHEMY_DATABASE_URI']):
+        # Сколько ждать снятия блокировки записи, прежде чем вернуть "database is locked"
+        return {'connect_args': {'timeout': config['SQLITE_BUSY_TIMEOUT']}}
+    options = {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+    if config['DB_STATEMENT_TIMEOUT_MS']:
+        options['connect_args'] = {'options': f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT_MS']}"}
+    return options
+
+
+def configure_engines(app):
+    """Вызывается до db.init_app: явно заданные SQLALCHEMY_* настройки не перезаписываются.
+
+    Значения DB_* / SQLITE_* и их умолчания задает config.py.
+    """
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+    if app.config['SQLALCHEMY_REPLICA_URI']:
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        binds.setdefault(REPLICA_BIND, app.config['SQLALCHEMY_REPLICA_URI'])
+        app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def init_engines(app, db):
+    """После db.init_app: PRAGMA на каждое новое соединение SQLite."""
+    # Схему реплики ведет репликация: create_all/drop_all ее не трогают. Пустая
+    # MetaData бинда к тому же остается в общем db и ломает drop_all приложений без реплики
+    db.metadatas.pop(REPLICA_BIND, None)
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', functools.partial(_sqlite_pragmas, dict(app.config)))
+
+
+def _sqlite_pragmas(config, dbapi_connection, connection_record):
+    # WAL: читатели не ждут писателя; synchronous=NORMAL в WAL не теряет целостность при сбое,
+    # только последние транзакции при отключении питания; mmap читает страницы без копирования
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA journal_mode = {config['SQLITE_JOURNAL_MODE']}")
+        cursor.execute(f"PRAGMA synchronous = {config['SQLITE_SYNCHRONOUS']}")
+        cursor.execute(f"PRAGMA mmap_size = {int(config['SQLITE_MMAP_SIZE'])}")
+    finally:
+        cursor.close()
+
+
+class RoutingSession(Session):
+    """Сессия, отправляющая чтения маршрутов с @read_replica на реплику.
+
+    Flush и DML (INSERT/UPDATE/DELETE) всегда идут в основную БД, как и все
+    запросы вне таких маршрутов или без настроенной реплики.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not getattr(clause, 'is_dml', False) and _replica_request():
+            engine = self._db.engines.get(REPLICA_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _replica_request():
+    # Флаг на функции маршрута, а не в сессии: действует ровно в пределах запроса,
+    # включая потоковый ответ под stream_with_context
+    if not has_request_context() or request.endpoint is None:
+        return False
+    return getattr(current_app.view_functions.get(request.endpoint), 'read_replica', False)
+
+
+def read_replica(view):
+    """Маршрут только читает: его запросы можно обслужить с реплики (возможна задержка репликации)."""
+    view.read_replica = True
+    return view
+
+
+def primary_connection(db):
+    """Соединение с основной БД в текущей транзакции сессии, даже внутри @read_replica."""
+    return db.session.connection(bind_arguments={'bind': db.engine})
@@ -0,0 +1,162 @@
+import csv
+import io
+import sys
+import click
+from flask import Blueprint, current_app
+from app import db
+from app.models import Port, Report, PortMeasurement
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # Колоночные форматы доступны только с pyarrow
+    pyarrow = None
+
+# Потоковая выгрузка таблиц в CSV, Parquet и Arrow IPC. Строки читаются курсором
+# сервера порциями по EXPORT_BATCH_SIZE, каждая порция сразу пишется как блок
+# CSV, row group Parquet или record batch Arrow, поэтому память не зависит от
+# размера таблицы.
+
+EXPORT_BATCH_SIZE = 10000
+EXPORT_DATASETS = {
+    'ports': (Port, ['id', 'name', 'lat', 'lng', 'air_quality', 'water_quality',
+                     'co2_emissions', 'incidents', 'green_score']),
+    'reports': (Report, ['id', 'port_id', 'user_email', 'description', 'timestamp']),
+    'measurements': (PortMeasurement, ['id', 'port_id', 'timestamp', 'air_quality', 'water_quality',
+                                       'co2_emissions', 'incidents']),
+}
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+}
+
+export_bp = Blueprint('export', __name__)
+
+
+class ExportError(ValueError):
+    pass
+
+
+def check_export(dataset, fmt):
+    if dataset not in EXPORT_DATASETS:
+        raise ExportError(f"Unknown dataset, expected one of: {', '.join(EXPORT_DATASETS)}")
+    if fmt not in EXPORT_FORMATS:
+        raise ExportError(f"Unknown format, expected one of: {', '.join(EXPORT_FORMATS)}")
+    if fmt != 'csv' and pyarrow is None:
+        raise ExportError(f'Format {fmt} requires pyarrow to be installed')
+
+
+def iter_row_batches(dataset, batch_size=None):
+    """Списки строк таблицы в порядке id, читаются курсором сервера."""
+    model, names = EXPORT_DATASETS[dataset]
+    batch_size = batch_size or current_app.config.get('EXPORT_BATCH_SIZE', EXPORT_BATCH_SIZE)
+    stmt = (db.select(*(getattr(model, name) for name in names)).order_by(model.id)
+            .execution_options(stream_results=True, yield_per=batch_size))
+    for partition in db.session.execute(stmt).partitions():
+        yield partition
+
+
+def _arrow_schema(dataset):
+    model, names = EXPORT_DATASETS[dataset]
+    types = {db.Integer: pyarrow.int64(), db.Float: pyarrow.float64(),
+             db.DateTime: pyarrow.timestamp('us')}
+    fields = []
+    for name in names:
+        column_type = type(model.__table__.c[name].type)
+        arrow_type = next((value for base, value in types.items() if issubclass(column_type, base)),
+                          pyarrow.string())
+        fields.append(pyarrow.field(name, arrow_type, nullable=model.__table__.c[name].nullable))
+    return pyarrow.schema(fields)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Файлоподобный приемник: накопленные байты забираются после каждой порции."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_export(dataset, fmt, batch_size=None):
+    """Куски выгрузки (str для csv, bytes для колоночных форматов)."""
+    check_export(dataset, fmt)
+    names = EXPORT_DATASETS[dataset][1]
+    batches = iter_row_batches(dataset, batch_size)
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(names)
+        for rows in batches:
+            writer.writerows(rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+        return
+    
+    schema = _arrow_schema(dataset)
+    sink = _ChunkSink()
+    if fmt == 'parquet':
+        writer = pyarrow.parquet.ParquetWriter(sink, schema, compression='zstd')
+    else:
+        writer = pyarrow.ipc.new_stream(sink, schema)
+    try:
+        for rows in batches:
+            columns = list(zip(*rows))
+            writer.write_batch(pyarrow.record_batch(
+                [pyarrow.array(values, type=field.type) for values, field in zip(columns, schema)],
+                schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def _export_command(dataset):
+    @click.option('--format', 'fmt', type=click.Choice(list(EXPORT_FORMATS)), default='csv', show_default=True)
+    @click.option('--output', '-o', type=click.Path(dir_okay=False, allow_dash=True), default='-',
+                  help='Файл выгрузки, "-" - stdout')
+    @click.option('--batch-size', type=int, default=None, help='Строк в порции (по умолчанию EXPORT_BATCH_SIZE)')
+    def command(fmt, output, batch_size):
+        try:
+            check_export(dataset, fmt)
+        except ExportError as e:
+            raise click.ClickException(str(e))
+        binary = fmt != 'csv'
+        if output == '-':
+            stream = sys.stdout.buffer if binary else sys.stdout
+            for chunk in iter_export(dataset, fmt, batch_size):
+                stream.write(chunk)
+            stream.flush()
+            return
+        with open(output, 'wb' if binary else 'w', **({} if binary else {'newline': '', 'encoding': 'utf-8'})) as stream:
+            for chunk in iter_export(dataset, fmt, batch_size):
+                stream.write(chunk)
+        click.echo(f'Exported {dataset} to {output}', err=True)
+    
+    command.__doc__ = f'Выгрузить {dataset} в CSV, Parquet или Arrow IPC.'
+    return export_bp.cli.command(dataset)(command)
+
+
+for _dataset in EXPORT_DATASETS:
+    _export_command(_dataset)
@@ -0,0 +1,219 @@
+import csv
+import io
+import json
+from datetime import datetime
+from itertools import islice
+from marshmallow import ValidationError
+from sqlalchemy import bindparam, select
+from app import db
+from app.aggregates import apply_written_ports
+from app.models import Port
+from app.schemas import PortSchema
+from app.tiles import TILE_FIELDS, invalidate_tiles, tiles_for
+from app.timeseries import METRICS, record_measurements
+
+# Потоковая массовая загрузка метрик: тело запроса читается построчно,
+# строки валидируются и пишутся чанками, каждый чанк - отдельная транзакция.
+# Новые и измененные порты пишутся Core executemany (INSERT и UPDATE) на чанк, а
+# агрегаты, ряды метрик и тайлы обновляются по всему чанку сразу: число запросов
+# не зависит от размера чанка и от того, какие столбцы меняют его строки.
+
+CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/jsonl', 'application/ndjson')
+CSV_MIMETYPES = ('text/csv',)
+
+create_schema = PortSchema()
+update_schema = PortSchema(partial=True)
+# Столбцы, которые UPDATE пишет целиком для каждой обновляемой строки
+UPDATE_COLUMNS = tuple(create_schema.load_fields) + ('green_score', 'grid_cell')
+
+
+def iter_ndjson_rows(stream):
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_no, None, {'_schema': [f'Invalid JSON: {e}']}
+            continue
+        if not isinstance(row, dict):
+            yield line_no, None, {'_schema': ['Each line must be a JSON object']}
+            continue
+        yield line_no, row, None
+
+
+def iter_csv_rows(stream):
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    reader = csv.DictReader(text)
+    for row in reader:
+        # Пустые ячейки означают "не менять" для обновлений
+        row = {key: value for key, value in row.items() if key and value not in (None, '')}
+        # Номер строки файла с учетом заголовка
+        yield reader.line_num, row, None
+
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class IngestResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.chunks = 0  # Записанные чанки (бюджет запросов bulk_ingest_ports)
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, line_no, errors):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line_no, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'error_count': self.error_count,
+            'errors': self.errors,
+            'errors_truncated': self.error_count > len(self.errors),
+        }
+
+
+def _validate(chunk, result):
+    creates, updates = [], []
+    for line_no, row, errors in chunk:
+        if errors:
+            result.add_error(line_no, errors)
+            continue
+        port_id = row.pop('id', None)
+        try:
+            if port_id is None:
+                creates.append((line_no, create_schema.load(row)))
+            else:
+                updates.append((line_no, int(port_id), update_schema.load(row)))
+        except ValidationError as e:
+            result.add_error(line_no, e.messages)
+        except (TypeError, ValueError):
+            result.add_error(line_no, {'id': ['Not a valid integer.']})
+    return creates, updates
+
+
+def _is_alert(air_quality, water_quality):
+    return air_quality > 50 or water_quality > 30
+
+
+def _with_derived(row):
+    # green_score и grid_cell считает before_insert/before_update, но Core-запросы
+    # идут мимо ORM - считаем здесь так же
+    row['green_score'] = Port.calculate_green_score(*(row[metric] for metric in METRICS))
+    row['grid_cell'] = Port.calculate_grid_cell(row['lat'], row['lng'])
+    return row
+
+
+def _insert_ports(conn, creates):
+    """Вставляет новые порты одним executemany, возвращает вставленные строки."""
+    rows = [_with_derived(dict(values)) for _, values in creates]
+    table = Port.__table__
+    # RETURNING всех нужных столбцов: id сопоставлять со строками запроса не нужно
+    returned = conn.execute(
+        table.insert().returning(table.c.id, *(table.c[name] for name in rows[0])), rows
+    ).mappings().all()
+    return [dict(row) for row in returned]
+
+
+def _update_ports(conn, changes):
+    """Обновляет порты одним executemany, возвращает измененные пары (old, new).
+
+    Каждая строка пишется целиком: набор столбцов у всех строк один, и ORM не
+    разбивает пачку на UPDATE по строке, когда строки меняют разные столбцы.
+    """
+    changed = [(old, _with_derived(new)) for old, new in changes]
+    changed = [(old, new) for old, new in changed if old != new]
+    if changed:
+        table = Port.__table__
+        conn.execute(table.update().where(table.c.id == bindparam('port_id')),
+                     [dict({name: new[name] for name in UPDATE_COLUMNS}, port_id=new['id'])
+                      for _, new in changed])
+    return changed
+
+
+def _apply_derived(conn, inserted, updated):
+    """Агрегаты, ряд метрик и тайлы по всему чанку - по запросу на чанк, а не на строку.
+
+    after_flush-обработчики при Core-записи не срабатывают, поэтому все это делается здесь.
+    """
+    apply_written_ports(conn, inserted, updated)
+    now = datetime.utcnow()
+    measured = inserted + [new for old, new in updated
+                           if any(old[metric] != new[metric] for metric in METRICS)]
+    record_measurements(conn, [dict({metric: row[metric] for metric in METRICS},
+                                    port_id=row['id'], timestamp=now) for row in measured])
+    touched = set()
+    for row in inserted:
+        touched.update(tiles_for(row['lat'], row['lng']))
+    for old, new in updated:
+        if any(old[attr] != new[attr] for attr in TILE_FIELDS):
+            touched.update(tiles_for(old['lat'], old['lng']))
+            touched.update(tiles_for(new['lat'], new['lng']))
+    invalidate_tiles(conn, touched)
+
+
+def _write_chunk(creates, updates, result, on_alerts):
+    table = Port.__table__
+    conn = db.session.connection()
+    ids = {port_id for _, port_id, _ in updates}
+    # Один SELECT ... IN на чанк вместо запроса на строку
+    existing = {row['id']: dict(row) for row in
+                conn.execute(select(table).where(table.c.id.in_(ids))).mappings()} if ids else {}
+    changes = {}  # id -> (old, new): несколько строк одного порта сливаются в одну запись
+    written_lines = [line_no for line_no, _ in creates]
+    for line_no, port_id, values in updates:
+        old = existing.get(port_id)
+        if old is None:
+            result.add_error(line_no, {'id': ['Port not found.']})
+            continue
+        changes.setdefault(port_id, (old, dict(old)))[1].update(values)
+        written_lines.append(line_no)
+    try:
+        updated = _update_ports(conn, changes.values())
+        inserted = _insert_ports(conn, creates) if creates else []
+        _apply_derived(conn, inserted, updated)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        for line_no in written_lines:
+            result.add_error(line_no, {'_schema': [f'Write failed: {e}']})
+        return
+    result.created += len(creates)
+    result.updated += len(written_lines) - len(creates)
+    alerts = [{'port_id': row['id'], 'name': row['name']}
+              for row in [new for _, new in changes.values()] + inserted
+              if _is_alert(row['air_quality'], row['water_quality'])]
+    if alerts:
+        on_alerts(alerts)
+    # Освобождаем identity map, чтобы память не росла с размером загрузки
+    db.session.expunge_all()
+
+
+def ingest_rows(rows, on_alerts, chunk_size=CHUNK_SIZE):
+    """Валидирует и записывает поток (line_no, row, errors) чанками.
+
+    Строки с ``id`` обновляют существующий порт (частично), без ``id`` - создают новый.
+    ``on_alerts`` вызывается один раз на чанк со списком превышений
+    (dict с port_id и name порта).
+    """
+    result = IngestResult()
+    for chunk in _chunks(rows, chunk_size):
+        creates, updates = _validate(chunk, result)
+        if creates or updates:
+            result.chunks += 1
+            _write_chunk(creates, updates, result, on_alerts)
+    return result
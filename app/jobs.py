@@ -0,0 +1,303 @@
+import functools
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime, timedelta
+import click
+from flask import Blueprint, current_app
+from sqlalchemy import select, update
+from app import db, report_cache
+from app.metrics import observe_report_parse
+from app.models import Port, ReportJob
+from app.report_parser import extract_report_fields, ReportParseError
+
+# Асинхронный разбор PDF-отчетов. Задания лежат в таблице report_job, диспетчер
+# забирает их атомарным UPDATE и отдает в пул процессов. Незавершенные задания
+# с истекшей арендой возвращаются в очередь, поэтому рестарт ничего не теряет.
+#
+# Диспетчер запускается явно и не зависит от HTTP-запросов:
+# - `flask jobs run` - отдельный процесс, один на хост (Procfile: worker). Пул
+#   разбора - REPORT_WORKERS процессов, обычно по числу ядер;
+# - REPORT_DISPATCHER = 1 - поток-диспетчер в create_app, для однопроцессного
+#   запуска (run.py, gunicorn с одним воркером). С несколькими воркерами каждый
+#   поднял бы свой пул: воркеры x REPORT_WORKERS процессов на хост.
+# Веб-воркеры только ставят задания в очередь; диспетчер другого процесса замечает
+# их за REPORT_JOB_POLL_SECONDS. Пакетная загрузка (app/report_batch.py) разбирает
+# файлы в самом запросе, в пуле воркера на REPORT_BATCH_WORKERS процессов: он
+# создается при первом пакете, итого до gunicorn-воркеры x REPORT_BATCH_WORKERS.
+
+MAX_ATTEMPTS = 3
+
+jobs_bp = Blueprint('jobs', __name__)
+
+
+def job_to_dict(job):
+    return {
+        'id': job.id,
+        'port_id': job.port_id,
+        'filename': job.filename,
+        'status': job.status,
+        'fields': json.loads(job.fields) if job.fields else {},
+        'error': job.error,
+        'attempts': job.attempts,
+        'created_at': job.created_at.isoformat(),
+        'updated_at': job.updated_at.isoformat(),
+    }
+
+
+def complete_job(job, fields, cache_result=True):
+    """Применяет извлеченные поля к порту и закрывает задание (без commit)."""
+    if cache_result and job.content_hash:
+        report_cache.store(job.content_hash, fields)
+    job.updated_at = datetime.utcnow()
+    job.payload = None
+    if not fields:
+        job.status = 'failed'
+        job.error = 'No matching data found in PDF'
+        return
+    port = db.session.get(Port, job.port_id)
+    if port is None:
+        job.status = 'failed'
+        job.error = 'Port not found'
+        return
+    for field, value in fields.items():
+        setattr(port, field, value)
+    job.status = 'done'
+    job.fields = json.dumps(fields)
+
+
+def fail_job(job, error):
+    job.updated_at = datetime.utcnow()
+    job.payload = None
+    job.status = 'failed'
+    job.error = error
+
+
+def _parse_status(future):
+    if future.cancelled():
+        return 'error'
+    error = future.exception()
+    if error is None:
+        return 'done'
+    return 'failed' if isinstance(error, ReportParseError) else 'error'
+
+
+class _InlineExecutor:
+    """Выполняет задачу сразу в текущем потоке (REPORT_JOBS_EAGER)."""
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+def _process_pool(workers):
+    # spawn: fork из многопоточного процесса может унаследовать захваченные блокировки
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+class _RunnerState:
+    def __init__(self, app):
+        self.app = app
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.results = queue.Queue()
+        self.in_flight = set()
+        self.thread = None
+        self.executor = None  # пул диспетчера, REPORT_WORKERS процессов
+        self.batch_executor = None  # пул пакетной загрузки, REPORT_BATCH_WORKERS процессов
+
+
+class ReportJobRunner:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('REPORT_JOBS_EAGER', False)
+        app.config.setdefault('REPORT_DISPATCHER', False)
+        app.config.setdefault('REPORT_WORKERS', os.cpu_count() or 1)
+        app.config.setdefault('REPORT_BATCH_WORKERS', 2)
+        app.config.setdefault('REPORT_JOB_LEASE_SECONDS', 300)
+        app.config.setdefault('REPORT_JOB_POLL_SECONDS', 5)
+        app.config.setdefault('REPORT_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+        app.config.setdefault('REPORT_MAX_BYTES', 50 * 1024 * 1024)
+        app.extensions['report_jobs'] = _RunnerState(app)
+        if app.config['REPORT_DISPATCHER'] and not app.config['REPORT_JOBS_EAGER']:
+            self.start(app)
+
+    def _state(self):
+        return current_app.extensions['report_jobs']
+
+    def start(self, app):
+        """Запускает поток-диспетчер приложения (повторный вызов ничего не делает)."""
+        state = app.extensions['report_jobs']
+        with state.lock:
+            if state.thread is None:
+                state.thread = threading.Thread(target=self._run, args=(state,),
+                                                name='report-jobs', daemon=True)
+                state.thread.start()
+
+    def enqueue(self, port_id, filename, data):
+        digest = report_cache.content_hash(data)
+        cached = report_cache.lookup(digest)
+        job = ReportJob(port_id=port_id, filename=filename, content_hash=digest, status='queued',
+                        payload=None if cached is not None else data)
+        db.session.add(job)
+        if cached is not None:
+            # Тот же файл уже разбирался: применяем сохраненные значения без разбора
+            complete_job(job, cached, cache_result=False)
+            db.session.commit()
+            return job
+        db.session.commit()
+        if current_app.config['REPORT_JOBS_EAGER']:
+            self._process_inline(job)
+        else:
+            # Диспетчер в этом процессе берет задание сразу, иначе - при следующем опросе
+            self._state().wakeup.set()
+        return job
+
+    def _process_inline(self, job):
+        job.status = 'running'
+        job.attempts += 1
+        started = time.perf_counter()
+        try:
+            fields = extract_report_fields(job.payload)
+        except ReportParseError as e:
+            observe_report_parse(time.perf_counter() - started, 'inline', 'failed')
+            fail_job(job, str(e))
+        else:
+            observe_report_parse(time.perf_counter() - started, 'inline', 'done')
+            complete_job(job, fields)
+        db.session.commit()
+
+    # --- Диспетчер ---
+
+    def run(self, app):
+        """Цикл диспетчера в текущем потоке, до остановки процесса (flask jobs run)."""
+        self._run(app.extensions['report_jobs'])
+
+    def _run(self, state):
+        with state.app.app_context():
+            while True:
+                try:
+                    self._drain_results(state)
+                    self._recover_stale(state)
+                    self._claim_jobs(state)
+                except Exception:
+                    state.app.logger.exception('Report job dispatcher iteration failed')
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+                state.wakeup.wait(state.app.config['REPORT_JOB_POLL_SECONDS'])
+                state.wakeup.clear()
+
+    def executor(self):
+        """Пул разбора PDF для пакетной загрузки в запросе (не пул диспетчера)."""
+        if current_app.config['REPORT_JOBS_EAGER']:
+            return _InlineExecutor()
+        state = self._state()
+        with state.lock:
+            if state.batch_executor is None:
+                state.batch_executor = _process_pool(state.app.config['REPORT_BATCH_WORKERS'])
+            return state.batch_executor
+
+    def _executor(self, state):
+        with state.lock:
+            if state.executor is None:
+                state.executor = _process_pool(state.app.config['REPORT_WORKERS'])
+            return state.executor
+
+    def _recover_stale(self, state):
+        now = datetime.utcnow()
+        if state.in_flight:
+            # Продлеваем аренду своих заданий
+            db.session.execute(update(ReportJob).where(ReportJob.id.in_(state.in_flight))
+                               .values(updated_at=now))
+        deadline = now - timedelta(seconds=state.app.config['REPORT_JOB_LEASE_SECONDS'])
+        stale = (ReportJob.status == 'running', ReportJob.updated_at < deadline)
+        db.session.execute(update(ReportJob).where(*stale, ReportJob.attempts >= MAX_ATTEMPTS)
+                           .values(status='failed', error='Worker lost', payload=None, updated_at=now))
+        db.session.execute(update(ReportJob).where(*stale).values(status='queued', updated_at=now))
+        db.session.commit()
+
+    def _claim_jobs(self, state):
+        free = state.app.config['REPORT_WORKERS'] - len(state.in_flight)
+        if free <= 0:
+            return
+        candidates = db.session.execute(
+            select(ReportJob.id).where(ReportJob.status == 'queued').order_by(ReportJob.id).limit(free)
+        ).scalars().all()
+        for job_id in candidates:
+            # Атомарный захват: задание получает только один процесс
+            claimed = db.session.execute(
+                update(ReportJob)
+                .where(ReportJob.id == job_id, ReportJob.status == 'queued')
+                .values(status='running', attempts=ReportJob.attempts + 1, updated_at=datetime.utcnow())
+            ).rowcount
+            db.session.commit()
+            if not claimed:
+                continue
+            payload = db.session.execute(select(ReportJob.payload).where(ReportJob.id == job_id)).scalar()
+            submitted = time.perf_counter()
+            future = self._executor(state).submit(extract_report_fields, payload)
+            state.in_flight.add(job_id)
+            future.add_done_callback(functools.partial(self._parsed, state, job_id, submitted))
+
+    def _parsed(self, state, job_id, started, future):
+        # Время от передачи в пул до результата: заданий в пуле не больше REPORT_WORKERS,
+        # поэтому ожидание в очереди пула почти не входит
+        observe_report_parse(time.perf_counter() - started, 'pool', _parse_status(future))
+        state.results.put((job_id, future))
+        state.wakeup.set()
+
+    def _drain_results(self, state):
+        while True:
+            try:
+                job_id, future = state.results.get_nowait()
+            except queue.Empty:
+                return
+            state.in_flight.discard(job_id)
+            job = db.session.get(ReportJob, job_id)
+            if job is None or job.status != 'running':
+                continue
+            try:
+                fields = future.result()
+            except ReportParseError as e:
+                fail_job(job, str(e))
+            except Exception as e:
+                # Падение процесса пула: повторяем, пока есть попытки
+                if job.attempts < MAX_ATTEMPTS:
+                    job.status = 'queued'
+                    job.updated_at = datetime.utcnow()
+                else:
+                    fail_job(job, f'Worker error: {e}')
+                if state.executor is not None and getattr(state.executor, '_broken', False):
+                    state.executor = None
+            else:
+                complete_job(job, fields)
+            try:
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                state.app.logger.exception('Failed to store result of report job %s', job_id)
+
+
+report_jobs = ReportJobRunner()
+
+
+@jobs_bp.cli.command('run')
+def run_command():
+    """Диспетчер разбора PDF-отчетов (один процесс на хост)."""
+    app = current_app._get_current_object()
+    if app.config['REPORT_JOBS_EAGER']:
+        raise click.ClickException('REPORT_JOBS_EAGER is set: reports are parsed inline, nothing to dispatch')
+    click.echo(f"Report job dispatcher: {app.config['REPORT_WORKERS']} parser processes")
+    report_jobs.run(app)
@@ -0,0 +1,312 @@
+import cProfile
+import io
+import math
+import pstats
+import threading
+import time
+from flask import Blueprint, Response, current_app, g, has_app_context, has_request_context, jsonify, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt.exceptions import PyJWTError
+from sqlalchemy import event
+from app import db
+from app.auth import token_role
+from app.notifications import notifications
+
+try:
+    import pyinstrument
+except ImportError:  # METRICS_PROFILER = 'pyinstrument' требует pyinstrument
+    pyinstrument = None
+
+# Метрики процесса в текстовом формате Prometheus: латентность и число SQL-запросов
+# по маршрутам, время разбора PDF, счетчики рассылки. Значения живут в памяти
+# процесса, поэтому каждый gunicorn-воркер отдает на /metrics свои - при нескольких
+# воркерах их нужно опрашивать по отдельности или суммировать в Prometheus.
+# ?profile=1 (только администратор) возвращает вместо ответа профиль запроса.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+PARSE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PROFILERS = ('cprofile', 'pyinstrument')
+UNMATCHED = 'unmatched'  # 404 без маршрута: не плодим метки по произвольным URL
+BACKGROUND = 'background'  # запросы к БД вне HTTP-запроса (диспетчеры, CLI)
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self.lock:
+            values = sorted(self.values.items())
+            lines.extend(self._samples(values))
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, value=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def get(self, **labels):
+        with self.lock:
+            return self.values.get(self._key(labels), 0)
+
+    def _samples(self, values):
+        for key, value in values:
+            yield f'{self.name}{_labels(list(zip(self.labels, key)))} {_number(value)}'
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                # Счетчики по верхним границам (не накопленные), сумма, количество
+                series = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels):
+        with self.lock:
+            series = self.values.get(self._key(labels))
+            return series[2] if series else 0
+
+    def _samples(self, values):
+        for key, (counts, total, count) in values:
+            pairs = list(zip(self.labels, key))
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                yield f'{self.name}_bucket{_labels(pairs + [("le", _number(float(bound)))])} {cumulative}'
+            yield f'{self.name}_bucket{_labels(pairs + [("le", "+Inf")])} {count}'
+            yield f'{self.name}_sum{_labels(pairs)} {_number(total)}'
+            yield f'{self.name}_count{_labels(pairs)} {count}'
+
+
+REQUESTS = Counter('http_requests_total', 'HTTP requests by endpoint, method and status.',
+                   ('endpoint', 'method', 'status'))
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'HTTP request latency by endpoint.',
+                            ('endpoint', 'method'))
+REQUEST_QUERIES = Histogram('http_request_queries', 'SQL statements per HTTP request.',
+                            ('endpoint',), buckets=QUERY_BUCKETS)
+DB_QUERIES = Counter('db_queries_total', 'SQL statements executed, by endpoint.', ('endpoint',))
+DB_QUERY_TIME = Counter('db_query_seconds_total', 'Time spent in SQL statements, by endpoint.', ('endpoint',))
+REPORT_PARSE = Histogram('report_parse_duration_seconds', 'PDF report parse time of upload_report jobs.',
+                         ('mode', 'status'), buckets=PARSE_BUCKETS)
+REGISTRY = (REQUESTS, REQUEST_LATENCY, REQUEST_QUERIES, DB_QUERIES, DB_QUERY_TIME, REPORT_PARSE)
+
+
+def observe_report_parse(seconds, mode, status):
+    """Время разбора одного PDF: mode - inline/pool, status - done/failed/error."""
+    REPORT_PARSE.observe(seconds, mode=mode, status=status)
+
+
+def _endpoint():
+    if not has_request_context():
+        return BACKGROUND
+    return request.endpoint or UNMATCHED
+
+
+def _notification_metrics():
+    # Счетчики диспетчера уже накопительные: на каждый опрос снимаем их заново
+    stats = notifications.stats()
+    sent = Counter('notifications_total', 'Notification dispatcher events (sent/failed count recipients).',
+                   ('event',))
+    for event_name in ('enqueued', 'collapsed', 'dropped', 'sent', 'failed', 'batches', 'retries'):
+        sent.inc(stats[event_name], event=event_name)
+    depth = Gauge('notification_queue_depth', 'Alerts waiting in the notification queue.')
+    depth.set(stats['queue_depth'])
+    return sent, depth
+
+
+def render_metrics():
+    lines = []
+    for metric in REGISTRY + _notification_metrics():
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    token = current_app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return jsonify({'error': 'Access denied'}), 403
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+class _RequestMetrics:
+    __slots__ = ('started', 'queries', 'query_time', 'status', 'profiler')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.query_time = 0.0
+        self.status = None
+        self.profiler = None
+
+
+class Metrics:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('METRICS_TOKEN', None)  # Bearer-токен для /metrics; None - без проверки
+        app.config.setdefault('METRICS_PROFILER', 'cprofile')
+        app.config.setdefault('METRICS_PROFILE_ROWS', 40)
+        if not app.config['METRICS_ENABLED']:
+            return
+        if app.config['METRICS_PROFILER'] not in PROFILERS:
+            raise RuntimeError(f"METRICS_PROFILER must be one of: {', '.join(PROFILERS)}")
+        if app.config['METRICS_PROFILER'] == 'pyinstrument' and pyinstrument is None:
+            raise RuntimeError('METRICS_PROFILER = pyinstrument requires pyinstrument to be installed')
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.register_blueprint(metrics_bp)
+        with app.app_context():
+            for engine in db.engines.values():
+                event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+                event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    def _before_request(self):
+        g.request_metrics = state = _RequestMetrics()
+        # Только значение 1: ?profile=<имя> у /api/ports/score - профиль весов, а не профилировщик
+        if request.args.get('profile') != '1' or not _is_admin():
+            return
+        if current_app.config['METRICS_PROFILER'] == 'pyinstrument':
+            state.profiler = pyinstrument.Profiler()
+            state.profiler.start()
+        else:
+            state.profiler = cProfile.Profile()
+            state.profiler.enable()
+
+    def _after_request(self, response):
+        state = g.get('request_metrics')
+        if state is None:
+            return response
+        state.status = response.status_code
+        if state.profiler is not None:
+            response = _profile_response(state, response)
+        return response
+
+    def _teardown_request(self, error=None):
+        # teardown, а не after_request: потоковый ответ под stream_with_context
+        # досчитывается до конца вместе со своими запросами к БД. Контекст приложения
+        # может быть уже снят (test client закрывает сохраненный запрос последним)
+        state = g.pop('request_metrics', None) if has_app_context() else None
+        if state is None:
+            return
+        if state.profiler is not None:
+            _stop_profiler(state)
+        endpoint = request.endpoint or UNMATCHED
+        status = state.status if state.status is not None else 500
+        REQUESTS.inc(endpoint=endpoint, method=request.method, status=status)
+        REQUEST_LATENCY.observe(time.perf_counter() - state.started, endpoint=endpoint, method=request.method)
+        REQUEST_QUERIES.observe(state.queries, endpoint=endpoint)
+
+
+def _is_admin():
+    try:
+        verify_jwt_in_request(optional=True)
+    except (JWTExtendedException, PyJWTError):
+        return False
+    return get_jwt_identity() is not None and token_role() == 'admin'
+
+
+def _stop_profiler(state):
+    profiler, state.profiler = state.profiler, None
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+    else:
+        profiler.stop()
+    return profiler
+
+
+def _profile_response(state, response):
+    # Потоковое тело к этому моменту не сгенерировано и в профиль не попадает
+    profiler = _stop_profiler(state)
+    headers = {'X-Profiled-Status': str(response.status_code),
+               'X-Profiled-Queries': str(state.queries),
+               'X-Profiled-Query-Seconds': f'{state.query_time:.6f}'}
+    if isinstance(profiler, cProfile.Profile):
+        out = io.StringIO()
+        stats = pstats.Stats(profiler, stream=out)
+        stats.sort_stats('cumulative').print_stats(current_app.config['METRICS_PROFILE_ROWS'])
+        return Response(out.getvalue(), mimetype='text/plain', headers=headers)
+    return Response(profiler.output_html(), mimetype='text/html', headers=headers)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_metrics_started', None)
+    elapsed = time.perf_counter() - started if started is not None else 0.0
+    endpoint = _endpoint()
+    DB_QUERIES.inc(endpoint=endpoint)
+    DB_QUERY_TIME.inc(elapsed, endpoint=endpoint)
+    if endpoint != BACKGROUND:
+        state = g.get('request_metrics')
+        if state is not None:
+            state.queries += 1
+            state.query_time += elapsed
+
+
+metrics = Metrics()
@@ -1,6 +1,19 @@
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import event, inspect
 from app import db, bcrypt
 
 
+def committed_value(obj, attr):
+    """Значение атрибута до текущего flush (для after_flush-обработчиков)."""
+    history = inspect(obj).attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return getattr(obj, attr)
+
+
 class User(db.Model):  
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(150), unique=True, nullable=False)
@@ -8,12 +21,30 @@ class User(db.Model):
     role = db.Column(db.String(50), nullable=False, default='user')  # 'admin' or 'user'
     
     def set_password(self, password):
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        rounds = current_app.config.get('BCRYPT_LOG_ROUNDS')
+        self.password_hash = bcrypt.generate_password_hash(password, rounds).decode('utf-8')
     
     def check_password(self, password):
         return bcrypt.check_password_hash(self.password_hash, password)
+    
+    def needs_rehash(self, rounds):
+        # Хэш вида $2b$12$...: cost-фактор - третье поле
+        try:
+            return int(self.password_hash.split('$')[2]) != rounds
+        except (IndexError, ValueError):
+            return True
 
 class Port(db.Model):
+    # Составные индексы (метрика, id) для keyset-пагинации по каждому ключу сортировки
+    __table_args__ = (
+        db.Index('ix_port_air_quality_id', 'air_quality', 'id'),
+        db.Index('ix_port_water_quality_id', 'water_quality', 'id'),
+        db.Index('ix_port_co2_emissions_id', 'co2_emissions', 'id'),
+        db.Index('ix_port_incidents_id', 'incidents', 'id'),
+        # Пространственный поиск: диапазоны ячеек сетки, координаты читаются из индекса
+        db.Index('ix_port_grid_cell', 'grid_cell', 'lat', 'lng'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False, index=True)
     lat = db.Column(db.Float, nullable=False)
@@ -22,22 +53,178 @@ class Port(db.Model):
     water_quality = db.Column(db.Float, nullable=False)
     co2_emissions = db.Column(db.Float, nullable=False)
     incidents = db.Column(db.Integer, nullable=False, default=0)
-    subscribers = db.Column(db.Text, default='')  # Emails через запятую
+    # Хранимый green_score: пересчитывается при каждом insert/update, индекс нужен для sort/min_score
+    green_score = db.Column(db.Float, nullable=False, default=0.0, index=True)
+    # Номер ячейки сетки GRID_CELL_DEG x GRID_CELL_DEG (app/spatial.py), пересчитывается вместе с green_score
+    grid_cell = db.Column(db.Integer)
     
-    @property
-    def green_score(self):
+    @staticmethod
+    def calculate_green_score(air_quality, water_quality, co2_emissions, incidents):
         # Нормализация: 0-100, где 100 - идеально
-        score = (
-            (1 - min(self.air_quality / 50, 1)) * 25 +
-            (1 - min(self.water_quality / 30, 1)) * 25 +
-            (1 - min(self.co2_emissions / 1000, 1)) * 25 +
-            (1 - min(self.incidents / 5, 1)) * 25
-        )
+        values = (air_quality, water_quality, co2_emissions, incidents)
+        score = 0.0
+        for value, (_, weight, threshold) in zip(values, GREEN_SCORE_PROFILE):
+            score += (1 - min(value / threshold, 1)) * weight
         return round(score, 2)
+    
+    def refresh_green_score(self):
+        self.green_score = Port.calculate_green_score(
+            self.air_quality, self.water_quality, self.co2_emissions, self.incidents or 0
+        )
+    
+    @staticmethod
+    def calculate_grid_cell(lat, lng):
+        # Строка ячейки по широте, столбец по долготе; ячейки одной строки идут подряд
+        row = min(int((lat + 90) // GRID_CELL_DEG), GRID_ROWS - 1)
+        col = min(int((lng + 180) // GRID_CELL_DEG), GRID_COLS - 1)
+        return row * GRID_COLS + col
+
+# Профиль хранимого green_score: (метрика, вес, порог полного "штрафа"); app/scoring.py
+# считает по нему и по профилям из scoring_profile
+GREEN_SCORE_PROFILE = (
+    ('air_quality', 25, 50),
+    ('water_quality', 25, 30),
+    ('co2_emissions', 25, 1000),
+    ('incidents', 25, 5),
+)
+
+# Сетка для пространственного индекса: 0.25 градуса (~28 км по широте)
+GRID_CELL_DEG = 0.25
+GRID_ROWS = int(180 / GRID_CELL_DEG)
+GRID_COLS = int(360 / GRID_CELL_DEG)
+
+@event.listens_for(Port, 'before_insert')
+@event.listens_for(Port, 'before_update')
+def _refresh_green_score(mapper, connection, target):
+    # Покрывает create_port, update_port, upload_report и seed
+    target.refresh_green_score()
+    target.grid_cell = Port.calculate_grid_cell(target.lat, target.lng)
+
+class Subscription(db.Model):
+    # Подписчики порта на тревоги: уникальность (port_id, email) проверяет индекс
+    __table_args__ = (
+        db.UniqueConstraint('port_id', 'email', name='uq_subscription_port_email'),
+        db.Index('ix_subscription_port_id_id', 'port_id', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    port_id = db.Column(db.Integer, db.ForeignKey('port.id', ondelete='CASCADE'), nullable=False)
+    email = db.Column(db.String(254), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
 class Report(db.Model):
+    # Лента отчетов от новых к старым: keyset по (timestamp, id), в т.ч. в пределах порта
+    __table_args__ = (
+        db.Index('ix_report_timestamp_id', 'timestamp', 'id'),
+        db.Index('ix_report_port_id_timestamp_id', 'port_id', 'timestamp', 'id'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     port_id = db.Column(db.Integer, db.ForeignKey('port.id'), nullable=False)
     user_email = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text, nullable=False)
-    timestamp = db.Column(db.DateTime, default=db.func.current_timestamp())
\ No newline at end of file
+    timestamp = db.Column(db.DateTime, default=db.func.current_timestamp())
+class PortAggregate(db.Model):
+    # Одна строка (id=1) с агрегатами для /ports/stats, обновляется при каждой записи портов
+    id = db.Column(db.Integer, primary_key=True)
+    port_count = db.Column(db.Integer, nullable=False, default=0)
+    score_sum = db.Column(db.Float, nullable=False, default=0.0)
+    top_polluted = db.Column(db.Text, nullable=False, default='[]')  # JSON: [[score, id, name], ...]
+    # Все порты вне top_polluted идут не раньше (top_boundary, top_boundary_id) в порядке (green_score, id)
+    top_boundary = db.Column(db.Float)
+    top_boundary_id = db.Column(db.Integer)
+
+class MetricHistogram(db.Model):
+    metric = db.Column(db.String(32), primary_key=True)
+    bucket = db.Column(db.Integer, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class PortMeasurement(db.Model):
+    # Append-only ряд значений метрик: строка на каждую запись порта
+    __table_args__ = (
+        db.Index('ix_port_measurement_port_id_timestamp', 'port_id', 'timestamp'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    port_id = db.Column(db.Integer, db.ForeignKey('port.id', ondelete='CASCADE'), nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False)
+    air_quality = db.Column(db.Float, nullable=False)
+    water_quality = db.Column(db.Float, nullable=False)
+    co2_emissions = db.Column(db.Float, nullable=False)
+    incidents = db.Column(db.Integer, nullable=False)
+
+class PortMeasurementRollup(db.Model):
+    # Часовые и суточные свертки PortMeasurement (resolution = 'hour' | 'day')
+    port_id = db.Column(db.Integer, db.ForeignKey('port.id', ondelete='CASCADE'), primary_key=True)
+    resolution = db.Column(db.String(8), primary_key=True)
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+    samples = db.Column(db.Integer, nullable=False, default=0)
+    air_quality_sum = db.Column(db.Float, nullable=False, default=0.0)
+    air_quality_min = db.Column(db.Float, nullable=False)
+    air_quality_max = db.Column(db.Float, nullable=False)
+    water_quality_sum = db.Column(db.Float, nullable=False, default=0.0)
+    water_quality_min = db.Column(db.Float, nullable=False)
+    water_quality_max = db.Column(db.Float, nullable=False)
+    co2_emissions_sum = db.Column(db.Float, nullable=False, default=0.0)
+    co2_emissions_min = db.Column(db.Float, nullable=False)
+    co2_emissions_max = db.Column(db.Float, nullable=False)
+    incidents_sum = db.Column(db.Float, nullable=False, default=0.0)
+    incidents_min = db.Column(db.Float, nullable=False)
+    incidents_max = db.Column(db.Float, nullable=False)
+
+class ReportJob(db.Model):
+    # Очередь разбора PDF-отчетов в БД: переживает рестарт воркеров без внешнего брокера
+    __table_args__ = (
+        db.Index('ix_report_job_status_id', 'status', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    port_id = db.Column(db.Integer, db.ForeignKey('port.id', ondelete='CASCADE'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    status = db.Column(db.String(16), nullable=False, default='queued')  # queued | running | done | failed
+    payload = db.Column(db.LargeBinary)  # Байты PDF, очищаются после обработки
+    content_hash = db.Column(db.String(64))  # SHA-256 PDF, ключ ParsedReportCache
+    fields = db.Column(db.Text)  # JSON извлеченных значений
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class ParsedReportCache(db.Model):
+    # Кэш извлеченных из PDF значений по SHA-256 содержимого, LRU по last_used_at
+    __table_args__ = (
+        db.UniqueConstraint('content_hash', 'parser_version', name='uq_parsed_report_cache_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    content_hash = db.Column(db.String(64), nullable=False)
+    parser_version = db.Column(db.String(16), nullable=False)
+    fields = db.Column(db.Text, nullable=False)  # JSON
+    size_bytes = db.Column(db.Integer, nullable=False, default=0)  # content_hash + fields, для REPORT_CACHE_MAX_BYTES
+    hits = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+class MapTile(db.Model):
+    # Кэш кластеризованных тайлов карты (GeoJSON); сбрасывается по затронутым портами тайлам
+    z = db.Column(db.Integer, primary_key=True)
+    x = db.Column(db.Integer, primary_key=True)
+    y = db.Column(db.Integer, primary_key=True)
+    format_version = db.Column(db.String(16), nullable=False)
+    generation = db.Column(db.Integer, nullable=False)  # Растет при каждом сбросе тайла записью порта
+    body = db.Column(db.Text)  # NULL - тайл сброшен, строка хранит только generation
+    built_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class MapTileState(db.Model):
+    # Одна строка (id=1): эпоха полного сброса кэша тайлов, новый тайл сохраняется только в той же эпохе
+    id = db.Column(db.Integer, primary_key=True)
+    generation = db.Column(db.Integer, nullable=False, default=0)
+
+class ScoringProfile(db.Model):
+    # Именованный профиль весов и порогов для сценариев POST /api/ports/score
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), unique=True, nullable=False)
+    description = db.Column(db.Text, nullable=False, default='')
+    weights = db.Column(db.Text, nullable=False)  # JSON: {metric: weight}
+    thresholds = db.Column(db.Text, nullable=False)  # JSON: {metric: threshold}
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,210 @@
+import queue
+import threading
+import time
+from flask import current_app
+from flask_mail import Message
+from app import db, mail
+from app.subscriptions import iter_subscriber_batches
+
+# Фоновая рассылка уведомлений: ограниченная очередь, фиксированный пул потоков,
+# переиспользуемое SMTP-соединение, отправка получателей пачками (BCC) и
+# схлопывание повторных тревог по одному порту в пределах окна. Подписчиков порта
+# поток читает из таблицы subscription чанками, весь список в памяти не держится.
+
+
+class _DispatcherState:
+    def __init__(self, app):
+        self.app = app
+        self.queue = queue.Queue(maxsize=app.config['MAIL_QUEUE_SIZE'])
+        self.lock = threading.Lock()
+        self.workers = []
+        # port_id -> monotonic time последней принятой тревоги, по возрастанию времени
+        self.last_alert = {}
+        self.counters = {
+            'enqueued': 0, 'collapsed': 0, 'dropped': 0,
+            'sent': 0, 'failed': 0, 'batches': 0, 'retries': 0,
+        }
+        self.latency_sum = 0.0
+        self.latency_count = 0
+        self.latency_max = 0.0
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def observe_latency(self, seconds):
+        with self.lock:
+            self.latency_sum += seconds
+            self.latency_count += 1
+            self.latency_max = max(self.latency_max, seconds)
+
+
+def _prune_alerts(last_alert, cutoff):
+    # Самые старые записи идут первыми: удаляем истекшие до первой живой
+    expired = []
+    for port_id, accepted_at in last_alert.items():
+        if accepted_at >= cutoff:
+            break
+        expired.append(port_id)
+    for port_id in expired:
+        del last_alert[port_id]
+
+
+class NotificationDispatcher:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('MAIL_DEFAULT_SENDER', 'noreply@ecoports.com')
+        app.config.setdefault('MAIL_DISPATCH_WORKERS', 2)
+        app.config.setdefault('MAIL_QUEUE_SIZE', 1000)
+        app.config.setdefault('MAIL_BATCH_SIZE', 50)
+        app.config.setdefault('MAIL_DEDUP_SECONDS', 300)
+        app.config.setdefault('MAIL_MAX_RETRIES', 3)
+        app.config.setdefault('MAIL_RETRY_BACKOFF', 0.5)
+        app.config.setdefault('MAIL_ENQUEUE_TIMEOUT', 0.5)
+        app.config.setdefault('MAIL_IDLE_SECONDS', 30)
+        app.extensions['notifications'] = _DispatcherState(app)
+
+    def _state(self):
+        return current_app.extensions['notifications']
+
+    def _ensure_workers(self, state):
+        if state.workers:
+            return
+        with state.lock:
+            if state.workers:
+                return
+            for number in range(state.app.config['MAIL_DISPATCH_WORKERS']):
+                worker = threading.Thread(target=self._work, args=(state,),
+                                          name=f'notifications-{number}', daemon=True)
+                worker.start()
+                state.workers.append(worker)
+
+    def notify(self, port_id, subject, body, recipients=None):
+        """Ставит тревогу в очередь. Возвращает False, если она схлопнута или отброшена.
+
+        Без ``recipients`` письмо уходит подписчикам порта. Принимает только простые
+        данные: ORM-объекты в поток не передаются.
+        """
+        if recipients is not None and not recipients:
+            return False
+        state = self._state()
+        now = time.monotonic()
+        window = state.app.config['MAIL_DEDUP_SECONDS']
+        with state.lock:
+            last = state.last_alert.get(port_id)
+            if last is not None and now - last < window:
+                state.counters['collapsed'] += 1
+                return False
+            _prune_alerts(state.last_alert, now - window)
+            # pop перед вставкой держит словарь упорядоченным по времени
+            state.last_alert.pop(port_id, None)
+            state.last_alert[port_id] = now
+        self._ensure_workers(state)
+        item = {'port_id': port_id, 'subject': subject,
+                'recipients': list(recipients) if recipients is not None else None,
+                'body': body, 'enqueued_at': now}
+        try:
+            # Back-pressure: при полной очереди ждем недолго, затем отбрасываем
+            state.queue.put(item, timeout=state.app.config['MAIL_ENQUEUE_TIMEOUT'])
+        except queue.Full:
+            with state.lock:
+                state.counters['dropped'] += 1
+                state.last_alert.pop(port_id, None)
+            state.app.logger.warning('Notification queue is full, alert for port %s dropped', port_id)
+            return False
+        state.count('enqueued')
+        return True
+
+    def drain(self, timeout=10):
+        """Ждет, пока очередь опустеет (тесты, остановка). True - успели."""
+        state = self._state()
+        deadline = time.monotonic() + timeout
+        while state.queue.unfinished_tasks:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def stats(self):
+        state = self._state()
+        with state.lock:
+            stats = dict(state.counters)
+            count = state.latency_count
+            stats['avg_latency_ms'] = round(state.latency_sum / count * 1000, 2) if count else 0.0
+            stats['max_latency_ms'] = round(state.latency_max * 1000, 2)
+        stats['queue_depth'] = state.queue.qsize()
+        stats['queue_capacity'] = state.queue.maxsize
+        stats['workers'] = len(state.workers)
+        return stats
+
+    # --- Потоки-отправители ---
+
+    def _work(self, state):
+        config = state.app.config
+        with state.app.app_context():
+            connection = None
+            while True:
+                try:
+                    item = state.queue.get(timeout=config['MAIL_IDLE_SECONDS'])
+                except queue.Empty:
+                    connection = self._close(connection)
+                    continue
+                try:
+                    connection = self._deliver(state, connection, item)
+                except Exception:
+                    state.app.logger.exception('Notification delivery failed')
+                    connection = self._close(connection)
+                finally:
+                    db.session.remove()
+                    state.queue.task_done()
+
+    def _connect(self):
+        connection = mail.connect()
+        connection.__enter__()
+        return connection
+
+    def _close(self, connection):
+        if connection is not None:
+            try:
+                connection.__exit__(None, None, None)
+            except Exception:
+                pass
+        return None
+
+    def _batches(self, item, size):
+        recipients = item['recipients']
+        if recipients is None:
+            return iter_subscriber_batches(item['port_id'], size)
+        return (recipients[start:start + size] for start in range(0, len(recipients), size))
+
+    def _deliver(self, state, connection, item):
+        config = state.app.config
+        size = config['MAIL_BATCH_SIZE']
+        for batch in self._batches(item, size):
+            message = Message(item['subject'], sender=config['MAIL_DEFAULT_SENDER'], bcc=batch)
+            message.body = item['body']
+            for attempt in range(config['MAIL_MAX_RETRIES'] + 1):
+                try:
+                    if connection is None:
+                        connection = self._connect()
+                    connection.send(message)
+                except Exception:
+                    connection = self._close(connection)
+                    if attempt == config['MAIL_MAX_RETRIES']:
+                        state.count('failed', len(batch))
+                        state.app.logger.exception('Failed to send alert for port %s', item['port_id'])
+                        break
+                    state.count('retries')
+                    time.sleep(config['MAIL_RETRY_BACKOFF'] * 2 ** attempt)
+                else:
+                    state.count('sent', len(batch))
+                    state.count('batches')
+                    break
+        state.observe_latency(time.monotonic() - item['enqueued_at'])
+        return connection
+
+
+notifications = NotificationDispatcher()
@@ -0,0 +1,43 @@
+import base64
+import json
+from sqlalchemy import tuple_
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(payload):
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        raise InvalidCursor('Invalid cursor')
+
+
+def keyset_page(query, column, id_column, per_page, after=None, descending=False):
+    """Одна страница keyset-пагинации по (column, id).
+
+    Вместо OFFSET выполняется seek по индексу, поэтому глубокие страницы
+    стоят столько же, сколько первая. ``after`` - пара (value, id) последней
+    строки предыдущей страницы. Возвращает (items, last_key_or_None).
+    """
+    key = tuple_(column, id_column)
+    if after is not None:
+        query = query.filter(key < tuple(after) if descending else key > tuple(after))
+    if descending:
+        query = query.order_by(column.desc(), id_column.desc())
+    else:
+        query = query.order_by(column.asc(), id_column.asc())
+    # Лишняя строка показывает, есть ли следующая страница, без COUNT
+    items = query.limit(per_page + 1).all()
+    if len(items) <= per_page:
+        return items, None
+    items = items[:per_page]
+    last = items[-1]
+    return items, (getattr(last, column.key), getattr(last, id_column.key))
@@ -0,0 +1,146 @@
+import contextvars
+from collections import Counter
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from app import db
+
+# Бюджет SQL-запросов: каждый маршрут объявляет @query_budget(n), и запрос, сделавший
+# больше n запросов к БД, в тестах падает (QUERY_BUDGET_MODE = 'raise'), а в
+# продакшене при 'warn' (по умолчанию) пишет предупреждение в лог. Считаются запросы
+# текущего потока/контекста, так что фоновые диспетчеры в чужой бюджет не попадают.
+# Маршруты, работа которых растет с телом запроса (чанки загрузки, файлы пакета),
+# объявляют еще бюджет на единицу работы и сообщают число единиц через budget_items().
+
+MODES = ('off', 'warn', 'raise')
+REPORT_STATEMENTS = 5  # сколько самых частых запросов показать в сообщении о превышении
+
+_active = contextvars.ContextVar('query_budget_counters', default=())
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryCounter:
+    """Считает SQL-запросы внутри ``with`` (вложенные счетчики считают независимо)."""
+
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+    def __enter__(self):
+        _active.set(_active.get() + (self,))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _active.set(tuple(counter for counter in _active.get() if counter is not self))
+        return False
+
+    def most_common(self, n=REPORT_STATEMENTS):
+        return Counter(self.statements).most_common(n)
+
+
+class QueryBudget(QueryCounter):
+    """``with QueryBudget(3, 'get_port'):`` - не больше 3 запросов, иначе warn/raise.
+
+    ``per_item`` - сколько запросов добавляет к лимиту каждая единица из add_items().
+    """
+
+    def __init__(self, limit, label=None, mode='raise', per_item=0):
+        if mode not in MODES:
+            raise ValueError(f"Query budget mode must be one of: {', '.join(MODES)}")
+        super().__init__()
+        self.limit = limit
+        self.label = label
+        self.mode = mode
+        self.per_item = per_item
+
+    def add_items(self, count):
+        self.limit += self.per_item * count
+
+    def __exit__(self, exc_type, exc, tb):
+        super().__exit__(exc_type, exc, tb)
+        if exc_type is None:
+            self.check()
+        return False
+
+    def check(self):
+        if self.mode == 'off' or self.count <= self.limit:
+            return
+        # Повторяющийся запрос в начале списка - обычно и есть N+1
+        repeated = '\n'.join(f'  {times} x {statement}' for statement, times in self.most_common())
+        message = f'{self.label or "Block"} ran {self.count} SQL statements, budget is {self.limit}:\n{repeated}'
+        if self.mode == 'raise':
+            raise QueryBudgetExceeded(message)
+        current_app.logger.warning(message)
+
+
+def query_budget(limit, per_item=0):
+    """Максимум SQL-запросов маршрута (вместе с проверкой роли и commit).
+
+    ``per_item`` - запросов на единицу работы (чанк, файл): маршрут сообщает число
+    единиц через budget_items(), и лимит становится limit + per_item * единиц.
+    Объявить бюджет обязан каждый маршрут /api.
+    """
+    def decorator(view):
+        view.query_budget = limit
+        view.query_budget_per_item = per_item
+        return view
+    return decorator
+
+
+def budget_items(count):
+    """Добавляет count единиц работы к бюджету текущего запроса (вне запроса ничего не делает)."""
+    budget = g.get('query_budget') if has_request_context() else None
+    if budget is not None:
+        budget.add_items(count)
+
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    for counter in _active.get():
+        counter.count += 1
+        counter.statements.append(statement)
+
+
+class QueryBudgetGuard:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('QUERY_BUDGET_MODE', 'warn')
+        if app.config['QUERY_BUDGET_MODE'] not in MODES:
+            raise RuntimeError(f"QUERY_BUDGET_MODE must be one of: {', '.join(MODES)}")
+        # Слушатель нужен и при 'off': на нем работают QueryCounter/QueryBudget в тестах
+        with app.app_context():
+            for engine in db.engines.values():
+                event.listen(engine, 'before_cursor_execute', _count_statement)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def _before_request(self):
+        mode = current_app.config['QUERY_BUDGET_MODE']
+        view = current_app.view_functions.get(request.endpoint)
+        limit = getattr(view, 'query_budget', None)
+        if mode == 'off' or limit is None:
+            return
+        g.query_budget = QueryBudget(limit, f'{request.method} {request.path} ({request.endpoint})', mode,
+                                     per_item=getattr(view, 'query_budget_per_item', 0))
+        g.query_budget.__enter__()
+
+    def _after_request(self, response):
+        # Проверка по готовому ответу: тело потоковых выгрузок читается уже после нее
+        budget = g.pop('query_budget', None)
+        if budget is not None:
+            budget.__exit__(None, None, None)
+        return response
+
+    def _teardown_request(self, error=None):
+        # Маршрут упал до after_request: снимаем счетчик без проверки
+        budget = g.pop('query_budget', None) if has_app_context() else None
+        if budget is not None:
+            QueryCounter.__exit__(budget, None, None, None)
+
+
+query_guard = QueryBudgetGuard()
@@ -0,0 +1,201 @@
+import json
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, wait
+from flask import current_app
+from sqlalchemy import or_
+from app import db, report_cache
+from app.jobs import report_jobs
+from app.models import Port
+from app.report_parser import extract_report_fields, ReportParseError
+
+# Пакетная загрузка отчетов: zip-архив или multipart с множеством PDF плюс манифест
+# {имя файла: id или имя порта}. Файлы читаются по одному, разбор идет в пуле
+# процессов с ограниченным числом файлов "в полете", все обновления - одна транзакция.
+
+MANIFEST_NAME = 'manifest.json'
+
+
+class BatchError(ValueError):
+    pass
+
+
+def parse_manifest(raw):
+    try:
+        manifest = json.loads(raw)
+    except (TypeError, ValueError):
+        raise BatchError('Manifest must be a JSON object {"file.pdf": port_id or "port name"}')
+    if isinstance(manifest, list):
+        # Альтернативная форма: [{"file": ..., "port_id": ...} | {"file": ..., "port": ...}]
+        try:
+            manifest = {item['file']: item.get('port_id', item.get('port')) for item in manifest}
+        except (TypeError, KeyError):
+            raise BatchError('Manifest entries must have "file" and "port_id" or "port"')
+    if not isinstance(manifest, dict) or not manifest:
+        raise BatchError('Manifest must be a non-empty JSON object')
+    for target in manifest.values():
+        if isinstance(target, bool) or not isinstance(target, (int, str)):
+            raise BatchError('Manifest values must be port ids or port names')
+    return manifest
+
+
+def resolve_ports(manifest):
+    """Один запрос на все порты манифеста: {target: Port}."""
+    ids = [target for target in manifest.values() if isinstance(target, int)]
+    names = [target for target in manifest.values() if isinstance(target, str)]
+    ports = Port.query.filter(or_(Port.id.in_(ids), Port.name.in_(names))).all()
+    by_id = {port.id: port for port in ports}
+    by_name = {}
+    for port in sorted(ports, key=lambda p: p.id):
+        by_name.setdefault(port.name, port)
+    return {target: by_id.get(target) if isinstance(target, int) else by_name.get(target)
+            for target in set(manifest.values())}
+
+
+def iter_zip_members(archive):
+    """(имя, функция чтения) для каждого файла архива; содержимое читается по требованию."""
+    try:
+        bundle = zipfile.ZipFile(archive)
+    except zipfile.BadZipFile:
+        raise BatchError('Archive is not a valid zip file')
+    max_bytes = current_app.config['REPORT_MAX_BYTES']
+    with bundle:
+        for info in bundle.infolist():
+            if info.is_dir():
+                continue
+            if info.file_size > max_bytes:
+                yield info.filename, _too_large
+                continue
+            yield info.filename, (lambda info=info: bundle.read(info))
+
+
+def read_zip_manifest(archive):
+    try:
+        with zipfile.ZipFile(archive) as bundle:
+            raw = bundle.read(MANIFEST_NAME)
+    except zipfile.BadZipFile:
+        raise BatchError('Archive is not a valid zip file')
+    except KeyError:
+        return None
+    finally:
+        archive.seek(0)
+    return raw
+
+
+def iter_uploaded_files(files):
+    for file in files:
+        yield file.filename, file.read
+
+
+def _too_large():
+    raise BatchError('File exceeds REPORT_MAX_BYTES')
+
+
+class _FileResult:
+    def __init__(self, name, port):
+        self.name = name
+        self.port = port
+        # id до commit: после него чтение атрибута порта - SELECT на каждый файл
+        self.port_id = port.id if port is not None else None
+        self.fields = None
+        self.error = None
+        self.cached = False
+
+    def as_dict(self):
+        return {
+            'file': self.name,
+            'port_id': self.port_id,
+            'status': 'failed' if self.error else 'updated',
+            'fields': self.fields or {},
+            'cached': self.cached,
+            'error': self.error,
+        }
+
+
+def process_batch(members, manifest):
+    """Разбирает файлы пакета и применяет значения к портам одной транзакцией."""
+    ports = resolve_ports(manifest)
+    executor = report_jobs.executor()
+    # Окно по пулу пакетной загрузки (REPORT_BATCH_WORKERS), а не по пулу диспетчера
+    window = max(1, current_app.config['REPORT_BATCH_WORKERS'] * 2)
+    results = []
+    pending = {}  # future -> (result, digest)
+    to_cache = []
+    cache_hits = []
+
+    def collect(done):
+        for future in done:
+            result, digest = pending.pop(future)
+            try:
+                result.fields = future.result()
+            except ReportParseError as e:
+                result.error = str(e)
+                continue
+            except Exception as e:
+                result.error = f'Worker error: {e}'
+                continue
+            to_cache.append((digest, result.fields))
+
+    for name, read in members:
+        if name == MANIFEST_NAME:
+            continue
+        target = manifest.get(name)
+        result = _FileResult(name, ports.get(target) if target is not None else None)
+        results.append(result)
+        if target is None:
+            result.error = 'File is not listed in the manifest'
+            continue
+        if result.port is None:
+            result.error = f'Port not found: {target}'
+            continue
+        if not name.lower().endswith('.pdf'):
+            result.error = 'Not a PDF file'
+            continue
+        try:
+            data = read()
+        except BatchError as e:
+            result.error = str(e)
+            continue
+        digest = report_cache.content_hash(data)
+        cached = report_cache.find(digest)
+        if cached is not None:
+            cache_hits.append(cached[0])
+            result.fields = cached[1]
+            result.cached = True
+            continue
+        # Ограниченное окно: в памяти не больше window файлов одновременно
+        if len(pending) >= window:
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            collect(done)
+        pending[executor.submit(extract_report_fields, data)] = (result, digest)
+        del data
+    if pending:
+        done, _ = wait(list(pending))
+        collect(done)
+
+    missing = set(manifest) - {result.name for result in results}
+    for result in results:
+        if result.error is None and not result.fields:
+            result.error = 'No matching data found in PDF'
+        if result.error is None:
+            for field, value in result.fields.items():
+                setattr(result.port, field, value)
+    try:
+        # Запись в кэш - пачкой на весь пакет, а не запросом на файл
+        report_cache.touch(cache_hits)
+        report_cache.store_many(to_cache)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        for result in results:
+            if result.error is None:
+                result.error = f'Failed to apply update: {e}'
+
+    payload = [result.as_dict() for result in results]
+    payload.extend({'file': name, 'port_id': None, 'status': 'failed', 'fields': {},
+                    'cached': False, 'error': 'File is missing from the upload'}
+                   for name in sorted(missing))
+    return {
+        'updated': sum(1 for item in payload if item['status'] == 'updated'),
+        'failed': sum(1 for item in payload if item['status'] == 'failed'),
+        'results': payload,
+    }
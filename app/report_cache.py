@@ -0,0 +1,170 @@
+import hashlib
+import json
+import threading
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import bindparam, select, delete, func
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from app.models import ParsedReportCache
+from app.report_parser import PARSER_VERSION
+
+# Кэш результатов разбора PDF по SHA-256 содержимого. Повторная загрузка того же
+# файла (повторный submit формы, один отчет на несколько портов) не разбирается заново.
+# Размер кэша ограничен REPORT_CACHE_MAX_BYTES (сумма size_bytes записей). Процесс
+# ведет оценку занятого объема по своим вставкам и считает точную SUM только при
+# превышении лимита; вставки других процессов он видит при следующей такой сверке.
+
+EVICT_TO = 0.9  # Вытеснение до 90% лимита: следующие вставки не вытесняют по записи
+EVICT_BATCH = 1000  # Записей за одно вытеснение; остаток - на следующей вставке
+
+_counters = {'hits': 0, 'misses': 0}
+_counters_lock = threading.Lock()
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _count(name):
+    with _counters_lock:
+        _counters[name] += 1
+
+
+def lookup_fields(digest):
+    return db.session.execute(
+        select(ParsedReportCache.id, ParsedReportCache.fields)
+        .where(ParsedReportCache.content_hash == digest,
+               ParsedReportCache.parser_version == PARSER_VERSION)
+    ).first()
+
+
+def find(digest):
+    """(id записи, поля) или None; жизнь записи не продлевается - это делает touch()."""
+    entry = lookup_fields(digest)
+    if entry is None:
+        _count('misses')
+        return None
+    _count('hits')
+    return entry.id, json.loads(entry.fields)
+
+
+def touch(entry_ids):
+    """Продлевает жизнь записей (LRU) одним executemany; id может повторяться."""
+    if not entry_ids:
+        return
+    table = ParsedReportCache.__table__
+    db.session.execute(
+        table.update().where(table.c.id == bindparam('entry_id'))
+        .values(hits=table.c.hits + 1, last_used_at=datetime.utcnow()),
+        [{'entry_id': entry_id} for entry_id in entry_ids]
+    )
+
+
+def lookup(digest):
+    """Возвращает сохраненные поля или None; попадание продлевает жизнь записи (LRU)."""
+    entry = find(digest)
+    if entry is None:
+        return None
+    touch([entry[0]])
+    return entry[1]
+
+
+def entry_size(digest, fields_json):
+    """Байты записи, учитываемые лимитом: ключ и сохраненный JSON."""
+    return len(digest) + len(fields_json.encode())
+
+
+def store(digest, fields):
+    """Сохраняет результат разбора и вытесняет давно не использованные записи (без commit)."""
+    store_many([(digest, fields)])
+
+
+def store_many(entries):
+    """То же для списка (digest, fields) - одним executemany на весь пакет."""
+    if not entries:
+        return
+    now = datetime.utcnow()
+    rows = []
+    for digest, fields in entries:
+        fields_json = json.dumps(fields)
+        rows.append({'content_hash': digest, 'parser_version': PARSER_VERSION, 'fields': fields_json,
+                     'size_bytes': entry_size(digest, fields_json), 'hits': 0, 'created_at': now,
+                     'last_used_at': now})
+    table = ParsedReportCache.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        # Тот же файл могли успеть разобрать параллельно - тогда запись уже есть
+        inserted = db.session.execute(insert(table).on_conflict_do_nothing(
+            index_elements=[table.c.content_hash, table.c.parser_version]), rows).rowcount
+        # При частичном конфликте неизвестно, какие строки вставлены: оценка объема
+        # завышается, что лишь приближает точную сверку в _account
+        new = rows if inserted else []
+    else:
+        new = [row for row in rows if lookup_fields(row['content_hash']) is None]
+        if new:
+            db.session.execute(table.insert(), new)
+    size = sum(row['size_bytes'] for row in new)
+    if size:
+        _account(size)
+
+
+def _usage():
+    # Оценка занятого объема живет в приложении: у каждого приложения своя БД
+    return current_app.extensions.setdefault('report_cache', {'bytes': None, 'lock': threading.Lock()})
+
+
+def _account(size):
+    limit = current_app.config['REPORT_CACHE_MAX_BYTES']
+    usage = _usage()
+    with usage['lock']:
+        if usage['bytes'] is not None:
+            usage['bytes'] += size
+            if usage['bytes'] <= limit:
+                return
+    # Оценки нет или она вышла за лимит: точный объем, затем вытеснение
+    total = db.session.execute(select(func.coalesce(func.sum(ParsedReportCache.size_bytes), 0))).scalar()
+    if total > limit:
+        total -= _evict(total - int(limit * EVICT_TO))
+    with usage['lock']:
+        usage['bytes'] = total
+
+
+def _evict(excess):
+    """Удаляет самые давно использованные записи суммарно на excess байт, возвращает освобожденное."""
+    oldest = db.session.execute(
+        select(ParsedReportCache.id, ParsedReportCache.size_bytes)
+        .order_by(ParsedReportCache.last_used_at, ParsedReportCache.id)
+        .limit(EVICT_BATCH)
+    )
+    ids, freed = [], 0
+    for entry_id, size in oldest:
+        if freed >= excess:
+            break
+        ids.append(entry_id)
+        freed += size
+    if ids:
+        db.session.execute(delete(ParsedReportCache).where(ParsedReportCache.id.in_(ids)))
+    return freed
+
+
+def cache_stats():
+    with _counters_lock:
+        hits, misses = _counters['hits'], _counters['misses']
+    entries, size, total_hits = db.session.execute(
+        select(func.count(ParsedReportCache.id), func.coalesce(func.sum(ParsedReportCache.size_bytes), 0),
+               func.coalesce(func.sum(ParsedReportCache.hits), 0))
+        .where(ParsedReportCache.parser_version == PARSER_VERSION)
+    ).one()
+    lookups = hits + misses
+    return {
+        'parser_version': PARSER_VERSION,
+        'entries': entries,
+        'size_bytes': size,
+        'max_bytes': current_app.config['REPORT_CACHE_MAX_BYTES'],
+        'entry_hits': total_hits,  # Сохраненные попадания по текущим записям
+        'hits': hits,  # Счетчики процесса с момента старта
+        'misses': misses,
+        'hit_ratio': round(hits / lookups, 4) if lookups else 0.0,
+    }
@@ -0,0 +1,55 @@
+import io
+import re
+from contextlib import closing
+import pdfplumber
+
+# Извлечение метрик из PDF-отчета. Функции верхнего уровня и принимают байты,
+# чтобы их можно было выполнять в пуле процессов (app/jobs.py).
+
+# Меняется вместе с шаблонами/логикой разбора: старые записи кэша перестают совпадать
+PARSER_VERSION = '2'
+
+REPORT_PATTERNS = {
+    'air_quality': re.compile(r'air\s*quality[:\s]*(\d+\.?\d*)', re.IGNORECASE),
+    'water_quality': re.compile(r'water\s*quality[:\s]*(\d+\.?\d*)', re.IGNORECASE),
+    'co2_emissions': re.compile(r'co2\s*emissions?[:\s]*(\d+\.?\d*)', re.IGNORECASE),
+    'incidents': re.compile(r'incidents?[:\s]*(\d+)', re.IGNORECASE)
+}
+
+
+class ReportParseError(Exception):
+    pass
+
+
+def iter_page_texts(stream):
+    """Текст PDF постранично; кэш разметки страницы сбрасывается сразу после нее."""
+    with pdfplumber.open(stream) as pdf:
+        for page in pdf.pages:
+            try:
+                yield page.extract_text() or ''
+            finally:
+                page.flush_cache()
+
+
+def extract_report_fields(data):
+    """Возвращает dict найденных полей отчета {field: value}.
+
+    Шаблоны применяются к каждой странице по отдельности; разбор прекращается,
+    как только найдены все поля (сводная таблица обычно на первых страницах).
+    """
+    fields = {}
+    pending = dict(REPORT_PATTERNS)
+    try:
+        with closing(iter_page_texts(io.BytesIO(data))) as pages:
+            for text in pages:
+                for field, pattern in list(pending.items()):
+                    match = pattern.search(text)
+                    if match:
+                        value = match.group(1)
+                        fields[field] = float(value) if '.' in value else int(value)
+                        del pending[field]
+                if not pending:
+                    break
+    except Exception as e:
+        raise ReportParseError(f'Failed to parse PDF: {e}')
+    return fields
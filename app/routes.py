@@ -1,14 +1,28 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, create_access_token, get_jwt_identity
-from flask_mail import Message
-from app import db, mail, jwt
-from app.models import User, Port, Report
-from app.schemas import PortSchema, ReportSchema, LoginSchema
-import pdfplumber
 import re
-import threading
-import tempfile
-import os
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
+from flask_jwt_extended import jwt_required
+from app import db, jwt
+from app.auth import LoginBusy, admin_required, issue_token, password_checker
+from app.database import primary_connection, read_replica
+from app.query_budget import budget_items, query_budget
+from app.models import User, Port, Report, ReportJob, ScoringProfile
+from app.schemas import PortSchema, ReportSchema, LoginSchema
+from app.aggregates import TOP_N, read_aggregates, rebuild_aggregates, histogram_payload, trend_values
+from app.timeseries import RESOLUTIONS, choose_resolution, query_history
+from app.ingest import NDJSON_MIMETYPES, CSV_MIMETYPES, iter_ndjson_rows, iter_csv_rows, ingest_rows
+from app.jobs import report_jobs, job_to_dict
+from app.report_cache import cache_stats
+from app.report_batch import BatchError, parse_manifest, process_batch, read_zip_manifest, iter_zip_members, iter_uploaded_files
+from app.notifications import notifications
+from app.subscriptions import add_subscription
+from app.spatial import NEAR_DEFAULT_K, NEAR_MAX_K, bbox_filter, nearest, parse_bbox
+from app.tiles import TILE_MAX_ZOOM, get_tile
+from app.search import SEARCH_MAX_PER_PAGE, query_terms, search_available, search_reports
+from app.export import EXPORT_FORMATS, ExportError, check_export, iter_export
+from app.serializers import RawJSON, json_response, port_serializer, report_serializer
+from app.scoring import DEFAULT_PROFILE, ProfileError, build_profile, get_profile, list_profiles, rank_ports, save_profile
+from app.pagination import InvalidCursor, encode_cursor, decode_cursor, keyset_page
+from datetime import datetime, timedelta
 
 api_bp = Blueprint('api', __name__)
 port_schema = PortSchema()
@@ -16,113 +30,280 @@ ports_schema = PortSchema(many=True)
 report_schema = ReportSchema()
 login_schema = LoginSchema()
 
-# Функция для уведомлений
-def send_notification_async(port, message):
-    def send():
-        if port.subscribers:
-            emails = port.subscribers.split(',')
-            msg = Message('EcoPorts Alert', sender='noreply@ecoports.com', recipients=emails)
-            msg.body = message
-            mail.send(msg)
-    threading.Thread(target=send).start()
+# Уведомления уходят через фоновый диспетчер (app/notifications.py)
+ALERT_SUBJECT = 'EcoPorts Alert'
+
+def notify_pollution(port_id, name):
+    # Получателей диспетчер читает из subscription чанками сам
+    notifications.notify(port_id, ALERT_SUBJECT, f'Alert: High pollution in {name}')
+
+def notify_pollution_batch(alerts):
+    for alert in alerts:
+        notify_pollution(alert['port_id'], alert['name'])
 
 # Логин
 @api_bp.route('/login', methods=['POST'])
+@query_budget(3)
 def login():
     data = request.get_json()
     errors = login_schema.validate(data)
     if errors:
         return jsonify(errors), 400
     
-    user = User.query.filter_by(username=data['username']).first()
-    if user and user.check_password(data['password']):
-        access_token = create_access_token(identity=str(user.id))
-        return jsonify(access_token=access_token, role=user.role), 200
-    return jsonify({'error': 'Invalid credentials'}), 401
+    username = data['username']
+    retry_after = password_checker.locked_out(username)
+    if retry_after:
+        # Подбор пароля: отвечаем без вычисления bcrypt
+        return jsonify({'error': 'Too many failed attempts'}), 429, {'Retry-After': str(retry_after)}
+    
+    user = User.query.filter_by(username=username).first()
+    try:
+        valid = user is not None and password_checker.verify(user.password_hash, data['password'])
+        if valid and user.needs_rehash(current_app.config['BCRYPT_LOG_ROUNDS']):
+            # Cost-фактор изменился: пересчитываем хэш, пока пароль известен
+            user.password_hash = password_checker.hash(data['password'])
+            db.session.commit()
+    except LoginBusy:
+        return jsonify({'error': 'Login service is busy, retry later'}), 503, {'Retry-After': '1'}
+    if not valid:
+        password_checker.record_failure(username)
+        return jsonify({'error': 'Invalid credentials'}), 401
+    password_checker.record_success(username)
+    # Роль в подписанном claim: админские маршруты проверяют ее без запроса к БД
+    access_token = issue_token(user)
+    return jsonify(access_token=access_token, role=user.role), 200
 
 # Порты (GET с фильтрами)
+SORTABLE_FIELDS = ['name', 'air_quality', 'water_quality', 'co2_emissions', 'incidents', 'green_score']
+
 @api_bp.route('/ports', methods=['GET'])
+@read_replica
+@query_budget(2)
 def get_ports():
     query = Port.query
+    # Фильтр до пагинации, чтобы total и размер страницы были корректными
+    min_score = request.args.get('min_score', type=float)
+    if min_score is not None:
+        query = query.filter(Port.green_score >= min_score)
+    if 'bbox' in request.args:
+        try:
+            query = query.filter(bbox_filter(parse_bbox(request.args['bbox'])))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    
     sort_by = request.args.get('sort', 'name')
     order = request.args.get('order', 'asc')
-    if sort_by in ['name', 'air_quality', 'water_quality', 'co2_emissions', 'incidents']:
+    # Keyset-режим: ?cursor= (пустой для первой страницы), дальше next_cursor из ответа
+    if 'cursor' in request.args:
+        return _get_ports_keyset(query, sort_by, order)
+    if sort_by in SORTABLE_FIELDS:
         column = getattr(Port, sort_by)
-        query = query.order_by(column.desc() if order == 'desc' else column.asc())
-    elif sort_by == 'green_score':
-        ports_list = query.all()
-        ports_list.sort(key=lambda p: p.green_score, reverse=(order == 'desc'))
-        query = ports_list
+        query = query.order_by(column.desc() if order == 'desc' else column.asc(), Port.id.asc())
     
-    if isinstance(query, list):
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
-        start = (page - 1) * per_page
-        end = start + per_page
-        paginated_items = query[start:end]
-        total = len(query)
-        pages = (total + per_page - 1) // per_page
-        current_page = page
-    else:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
-        ports = query.paginate(page=page, per_page=per_page, error_out=False)
-        paginated_items = ports.items
-        total = ports.total
-        pages = ports.pages
-        current_page = ports.page
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', 10, type=int)
+    # Только колонки схемы: строки кодируются без ORM-объектов и marshmallow
+    ports = query.with_entities(*port_serializer.columns).paginate(page=page, per_page=per_page, error_out=False)
     
-    min_score = request.args.get('min_score', type=float)
-    if min_score is not None:
-        paginated_items = [p for p in paginated_items if p.green_score >= min_score]
-    
-    return jsonify({
-        'ports': ports_schema.dump(paginated_items),
-        'total': total,
-        'pages': pages,
-        'current_page': current_page
+    return json_response({
+        'ports': RawJSON(port_serializer.encode_rows(ports.items)),
+        'total': ports.total,
+        'pages': ports.pages,
+        'current_page': ports.page
     })
 
+def _get_ports_keyset(query, sort_by, order):
+    if sort_by not in SORTABLE_FIELDS:
+        sort_by = 'id'
+    descending = order == 'desc'
+    per_page = request.args.get('per_page', 10, type=int)
+    if per_page < 1:
+        return jsonify({'error': 'per_page must be positive'}), 400
+    
+    after = None
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            payload = decode_cursor(cursor)
+            if payload.get('sort') != sort_by or payload.get('order') != order:
+                raise InvalidCursor('Cursor was issued for another sort order')
+            after = payload['after']
+            if not isinstance(after, list) or len(after) != 2:
+                raise InvalidCursor('Malformed cursor')
+        except (InvalidCursor, AttributeError, KeyError) as e:
+            return jsonify({'error': 'Invalid cursor', 'details': str(e)}), 400
+    
+    total = None
+    if request.args.get('with_total', 0, type=int):
+        total = query.order_by(None).count()  # COUNT только по запросу клиента
+    
+    items, last_key = keyset_page(query.with_entities(*port_serializer.columns), getattr(Port, sort_by),
+                                  Port.id, per_page, after=after, descending=descending)
+    next_cursor = None
+    if last_key is not None:
+        next_cursor = encode_cursor({'sort': sort_by, 'order': order, 'after': list(last_key)})
+    
+    response = {'ports': RawJSON(port_serializer.encode_rows(items)), 'next_cursor': next_cursor}
+    if total is not None:
+        response['total'] = total
+    return json_response(response)
+
+# Ближайшие порты: ?lat=&lng=[&radius_km=][&k=]
+@api_bp.route('/ports/near', methods=['GET'])
+@query_budget(7)
+def get_ports_near():
+    lat = request.args.get('lat', type=float)
+    lng = request.args.get('lng', type=float)
+    if lat is None or lng is None or not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return jsonify({'error': 'lat and lng are required: -90 <= lat <= 90, -180 <= lng <= 180'}), 400
+    k = request.args.get('k', NEAR_DEFAULT_K, type=int)
+    if not 1 <= k <= NEAR_MAX_K:
+        return jsonify({'error': f'k must be between 1 and {NEAR_MAX_K}'}), 400
+    radius_km = request.args.get('radius_km', type=float)
+    if radius_km is not None and radius_km <= 0:
+        return jsonify({'error': 'radius_km must be positive'}), 400
+    
+    found = nearest(lat, lng, k=k, radius_km=radius_km)
+    ports = {port.id: port for port in Port.query.filter(Port.id.in_([port_id for port_id, _ in found]))}
+    results = []
+    for port_id, distance in found:
+        item = port_schema.dump(ports[port_id])
+        item['distance_km'] = round(distance, 3)
+        results.append(item)
+    return jsonify({'ports': results})
+
+# Кластеризованные тайлы карты (GeoJSON), кэш сбрасывается по затронутым тайлам
+@api_bp.route('/tiles/<int:z>/<int:x>/<int:y>', methods=['GET'])
+@query_budget(4)
+def get_map_tile(z, x, y):
+    if z > TILE_MAX_ZOOM or x >= 2 ** z or y >= 2 ** z:
+        return jsonify({'error': f'Tile out of range (max zoom {TILE_MAX_ZOOM})'}), 404
+    response = Response(get_tile(z, x, y), mimetype='application/geo+json')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
+
+# Рейтинг портов по профилю весов/порогов; тело запроса может переопределить веса (what-if).
+# Каждый вызов пересчитывает все порты, поэтому только для вошедших пользователей
+SCORE_MAX_LIMIT = 1000
+
+@api_bp.route('/ports/score', methods=['POST'])
+@jwt_required()
+@query_budget(3)
+def score_ports():
+    name = request.args.get('profile', DEFAULT_PROFILE)
+    profile = get_profile(name)
+    if profile is None:
+        return jsonify({'error': f'Scoring profile not found: {name}'}), 404
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Body must be a JSON object'}), 400
+    try:
+        if 'weights' in data or 'thresholds' in data:
+            profile = build_profile(f'{name}+what-if', data, base=profile)
+    except ProfileError as e:
+        return jsonify({'error': str(e)}), 400
+    limit = data.get('limit', request.args.get('limit', 50, type=int))
+    if isinstance(limit, bool) or not isinstance(limit, int) or not 1 <= limit <= SCORE_MAX_LIMIT:
+        return jsonify({'error': f'limit must be between 1 and {SCORE_MAX_LIMIT}'}), 400
+    order = data.get('order', request.args.get('order', 'desc'))
+    return jsonify(rank_ports(profile, limit=limit, ascending=order == 'asc'))
+
+@api_bp.route('/scoring/profiles', methods=['GET'])
+@query_budget(1)
+def get_scoring_profiles():
+    return jsonify([profile.to_dict() for profile in list_profiles()])
+
+@api_bp.route('/scoring/profiles/<name>', methods=['PUT'])
+@admin_required()
+@query_budget(3)
+def put_scoring_profile(name):
+    if not re.fullmatch(r'[A-Za-z0-9_-]{1,64}', name):
+        return jsonify({'error': 'Profile name must be 1-64 letters, digits, "_" or "-"'}), 400
+    try:
+        profile = build_profile(name, request.get_json(silent=True))
+        created = save_profile(profile)
+        db.session.commit()
+    except ProfileError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    return jsonify(profile.to_dict()), 201 if created else 200
+
+@api_bp.route('/scoring/profiles/<name>', methods=['DELETE'])
+@admin_required()
+@query_budget(3)
+def delete_scoring_profile(name):
+    row = ScoringProfile.query.filter_by(name=name).first_or_404()
+    db.session.delete(row)
+    db.session.commit()
+    return jsonify({'message': 'Scoring profile deleted'})
+
 # Конкретный порт
 @api_bp.route('/ports/<int:port_id>', methods=['GET'])
+@read_replica
+@query_budget(1)
 def get_port(port_id):
     port = Port.query.get_or_404(port_id)
     return jsonify(port_schema.dump(port))
 
-# Статистика портов
+# История метрик порта из ряда измерений и его сверток
+@api_bp.route('/ports/<int:port_id>/history', methods=['GET'])
+@query_budget(2)
+def get_port_history(port_id):
+    Port.query.get_or_404(port_id)
+    try:
+        end = datetime.fromisoformat(request.args['to']) if 'to' in request.args else datetime.utcnow()
+        start = datetime.fromisoformat(request.args['from']) if 'from' in request.args else end - timedelta(days=30)
+    except ValueError:
+        return jsonify({'error': 'from/to must be ISO 8601 datetimes'}), 400
+    if start > end:
+        return jsonify({'error': 'from must not be later than to'}), 400
+    
+    resolution = request.args.get('resolution', 'auto')
+    if resolution == 'auto':
+        resolution = choose_resolution(start, end)
+    elif resolution != 'raw' and resolution not in RESOLUTIONS:
+        return jsonify({'error': 'resolution must be one of: auto, raw, hour, day'}), 400
+    
+    return jsonify({
+        'port_id': port_id,
+        'resolution': resolution,
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'points': query_history(port_id, start, end, resolution)
+    })
+
+# Статистика портов: читается из инкрементальных агрегатов (app/aggregates.py).
+# Списки *_trend требуют чтения всех портов, поэтому отдаются только по ?trends=1:
+# частый опрос без них не читает таблицу port
 @api_bp.route('/ports/stats', methods=['GET'])
+@read_replica
+@query_budget(9)  # 3 при готовых агрегатах, остальное - однократная перестройка
 def get_ports_stats():
-    ports = Port.query.all()
-    if not ports:
-        return jsonify({
-            'total_ports': 0,
-            'avg_green_score': 0,
-            'top_polluted': [],
-            'air_quality_trend': [],
-            'water_quality_trend': [],
-            'co2_trend': [],
-            'incidents_trend': []
-        })
+    conn = db.session.connection()
+    stored = read_aggregates(conn)
+    if stored is None:
+        # Первый запрос после миграции: строим агрегаты один раз (в основной БД, не на реплике)
+        rebuild_aggregates(primary_connection(db))
+        db.session.commit()
+        stored = read_aggregates(primary_connection(db))
+    
+    count = stored['port_count']
     stats = {
-        'total_ports': len(ports),
-        'avg_green_score': round(sum(p.green_score for p in ports) / len(ports), 2),
-        'top_polluted': [{'name': p.name, 'score': p.green_score} for p in sorted(ports, key=lambda x: x.green_score)[:5]],
-        'air_quality_trend': [p.air_quality for p in ports],
-        'water_quality_trend': [p.water_quality for p in ports],
-        'co2_trend': [p.co2_emissions for p in ports],
-        'incidents_trend': [p.incidents for p in ports]
+        'total_ports': count,
+        'avg_green_score': round(stored['score_sum'] / count, 2) if count else 0,
+        'top_polluted': [{'name': name, 'score': score} for score, _, name in stored['top_polluted'][:TOP_N]],
+        'histograms': histogram_payload(stored['histogram'])
     }
+    if request.args.get('trends') == '1':
+        stats.update(trend_values(conn))
     return jsonify(stats)
 
 # CRUD для портов (только админы)
 @api_bp.route('/ports', methods=['POST'])
-@jwt_required()
+@admin_required()
+@query_budget(15)
 def create_port():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    if user.role != 'admin':
-        return jsonify({'error': 'Access denied'}), 403
-    
     data = request.get_json()
     errors = port_schema.validate(data)  # Добавлено
     if errors:
@@ -138,13 +319,9 @@ def create_port():
         return jsonify({'error': 'Failed to create port', 'details': str(e)}), 500
 
 @api_bp.route('/ports/<int:port_id>', methods=['PUT'])
-@jwt_required()
+@admin_required()
+@query_budget(11)
 def update_port(port_id):
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    if user.role != 'admin':
-        return jsonify({'error': 'Access denied'}), 403
-    
     port = Port.query.get_or_404(port_id)
     data = request.get_json()
     errors = port_schema.validate(data, partial=True)
@@ -156,20 +333,32 @@ def update_port(port_id):
             setattr(port, key, value)
         db.session.commit()
         if port.air_quality > 50 or port.water_quality > 30:
-            send_notification_async(port, f'Alert: High pollution in {port.name}')
+            notify_pollution(port.id, port.name)
         return jsonify(port_schema.dump(port))
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Failed to update port', 'details': str(e)}), 500
 
+# Массовая загрузка метрик (NDJSON или CSV), тело читается потоково
+@api_bp.route('/ports/bulk', methods=['POST'])
+@admin_required()
+@query_budget(2, per_item=10)  # На чанк: SELECT обновляемых, UPDATE и INSERT пачкой, агрегаты, ряды, тайлы
+def bulk_ingest_ports():
+    if request.mimetype in NDJSON_MIMETYPES:
+        rows = iter_ndjson_rows(request.stream)
+    elif request.mimetype in CSV_MIMETYPES:
+        rows = iter_csv_rows(request.stream)
+    else:
+        return jsonify({'error': 'Content-Type must be application/x-ndjson or text/csv'}), 415
+    
+    result = ingest_rows(rows, on_alerts=notify_pollution_batch)
+    budget_items(result.chunks)
+    return jsonify(result.as_dict()), 200 if result.error_count == 0 else 207
+
 @api_bp.route('/ports/<int:port_id>', methods=['DELETE'])
-@jwt_required()
+@admin_required()
+@query_budget(11)
 def delete_port(port_id):
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    if user.role != 'admin':
-        return jsonify({'error': 'Access denied'}), 403
-    
     
     port = Port.query.get_or_404(port_id)
     try:
@@ -182,52 +371,75 @@ def delete_port(port_id):
 
 # Загрузка отчета
 @api_bp.route('/ports/<int:port_id>/upload_report', methods=['POST'])
-@jwt_required()
+@admin_required()
+@query_budget(23)
 def upload_report(port_id):
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    if user.role != 'admin':
-        return jsonify({'error': 'Access denied'}), 403
-    
     file = request.files.get('file')
     if not file or not file.filename or not file.filename.endswith('.pdf'):
         return jsonify({'error': 'Invalid file'}), 400
     
     port = Port.query.get_or_404(port_id)
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-        file.save(temp_file.name)
-        temp_path = temp_file.name
-    
     try:
-        with pdfplumber.open(temp_path) as pdf:
-            text = ''.join(page.extract_text() for page in pdf.pages)
-        
-        patterns = {
-            'air_quality': r'air\s*quality[:\s]*(\d+\.?\d*)',
-            'water_quality': r'water\s*quality[:\s]*(\d+\.?\d*)',
-            'co2_emissions': r'co2\s*emissions?[:\s]*(\d+\.?\d*)',
-            'incidents': r'incidents?[:\s]*(\d+)'
-        }
-        updated_fields = []
-        for field, pattern in patterns.items():
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                value = float(match.group(1)) if '.' in match.group(1) else int(match.group(1))
-                setattr(port, field, value)
-                updated_fields.append(field)
-        
-        if not updated_fields:
-            return jsonify({'error': 'No matching data found in PDF'}), 400
-        
-        db.session.commit()
-        return jsonify({'message': f'Report parsed and updated fields: {", ".join(updated_fields)}'})
+        # Разбор идет в пуле процессов (app/jobs.py), клиент опрашивает /api/jobs/<id>
+        job = report_jobs.enqueue(port.id, file.filename, file.read())
     except Exception as e:
-        return jsonify({'error': 'Failed to parse PDF', 'details': str(e)}), 500
-    finally:
-        os.unlink(temp_path)
+        db.session.rollback()
+        return jsonify({'error': 'Failed to queue report', 'details': str(e)}), 500
+    response = jsonify(job_to_dict(job))
+    response.headers['Location'] = f'/api/jobs/{job.id}'
+    return response, 202
+
+# Пакетная загрузка отчетов: zip или multipart с множеством PDF плюс манифест
+@api_bp.route('/reports/batch', methods=['POST'])
+@admin_required()
+@query_budget(12, per_item=2)  # На файл: поиск в кэше разбора и UPDATE порта; запись в кэш - пачкой
+def upload_reports_batch():
+    archive = request.files.get('archive')
+    files = request.files.getlist('files')
+    raw_manifest = request.form.get('manifest')
+    try:
+        if archive:
+            if raw_manifest is None:
+                raw_manifest = read_zip_manifest(archive.stream)
+            members = iter_zip_members(archive.stream)
+        elif files:
+            members = iter_uploaded_files(files)
+        else:
+            return jsonify({'error': 'Upload a zip "archive" or one or more "files"'}), 400
+        if raw_manifest is None:
+            return jsonify({'error': 'Manifest is required (form field or manifest.json in the archive)'}), 400
+        summary = process_batch(members, parse_manifest(raw_manifest))
+        budget_items(len(summary['results']))
+    except BatchError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    return jsonify(summary), 200 if summary['failed'] == 0 else 207
+
+# Состояние очереди уведомлений
+@api_bp.route('/notifications/stats', methods=['GET'])
+@admin_required()
+@query_budget(1)
+def get_notification_stats():
+    return jsonify(notifications.stats())
+
+# Эффективность кэша разобранных отчетов
+@api_bp.route('/reports/cache', methods=['GET'])
+@admin_required()
+@query_budget(2)
+def get_report_cache_stats():
+    return jsonify(cache_stats())
+
+# Статус задания разбора отчета
+@api_bp.route('/jobs/<int:job_id>', methods=['GET'])
+@admin_required()
+@query_budget(2)
+def get_job(job_id):
+    job = ReportJob.query.get_or_404(job_id)
+    return jsonify(job_to_dict(job))
 
 # Подписка
 @api_bp.route('/ports/<int:port_id>/subscribe', methods=['POST'])
+@query_budget(2)
 def subscribe(port_id):
     data = request.get_json()
     email = data.get('email')
@@ -235,21 +447,19 @@ def subscribe(port_id):
         return jsonify({'error': 'Invalid email'}), 400
     
     port = Port.query.get_or_404(port_id)
-    subscribers_list = port.subscribers.split(',') if port.subscribers else []
-    if email in subscribers_list:
-        return jsonify({'message': 'Already subscribed'}), 200
-    
-    subscribers_list.append(email)
-    port.subscribers = ','.join(subscribers_list)
     try:
+        added = add_subscription(port.id, email)
         db.session.commit()
-        return jsonify({'message': 'Subscribed'})
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Failed to subscribe', 'details': str(e)}), 500
+    if not added:
+        return jsonify({'message': 'Already subscribed'}), 200
+    return jsonify({'message': 'Subscribed'})
 
 # Отчеты
 @api_bp.route('/reports', methods=['POST'])
+@query_budget(3)
 def create_report():
     data = request.get_json()
     errors = report_schema.validate(data)
@@ -269,14 +479,91 @@ def create_report():
         db.session.rollback()
         return jsonify({'error': 'Failed to create report', 'details': str(e)}), 500
 
-# Получение отчетов (для админов)
+# Получение отчетов (для админов): keyset-страницы от новых к старым или поток NDJSON
+REPORTS_MAX_PER_PAGE = 1000
+REPORTS_STREAM_CHUNK = 1000
+
+def _report_filters():
+    filters = []
+    port_id = request.args.get('port_id', type=int)
+    if port_id is not None:
+        filters.append(Report.port_id == port_id)
+    for arg, compare in (('since', Report.timestamp.__ge__), ('until', Report.timestamp.__lt__)):
+        if arg in request.args:
+            filters.append(compare(datetime.fromisoformat(request.args[arg])))
+    return filters
+
 @api_bp.route('/reports', methods=['GET'])
-@jwt_required()
+@admin_required()
+@read_replica
+@query_budget(2)
 def get_reports():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    if user.role != 'admin':
-        return jsonify({'error': 'Access denied'}), 403
+    try:
+        filters = _report_filters()
+    except ValueError:
+        return jsonify({'error': 'since/until must be ISO 8601 datetimes'}), 400
+    if request.args.get('format') == 'ndjson':
+        return _stream_reports(filters)
+    
+    per_page = request.args.get('per_page', 50, type=int)
+    if not 1 <= per_page <= REPORTS_MAX_PER_PAGE:
+        return jsonify({'error': f'per_page must be between 1 and {REPORTS_MAX_PER_PAGE}'}), 400
+    after = None
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            timestamp, report_id = decode_cursor(cursor)['after']
+            after = (datetime.fromisoformat(timestamp), int(report_id))
+        except (InvalidCursor, TypeError, ValueError, KeyError) as e:
+            return jsonify({'error': 'Invalid cursor', 'details': str(e)}), 400
+    
+    query = Report.query.filter(*filters).with_entities(*report_serializer.columns)
+    items, last_key = keyset_page(query, Report.timestamp, Report.id, per_page, after=after, descending=True)
+    next_cursor = None
+    if last_key is not None:
+        next_cursor = encode_cursor({'after': [last_key[0].isoformat(), last_key[1]]})
+    return json_response({'reports': RawJSON(report_serializer.encode_rows(items)), 'next_cursor': next_cursor})
+
+def _stream_reports(filters):
+    # Строки читаются курсором сервера порциями, в памяти не больше одной порции
+    stmt = (db.select(*report_serializer.columns).where(*filters)
+            .order_by(Report.timestamp.desc(), Report.id.desc())
+            .execution_options(stream_results=True, yield_per=REPORTS_STREAM_CHUNK))
     
-    reports = Report.query.all()
-    return jsonify(report_schema.dump(reports, many=True))
\ No newline at end of file
+    def generate():
+        for partition in db.session.execute(stmt).partitions():
+            yield ''.join([report_serializer.encode_row(row) + '\n' for row in partition])
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+# Полнотекстовый поиск по описаниям отчетов (FTS5 / tsvector)
+@api_bp.route('/reports/search', methods=['GET'])
+@admin_required()
+@query_budget(2)
+def search_reports_endpoint():
+    q = request.args.get('q', '')
+    if not query_terms(q):
+        return jsonify({'error': 'q must contain at least one word'}), 400
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', 20, type=int)
+    if page < 1 or not 1 <= per_page <= SEARCH_MAX_PER_PAGE:
+        return jsonify({'error': f'page must be positive and per_page between 1 and {SEARCH_MAX_PER_PAGE}'}), 400
+    if not search_available():
+        return jsonify({'error': 'Full-text search is not available for this database'}), 501
+    results = search_reports(q, port_id=request.args.get('port_id', type=int), page=page, per_page=per_page)
+    return jsonify({'query': q, 'page': page, 'per_page': per_page, 'results': results})
+
+# Потоковая выгрузка таблиц для аналитиков (только админы)
+@api_bp.route('/export/<dataset>', methods=['GET'])
+@admin_required()
+@query_budget(1)
+def export_dataset(dataset):
+    fmt = request.args.get('format', 'csv')
+    try:
+        check_export(dataset, fmt)
+    except ExportError as e:
+        return jsonify({'error': str(e)}), 400
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    response = Response(stream_with_context(iter_export(dataset, fmt)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={dataset}.{extension}'
+    return response
\ No newline at end of file
@@ -0,0 +1,139 @@
+import json
+import math
+import numpy as np
+from sqlalchemy import func, select
+from app import db
+from app.models import Port, ScoringProfile, GREEN_SCORE_PROFILE
+
+# Векторизованный расчет green_score по произвольному профилю весов и порогов:
+# метрики всех портов загружаются в массивы numpy и считаются одним проходом.
+# Профиль 'default' встроенный и повторяет Port.calculate_green_score бит в бит.
+
+METRICS = tuple(metric for metric, _, _ in GREEN_SCORE_PROFILE)
+DEFAULT_PROFILE = 'default'
+
+
+class ProfileError(ValueError):
+    pass
+
+
+class Profile:
+    def __init__(self, name, weights, thresholds, description=''):
+        self.name = name
+        self.weights = weights
+        self.thresholds = thresholds
+        self.description = description
+
+    def to_dict(self):
+        return {'name': self.name, 'description': self.description,
+                'weights': self.weights, 'thresholds': self.thresholds}
+
+
+def default_profile():
+    return Profile(DEFAULT_PROFILE,
+                   {metric: weight for metric, weight, _ in GREEN_SCORE_PROFILE},
+                   {metric: threshold for metric, _, threshold in GREEN_SCORE_PROFILE},
+                   'Stored green_score')
+
+
+def build_profile(name, data, base=None):
+    """Профиль из JSON {weights, thresholds[, description]}; отсутствующие метрики берутся из base."""
+    if not isinstance(data, dict):
+        raise ProfileError('Profile must be a JSON object')
+    base = base or default_profile()
+    weights, thresholds = dict(base.weights), dict(base.thresholds)
+    for key, target, positive in (('weights', weights, False), ('thresholds', thresholds, True)):
+        values = data.get(key, {})
+        if not isinstance(values, dict):
+            raise ProfileError(f'{key} must be an object {{metric: number}}')
+        for metric, value in values.items():
+            if metric not in METRICS:
+                raise ProfileError(f"Unknown metric {metric!r}, expected one of: {', '.join(METRICS)}")
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+                raise ProfileError(f'{key}.{metric} must be a number')
+            if positive and value <= 0:
+                raise ProfileError(f'thresholds.{metric} must be positive')
+            target[metric] = value
+    return Profile(name, weights, thresholds, str(data.get('description', base.description or '')))
+
+
+def _from_row(row):
+    return Profile(row.name, json.loads(row.weights), json.loads(row.thresholds), row.description)
+
+
+def get_profile(name):
+    if name == DEFAULT_PROFILE:
+        return default_profile()
+    row = ScoringProfile.query.filter_by(name=name).first()
+    return _from_row(row) if row is not None else None
+
+
+def list_profiles():
+    return [default_profile()] + [_from_row(row) for row in ScoringProfile.query.order_by(ScoringProfile.name)]
+
+
+def save_profile(profile):
+    """Создает или заменяет профиль (без commit). True - создан новый."""
+    if profile.name == DEFAULT_PROFILE:
+        raise ProfileError('The default profile is built in and cannot be changed')
+    row = ScoringProfile.query.filter_by(name=profile.name).first()
+    created = row is None
+    if created:
+        row = ScoringProfile(name=profile.name)
+        db.session.add(row)
+    row.description = profile.description
+    row.weights = json.dumps(profile.weights, sort_keys=True)
+    row.thresholds = json.dumps(profile.thresholds, sort_keys=True)
+    return created
+
+
+def load_metrics():
+    """(ids, stored green_score, матрица метрик N x len(METRICS)) для всех портов."""
+    rows = db.session.execute(
+        select(Port.id, Port.green_score, *(func.coalesce(getattr(Port, metric), 0) for metric in METRICS))
+        .order_by(Port.id)
+    ).all()
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0), np.empty((0, len(METRICS)))
+    data = np.array(rows, dtype=float)
+    return data[:, 0].astype(np.int64), data[:, 1], data[:, 2:]
+
+
+def _round2(values):
+    # np.round(x, 2) умножает на 100 и может разойтись с round() на границе .5:
+    # такие значения досчитываются встроенным round, как в Port.calculate_green_score
+    rounded = np.round(values, 2)
+    scaled = values * 100
+    ambiguous = np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)
+    for index in ambiguous:
+        rounded[index] = round(float(values[index]), 2)
+    return rounded
+
+
+def score_matrix(metrics, profile):
+    """Очки всех портов одним проходом; порядок операций как в Port.calculate_green_score."""
+    score = np.zeros(len(metrics))
+    for column, metric in enumerate(METRICS):
+        score += (1 - np.minimum(metrics[:, column] / profile.thresholds[metric], 1)) * profile.weights[metric]
+    return _round2(score)
+
+
+def rank_ports(profile, limit=50, ascending=False):
+    """Рейтинг портов по профилю; хранимые данные не меняются."""
+    ids, stored, metrics = load_metrics()
+    scores = score_matrix(metrics, profile)
+    # Стабильная сортировка по (score, id): при равных очках раньше меньший id
+    order = np.lexsort((ids, scores if ascending else -scores))[:limit]
+    names = dict(db.session.execute(select(Port.id, Port.name).where(Port.id.in_(ids[order].tolist()))).all())
+    return {
+        'profile': profile.to_dict(),
+        'count': int(len(ids)),
+        'mean_score': round(float(scores.mean()), 2) if len(ids) else 0.0,
+        'ports': [{
+            'rank': position + 1,
+            'id': int(ids[index]),
+            'name': names[int(ids[index])],
+            'score': float(scores[index]),
+            'green_score': float(stored[index]),
+        } for position, index in enumerate(order)],
+    }
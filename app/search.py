@@ -0,0 +1,131 @@
+import re
+from contextlib import contextmanager
+from markupsafe import escape
+from sqlalchemy import DDL, event, text
+from app import db
+from app.models import Report
+
+# Полнотекстовый поиск по Report.description. SQLite: внешняя FTS5-таблица
+# report_fts поверх report, синхронизируется триггерами. PostgreSQL: GIN-индекс
+# по to_tsvector(description). В обоих случаях create_report и любые другие
+# записи в report попадают в индекс в той же транзакции.
+
+TS_CONFIG = 'simple'  # Описания на русском и английском: без языкового стемминга
+SEARCH_MAX_PER_PAGE = 100
+SEARCH_DIALECTS = ('sqlite', 'postgresql')
+# Служебные маркеры подсветки: текст отчета экранируется, затем маркеры становятся <mark>
+_MARK_START, _MARK_END = '\x02', '\x03'
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+_SQLITE_INSERT_TRIGGER = (
+    "CREATE TRIGGER IF NOT EXISTS report_fts_ai AFTER INSERT ON report BEGIN "
+    "INSERT INTO report_fts(rowid, description) VALUES (new.id, new.description); END"
+)
+_SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS report_fts USING fts5("
+    "description, content='report', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    _SQLITE_INSERT_TRIGGER,
+    "CREATE TRIGGER IF NOT EXISTS report_fts_ad AFTER DELETE ON report BEGIN "
+    "INSERT INTO report_fts(report_fts, rowid, description) VALUES ('delete', old.id, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS report_fts_au AFTER UPDATE OF description ON report BEGIN "
+    "INSERT INTO report_fts(report_fts, rowid, description) VALUES ('delete', old.id, old.description); "
+    "INSERT INTO report_fts(rowid, description) VALUES (new.id, new.description); END",
+]
+_POSTGRESQL_DDL = [
+    f"CREATE INDEX IF NOT EXISTS ix_report_description_fts ON report "
+    f"USING gin (to_tsvector('{TS_CONFIG}', description))",
+]
+
+for _statement in _SQLITE_DDL:
+    event.listen(Report.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+for _statement in _POSTGRESQL_DDL:
+    event.listen(Report.__table__, 'after_create', DDL(_statement).execute_if(dialect='postgresql'))
+event.listen(Report.__table__, 'before_drop',
+             DDL('DROP TABLE IF EXISTS report_fts').execute_if(dialect='sqlite'))
+
+
+@contextmanager
+def bulk_index_reports(conn):
+    """Массовая вставка в report внутри начатой транзакции записи.
+
+    В SQLite построчный триггер FTS5 в разы медленнее одного INSERT ... SELECT,
+    поэтому на время вставки триггер снимается, а новые строки индексируются в
+    конце. DDL в SQLite транзакционный: при откате триггер возвращается вместе со
+    всем остальным. В PostgreSQL GIN-индекс обновляется сам, обертка ничего не делает.
+    """
+    if conn.dialect.name != 'sqlite':
+        yield
+        return
+    last_id = conn.execute(text('SELECT coalesce(max(id), 0) FROM report')).scalar()
+    conn.exec_driver_sql('DROP TRIGGER IF EXISTS report_fts_ai')
+    try:
+        yield
+        conn.execute(text('INSERT INTO report_fts(rowid, description) '
+                          'SELECT id, description FROM report WHERE id > :last_id'), {'last_id': last_id})
+    finally:
+        conn.exec_driver_sql(_SQLITE_INSERT_TRIGGER)
+
+
+def search_available():
+    """Есть ли полнотекстовый поиск для текущей БД (маршрут отвечает 501, если нет)."""
+    return db.session.get_bind().dialect.name in SEARCH_DIALECTS
+
+
+def query_terms(q):
+    return _TOKEN.findall(q or '')
+
+
+def _fts5_query(terms):
+    # Каждое слово в кавычках: пользовательский ввод не интерпретируется как синтаксис FTS5
+    return ' '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+
+
+def _highlight(snippet):
+    return str(escape(snippet)).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+
+
+def search_reports(q, port_id=None, page=1, per_page=20):
+    """Отчеты, содержащие все слова запроса, по убыванию релевантности.
+
+    Только для SEARCH_DIALECTS: вызывающий код проверяет search_available().
+    """
+    terms = query_terms(q)
+    if not terms:
+        return []
+    params = {'start': _MARK_START, 'end': _MARK_END, 'limit': per_page,
+              'offset': (page - 1) * per_page, 'port_id': port_id}
+    port_filter = ' AND r.port_id = :port_id' if port_id is not None else ''
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        params['q'] = _fts5_query(terms)
+        sql = (
+            "SELECT r.id, r.port_id, r.user_email, r.timestamp, "
+            "snippet(report_fts, 0, :start, :end, '…', 16) AS snippet, bm25(report_fts) AS score "
+            "FROM report_fts JOIN report r ON r.id = report_fts.rowid "
+            f"WHERE report_fts MATCH :q{port_filter} "
+            "ORDER BY score, r.id LIMIT :limit OFFSET :offset"
+        )
+    elif dialect == 'postgresql':
+        params['q'] = ' '.join(terms)
+        params['options'] = f'StartSel={_MARK_START}, StopSel={_MARK_END}, MaxWords=32, MinWords=8'
+        sql = (
+            "SELECT r.id, r.port_id, r.user_email, r.timestamp, "
+            f"ts_headline('{TS_CONFIG}', r.description, query, :options) AS snippet, "
+            f"-ts_rank(to_tsvector('{TS_CONFIG}', r.description), query) AS score "
+            f"FROM report r, plainto_tsquery('{TS_CONFIG}', :q) AS query "
+            f"WHERE to_tsvector('{TS_CONFIG}', r.description) @@ query{port_filter} "
+            "ORDER BY score, r.id LIMIT :limit OFFSET :offset"
+        )
+    else:
+        raise RuntimeError(f'Full-text search is not available for {dialect}')
+    stmt = text(sql).columns(id=db.Integer, port_id=db.Integer, user_email=db.String, timestamp=db.DateTime,
+                             snippet=db.Text, score=db.Float)
+    rows = db.session.execute(stmt, params).all()
+    return [{
+        'id': row.id,
+        'port_id': row.port_id,
+        'user_email': row.user_email,
+        'timestamp': row.timestamp.isoformat() if row.timestamp else None,
+        'snippet': _highlight(row.snippet),
+        'rank': round(-row.score, 6),
+    } for row in rows]
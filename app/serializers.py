@@ -0,0 +1,108 @@
+import json
+from json.encoder import encode_basestring_ascii
+from flask import current_app, jsonify
+from flask.json.provider import DefaultJSONProvider
+from marshmallow import fields
+from app.models import Port, Report
+from app.schemas import PortSchema, ReportSchema
+
+# Быстрая сериализация списков портов и отчетов. Вместо ORM-объектов и
+# marshmallow.dump выбираются только нужные колонки, а строка результата
+# кодируется заранее скомпилированным шаблоном. Вывод байт в байт совпадает с
+# jsonify(schema.dump(...)) в режиме по умолчанию (sort_keys, компактные
+# разделители, ensure_ascii); в остальных режимах используется jsonify.
+
+_NON_FINITE = {'nan': 'NaN', 'inf': 'Infinity', '-inf': '-Infinity'}
+
+
+def _json_float(value):
+    text = repr(float(value))
+    # repr конечного float всегда заканчивается цифрой
+    return text if text[-1].isdigit() else _NON_FINITE[text]
+
+
+def _json_str(value):
+    return encode_basestring_ascii(str(value))
+
+
+def _json_datetime(value):
+    return '"' + value.isoformat() + '"'
+
+
+def _json_int(value):
+    return str(int(value))
+
+
+def _or_null(encode):
+    def encode_nullable(value):
+        return 'null' if value is None else encode(value)
+    return encode_nullable
+
+
+# Тип поля -> (плейсхолдер шаблона, кодировщик); None - значение подставляется как есть (%d)
+_ENCODERS = (
+    (fields.Integer, ('%d', None)),
+    (fields.Float, ('%s', _json_float)),
+    (fields.DateTime, ('%s', _json_datetime)),
+    (fields.String, ('%s', _json_str)),
+)
+
+
+class RawJSON:
+    """Уже закодированный фрагмент JSON внутри ответа json_response."""
+
+    def __init__(self, text):
+        self.text = text
+
+
+class FastSerializer:
+    """Кодировщик строк (колонок модели) в JSON-объекты схемы marshmallow."""
+
+    def __init__(self, schema, model):
+        self.names = sorted(schema.dump_fields)
+        self.columns = [getattr(model, name) for name in self.names]
+        parts, encoders = [], []
+        for index, name in enumerate(self.names):
+            field = schema.dump_fields[name]
+            placeholder, encode = next(encoder for cls, encoder in _ENCODERS if isinstance(field, cls))
+            if self.columns[index].nullable:
+                placeholder, encode = '%s', _or_null(encode or _json_int)
+            parts.append(f'{json.dumps(name)}:{placeholder}')
+            encoders.append(encode)
+        template = '{' + ','.join(parts) + '}'
+        encoders = tuple(encoders)
+
+        # Один %-шаблон на схему: без промежуточных dict и json.dumps на каждую строку
+        def encode_row(row):
+            return template % tuple([value if encode is None else encode(value)
+                                     for value, encode in zip(row, encoders)])
+        self.encode_row = encode_row
+
+    def encode_rows(self, rows):
+        return '[' + ','.join([self.encode_row(row) for row in rows]) + ']'
+
+
+port_serializer = FastSerializer(PortSchema(), Port)
+report_serializer = FastSerializer(ReportSchema(), Report)
+
+
+def _fast_json_enabled():
+    provider = current_app.json
+    if not isinstance(provider, DefaultJSONProvider) or type(provider).dumps is not DefaultJSONProvider.dumps:
+        return False
+    compact = provider.compact is not False and not (provider.compact is None and current_app.debug)
+    return compact and provider.sort_keys and provider.ensure_ascii
+
+
+def json_response(payload, status=200):
+    """То же, что jsonify(payload), но значения RawJSON вставляются без перекодирования."""
+    if not _fast_json_enabled():
+        plain = {key: json.loads(value.text) if isinstance(value, RawJSON) else value
+                 for key, value in payload.items()}
+        return jsonify(plain), status
+    dumps = current_app.json.dumps
+    body = ','.join(
+        f'{json.dumps(key)}:{value.text if isinstance(value, RawJSON) else dumps(value, separators=(",", ":"))}'
+        for key, value in sorted(payload.items())
+    )
+    return current_app.response_class('{' + body + '}\n', mimetype=current_app.json.mimetype), status
@@ -0,0 +1,122 @@
+import math
+from collections import namedtuple
+import numpy as np
+from sqlalchemy import and_, or_, select
+from app import db
+from app.models import Port, GRID_CELL_DEG, GRID_COLS, GRID_ROWS
+
+# Пространственный поиск по портам. Кандидаты отбираются по индексу
+# (grid_cell, lat, lng) диапазонами номеров ячеек сетки, затем уточняются
+# векторизованным haversine в numpy.
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEG_LAT = math.pi * EARTH_RADIUS_KM / 180
+MAX_RADIUS_KM = math.pi * EARTH_RADIUS_KM  # Дальше половины окружности точек нет
+MAX_CELL_RANGES = 64  # Для больших областей диапазоны ячеек не помогают: только координаты
+NEAR_DEFAULT_K = 10
+NEAR_MAX_K = 100
+
+BBox = namedtuple('BBox', 'min_lat min_lng max_lat max_lng')
+
+
+def parse_bbox(raw):
+    """bbox=min_lng,min_lat,max_lng,max_lat (порядок GeoJSON). min_lng > max_lng - через 180-й меридиан."""
+    try:
+        min_lng, min_lat, max_lng, max_lat = (float(value) for value in raw.split(','))
+    except ValueError:
+        raise ValueError('bbox must be min_lng,min_lat,max_lng,max_lat')
+    if not (-90 <= min_lat <= max_lat <= 90):
+        raise ValueError('bbox latitudes must satisfy -90 <= min_lat <= max_lat <= 90')
+    if not (-180 <= min_lng <= 180 and -180 <= max_lng <= 180):
+        raise ValueError('bbox longitudes must be within [-180, 180]')
+    return BBox(min_lat, min_lng, max_lat, max_lng)
+
+
+def radius_bbox(lat, lng, radius_km):
+    """Описанный прямоугольник круга радиуса radius_km."""
+    dlat = radius_km / KM_PER_DEG_LAT
+    min_lat, max_lat = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+    widest = max(abs(min_lat), abs(max_lat))
+    if widest >= 90:
+        return BBox(min_lat, -180.0, max_lat, 180.0)  # Круг накрывает полюс
+    dlng = dlat / math.cos(math.radians(widest))
+    if dlng >= 180:
+        return BBox(min_lat, -180.0, max_lat, 180.0)
+    wrap = lambda value: (value + 180) % 360 - 180
+    min_lng = lng - dlng if lng - dlng >= -180 else wrap(lng - dlng)
+    max_lng = lng + dlng if lng + dlng <= 180 else wrap(lng + dlng)
+    return BBox(min_lat, min_lng, max_lat, max_lng)
+
+
+def _lng_spans(bbox):
+    if bbox.min_lng <= bbox.max_lng:
+        return [(bbox.min_lng, bbox.max_lng)]
+    return [(bbox.min_lng, 180.0), (-180.0, bbox.max_lng)]
+
+
+def _grid_index(value, offset, limit):
+    return min(int((value + offset) // GRID_CELL_DEG), limit - 1)
+
+
+def cell_ranges(bbox):
+    """Диапазоны [lo, hi] номеров ячеек, покрывающих bbox, или None, если их слишком много."""
+    first_row = _grid_index(bbox.min_lat, 90, GRID_ROWS)
+    last_row = _grid_index(bbox.max_lat, 90, GRID_ROWS)
+    ranges = []
+    for min_lng, max_lng in _lng_spans(bbox):
+        first_col = _grid_index(min_lng, 180, GRID_COLS)
+        last_col = _grid_index(max_lng, 180, GRID_COLS)
+        if first_col == 0 and last_col == GRID_COLS - 1:
+            # Полные строки смежны: один диапазон на всю полосу широт
+            ranges.append((first_row * GRID_COLS, last_row * GRID_COLS + GRID_COLS - 1))
+            continue
+        ranges.extend((row * GRID_COLS + first_col, row * GRID_COLS + last_col)
+                      for row in range(first_row, last_row + 1))
+        if len(ranges) > MAX_CELL_RANGES:
+            return None
+    return ranges
+
+
+def bbox_filter(bbox):
+    """Условие WHERE для портов внутри bbox."""
+    conditions = [Port.lat.between(bbox.min_lat, bbox.max_lat),
+                  or_(*(Port.lng.between(lo, hi) for lo, hi in _lng_spans(bbox)))]
+    ranges = cell_ranges(bbox)
+    if ranges is not None:
+        conditions.insert(0, or_(*(Port.grid_cell.between(lo, hi) for lo, hi in ranges)))
+    return and_(*conditions)
+
+
+def haversine_km(lat, lng, lats, lngs):
+    lat1, lng1 = math.radians(lat), math.radians(lng)
+    lats, lngs = np.radians(lats), np.radians(lngs)
+    a = (np.sin((lats - lat1) / 2) ** 2
+         + math.cos(lat1) * np.cos(lats) * np.sin((lngs - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _candidates(bbox):
+    rows = db.session.execute(select(Port.id, Port.lat, Port.lng).where(bbox_filter(bbox))).all()
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+    data = np.array(rows, dtype=float)
+    return data[:, 0].astype(np.int64), data[:, 1], data[:, 2]
+
+
+def nearest(lat, lng, k=NEAR_DEFAULT_K, radius_km=None):
+    """[(port_id, distance_km)] ближайших портов по возрастанию расстояния.
+
+    Без radius_km радиус поиска растет от размера ячейки, пока внутри него
+    не окажется k портов: найденные внутри радиуса ближе любых за его пределами.
+    """
+    radius = radius_km if radius_km is not None else GRID_CELL_DEG * KM_PER_DEG_LAT
+    while True:
+        ids, lats, lngs = _candidates(radius_bbox(lat, lng, radius))
+        distances = haversine_km(lat, lng, lats, lngs)
+        inside = distances <= radius
+        if radius_km is not None or inside.sum() >= k or radius >= MAX_RADIUS_KM:
+            break
+        radius = min(radius * 4, MAX_RADIUS_KM)
+    ids, distances = ids[inside], distances[inside]
+    order = np.argsort(distances, kind='stable')[:k]
+    return [(int(ids[i]), float(distances[i])) for i in order]
@@ -0,0 +1,54 @@
+from datetime import datetime
+from sqlalchemy import event, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import Port, Subscription
+
+# Подписки на тревоги по порту. Добавление - один INSERT с проверкой уникальности
+# индексом, рассылка читает получателей чанками по (port_id, id).
+
+
+def add_subscription(port_id, email):
+    """Добавляет подписку (без commit). False - такая подписка уже есть."""
+    table = Subscription.__table__
+    values = {'port_id': port_id, 'email': email, 'created_at': datetime.utcnow()}
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        result = db.session.execute(insert(table).values(**values).on_conflict_do_nothing(
+            index_elements=[table.c.port_id, table.c.email]))
+        return result.rowcount == 1
+    try:
+        with db.session.begin_nested():
+            db.session.execute(table.insert().values(**values))
+    except IntegrityError:
+        return False
+    return True
+
+
+def iter_subscriber_batches(port_id, size):
+    """Email подписчиков порта списками по ``size`` (keyset по id, без OFFSET)."""
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(Subscription.id, Subscription.email)
+            .where(Subscription.port_id == port_id, Subscription.id > last_id)
+            .order_by(Subscription.id)
+            .limit(size)
+        ).all()
+        if not rows:
+            return
+        yield [row.email for row in rows]
+        if len(rows) < size:
+            return
+        last_id = rows[-1].id
+
+
+@event.listens_for(db.session, 'after_flush')
+def _delete_port_subscriptions(session, flush_context):
+    deleted_ids = [obj.id for obj in session.deleted if isinstance(obj, Port)]
+    if deleted_ids:
+        # ON DELETE CASCADE не срабатывает в SQLite без PRAGMA foreign_keys
+        session.connection().execute(
+            Subscription.__table__.delete().where(Subscription.port_id.in_(deleted_ids)))
@@ -0,0 +1,235 @@
+import json
+import math
+from datetime import datetime
+import click
+import numpy as np
+from flask import Blueprint
+from sqlalchemy import event, literal, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from app.models import Port, MapTile, MapTileState, committed_value
+from app.spatial import BBox, bbox_filter
+
+# Кластеризованные тайлы карты z/x/y (Web Mercator) в GeoJSON. Тайлы до
+# TILE_CACHE_MAX_ZOOM хранятся в map_tile; запись порта в том же flush сбрасывает
+# только тайлы, в которые он попадал до и после изменения: у каждого из них растет
+# своя generation, а тело удаляется. Построенный тайл сохраняется, только если
+# generation этого тайла не изменилась за время построения, поэтому гонка с записью
+# не оставляет устаревший тайл в кэше, а записи в другие тайлы сборку не отменяют.
+# MapTileState.generation - эпоха полного сброса (flask tiles clear, seed).
+
+TILE_FORMAT_VERSION = '1'  # Менять вместе с форматом/кластеризацией: старые тайлы перестают совпадать
+TILE_MAX_ZOOM = 20
+TILE_CACHE_MAX_ZOOM = 12  # Глубже тайлы малы и строятся по индексу на лету
+CLUSTER_MAX_ZOOM = 14  # Глубже каждый порт - отдельная точка
+CLUSTER_CELLS = 16  # Сетка кластеризации внутри тайла: 16x16 ячеек по 32px тайла 512px
+MERCATOR_MAX_LAT = 85.05112878
+STATE_ID = 1
+TILE_FIELDS = ('lat', 'lng', 'green_score', 'name')
+
+tiles_bp = Blueprint('tiles', __name__)
+
+
+def _mercator_y(lat):
+    lat = np.clip(lat, -MERCATOR_MAX_LAT, MERCATOR_MAX_LAT)
+    return (1 - np.log(np.tan(np.radians(lat)) + 1 / np.cos(np.radians(lat))) / math.pi) / 2
+
+
+def _tile_lat(y, n):
+    return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+
+
+def tile_bbox(z, x, y):
+    n = 2 ** z
+    # Крайние ряды тайлов забирают и приполярные порты за пределами проекции
+    min_lat = -90.0 if y == n - 1 else _tile_lat(y + 1, n)
+    max_lat = 90.0 if y == 0 else _tile_lat(y, n)
+    return BBox(min_lat, x / n * 360 - 180, max_lat, (x + 1) / n * 360 - 180)
+
+
+def tile_position(lats, lngs, z):
+    """Дробные координаты тайла (x, y) на уровне z; целая часть - номер тайла."""
+    n = 2 ** z
+    tx = np.clip((np.asarray(lngs, dtype=float) + 180) / 360 * n, 0, n - 1e-9)
+    ty = np.clip(_mercator_y(np.asarray(lats, dtype=float)) * n, 0, n - 1e-9)
+    return tx, ty
+
+
+def tiles_for(lat, lng, max_zoom=TILE_CACHE_MAX_ZOOM):
+    keys = []
+    for z in range(max_zoom + 1):
+        tx, ty = tile_position([lat], [lng], z)
+        keys.append((z, int(tx[0]), int(ty[0])))
+    return keys
+
+
+def build_tile(z, x, y):
+    """GeoJSON FeatureCollection тайла: кластеры с числом портов и средним green_score."""
+    rows = db.session.execute(
+        select(Port.id, Port.name, Port.lat, Port.lng, Port.green_score)
+        .where(bbox_filter(tile_bbox(z, x, y)))
+        .order_by(Port.id)
+    ).all()
+    features = []
+    if rows:
+        ids = np.array([row.id for row in rows])
+        lats = np.array([row.lat for row in rows], dtype=float)
+        lngs = np.array([row.lng for row in rows], dtype=float)
+        scores = np.array([row.green_score for row in rows], dtype=float)
+        tx, ty = tile_position(lats, lngs, z)
+        # Порт на границе попадает в bbox двух тайлов, но принадлежит одному
+        own = (tx.astype(int) == x) & (ty.astype(int) == y)
+        if z > CLUSTER_MAX_ZOOM:
+            cells = np.arange(len(rows))
+        else:
+            cells = ((ty - y) * CLUSTER_CELLS).astype(int) * CLUSTER_CELLS + ((tx - x) * CLUSTER_CELLS).astype(int)
+        names = {row.id: row.name for row in rows}
+        cells, ids, lats, lngs, scores = cells[own], ids[own], lats[own], lngs[own], scores[own]
+        keys, inverse, counts = np.unique(cells, return_inverse=True, return_counts=True)
+        mean_lat = np.bincount(inverse, lats) / counts
+        mean_lng = np.bincount(inverse, lngs) / counts
+        mean_score = np.bincount(inverse, scores) / counts
+        first = np.full(len(keys), len(ids))
+        np.minimum.at(first, inverse, np.arange(len(ids)))
+        for i in range(len(keys)):
+            properties = {'count': int(counts[i]), 'mean_green_score': round(float(mean_score[i]), 2)}
+            if counts[i] == 1:
+                port_id = int(ids[first[i]])
+                properties.update(port_id=port_id, name=names[port_id])
+            features.append({
+                'type': 'Feature',
+                'geometry': {'type': 'Point',
+                             'coordinates': [round(float(mean_lng[i]), 6), round(float(mean_lat[i]), 6)]},
+                'properties': properties,
+            })
+    return json.dumps({'type': 'FeatureCollection', 'features': features}, separators=(',', ':'))
+
+
+def _epoch(conn):
+    return conn.execute(select(MapTileState.generation).where(MapTileState.id == STATE_ID)).scalar() or 0
+
+
+def get_tile(z, x, y):
+    """Тело тайла; кэшируемые уровни берутся из map_tile или строятся и сохраняются."""
+    if z > TILE_CACHE_MAX_ZOOM:
+        return build_tile(z, x, y)
+    conn = db.session.connection()
+    table = MapTile.__table__
+    cached = conn.execute(
+        select(table.c.body, table.c.format_version, table.c.generation)
+        .where(table.c.z == z, table.c.x == x, table.c.y == y)
+    ).first()
+    if cached is not None and cached.body is not None and cached.format_version == TILE_FORMAT_VERSION:
+        return cached.body
+    # Строки еще нет: вставка сверяется с эпохой полного сброса
+    epoch = _epoch(conn) if cached is None else None
+    body = build_tile(z, x, y)
+    if cached is None:
+        _insert_tile(conn, z, x, y, body, epoch)
+    else:
+        _update_tile(conn, z, x, y, body, cached.generation)
+    db.session.commit()
+    return body
+
+
+def _update_tile(conn, z, x, y, body, generation):
+    # Только при неизменной generation тайла: запись порта в тот же тайл за время
+    # построения ее увеличила. Незавершенная запись держит блокировку строки, и UPDATE
+    # перепроверяет условие уже после ее commit
+    table = MapTile.__table__
+    conn.execute(table.update()
+                 .where(table.c.z == z, table.c.x == x, table.c.y == y, table.c.generation == generation)
+                 .values(format_version=TILE_FORMAT_VERSION, body=body, built_at=datetime.utcnow()))
+
+
+def _insert_tile(conn, z, x, y, body, epoch):
+    table = MapTile.__table__
+    state = MapTileState.__table__
+    values = {'z': z, 'x': x, 'y': y, 'format_version': TILE_FORMAT_VERSION,
+              'generation': 0, 'body': body, 'built_at': datetime.utcnow()}
+    dialect = conn.dialect.name
+    if dialect not in ('sqlite', 'postgresql'):
+        exists = conn.execute(select(table.c.z).where(table.c.z == z, table.c.x == x, table.c.y == y)).first()
+        if exists is None and _epoch(conn) == epoch:
+            conn.execute(table.insert().values(**values))
+        return
+    # Строку за время построения мог создать сброс тайла - тогда вставка ничего не делает;
+    # полный сброс (эпоха) проверяется под FOR SHARE, он ждет незавершенный сброс
+    source = select(*(literal(value).label(name) for name, value in values.items()))
+    if epoch:
+        source = source.where(state.c.id == STATE_ID, state.c.generation == epoch).with_for_update(read=True)
+    else:
+        source = source.where(~select(state.c.id).where(state.c.generation != 0).exists())
+    insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+    conn.execute(insert(table).from_select(list(values), source).on_conflict_do_nothing(
+        index_elements=[table.c.z, table.c.x, table.c.y]))
+
+
+def invalidate_tiles(conn, keys=None):
+    """Сбрасывает тайлы keys (все при None).
+
+    Тайлу из keys увеличивается его generation, тело удаляется (строка остается
+    отметкой сброса). Сборки других тайлов, идущие параллельно, это не задевает.
+    """
+    table = MapTile.__table__
+    if keys is None:
+        state = MapTileState.__table__
+        # Эпоха - до удаления: строка состояния блокируется до конца транзакции
+        updated = conn.execute(state.update().where(state.c.id == STATE_ID)
+                               .values(generation=state.c.generation + 1)).rowcount
+        if not updated:
+            conn.execute(state.insert().values(id=STATE_ID, generation=1))
+        conn.execute(table.delete())
+        return
+    # Порядок ключей - одинаковый порядок блокировок строк у параллельных записей
+    keys = sorted(keys)
+    if not keys:
+        return
+    now = datetime.utcnow()
+    rows = [{'z': z, 'x': x, 'y': y, 'format_version': TILE_FORMAT_VERSION, 'generation': 1,
+             'body': None, 'built_at': now} for z, x, y in keys]
+    dialect = conn.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        stmt = insert(table)
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=[table.c.z, table.c.x, table.c.y],
+            set_={'generation': table.c.generation + 1, 'body': None, 'built_at': stmt.excluded.built_at}
+        ), rows)
+        return
+    existing = set()
+    for start in range(0, len(keys), 500):
+        chunk = keys[start:start + 500]
+        where = tuple_(table.c.z, table.c.x, table.c.y).in_(chunk)
+        conn.execute(table.update().where(where).values(generation=table.c.generation + 1, body=None, built_at=now))
+        existing.update(tuple(row) for row in conn.execute(select(table.c.z, table.c.x, table.c.y).where(where)))
+    missing = [row for row in rows if (row['z'], row['x'], row['y']) not in existing]
+    if missing:
+        conn.execute(table.insert(), missing)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _invalidate_touched_tiles(session, flush_context):
+    touched = set()
+    for obj in session.new:
+        if isinstance(obj, Port):
+            touched.update(tiles_for(obj.lat, obj.lng))
+    for obj in session.dirty:
+        if isinstance(obj, Port) and session.is_modified(obj, include_collections=False):
+            old = {attr: committed_value(obj, attr) for attr in TILE_FIELDS}
+            if old != {attr: getattr(obj, attr) for attr in TILE_FIELDS}:
+                touched.update(tiles_for(old['lat'], old['lng']))
+                touched.update(tiles_for(obj.lat, obj.lng))
+    for obj in session.deleted:
+        if isinstance(obj, Port):
+            touched.update(tiles_for(committed_value(obj, 'lat'), committed_value(obj, 'lng')))
+    if touched:
+        invalidate_tiles(session.connection(), touched)
+
+
+@tiles_bp.cli.command('clear')
+def clear_command():
+    """Сбросить кэш тайлов карты."""
+    invalidate_tiles(db.session.connection())
+    db.session.commit()
+    click.echo('Map tile cache cleared')
@@ -0,0 +1,163 @@
+from datetime import datetime, timedelta
+from sqlalchemy import event, select, func, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from app.models import Port, PortMeasurement, PortMeasurementRollup
+
+# История метрик портов: сырой ряд PortMeasurement плюс часовые и суточные
+# свертки, которые обновляются инкрементально в том же flush, что и порт.
+
+METRICS = ['air_quality', 'water_quality', 'co2_emissions', 'incidents']
+RESOLUTIONS = {
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+}
+RAW_MAX_SPAN = timedelta(days=2)
+MAX_HISTORY_POINTS = 1000
+
+
+def bucket_start(timestamp, resolution):
+    if resolution == 'hour':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def choose_resolution(start, end):
+    """Самая мелкая гранулярность, при которой диапазон укладывается в MAX_HISTORY_POINTS."""
+    span = end - start
+    if span <= RAW_MAX_SPAN:
+        return 'raw'
+    if span / RESOLUTIONS['hour'] <= MAX_HISTORY_POINTS:
+        return 'hour'
+    return 'day'
+
+
+def _metrics_changed(obj):
+    state = inspect(obj)
+    return any(state.attrs[metric].history.has_changes() for metric in METRICS)
+
+
+def _rollup_rows(measurements):
+    rollups = {}
+    for row in measurements:
+        for resolution in RESOLUTIONS:
+            key = (row['port_id'], resolution, bucket_start(row['timestamp'], resolution))
+            rollup = rollups.get(key)
+            if rollup is None:
+                rollup = {'port_id': key[0], 'resolution': resolution, 'bucket_start': key[2], 'samples': 0}
+                for metric in METRICS:
+                    rollup[f'{metric}_sum'] = 0.0
+                    rollup[f'{metric}_min'] = row[metric]
+                    rollup[f'{metric}_max'] = row[metric]
+                rollups[key] = rollup
+            rollup['samples'] += 1
+            for metric in METRICS:
+                rollup[f'{metric}_sum'] += row[metric]
+                rollup[f'{metric}_min'] = min(rollup[f'{metric}_min'], row[metric])
+                rollup[f'{metric}_max'] = max(rollup[f'{metric}_max'], row[metric])
+    return list(rollups.values())
+
+
+def _upsert_rollups(conn, rows):
+    table = PortMeasurementRollup.__table__
+    dialect = conn.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        # В SQLite двухаргументные min/max скалярные, в PostgreSQL - least/greatest
+        least = func.min if dialect == 'sqlite' else func.least
+        greatest = func.max if dialect == 'sqlite' else func.greatest
+        stmt = insert(table)
+        values = {'samples': table.c.samples + stmt.excluded.samples}
+        for metric in METRICS:
+            values[f'{metric}_sum'] = table.c[f'{metric}_sum'] + stmt.excluded[f'{metric}_sum']
+            values[f'{metric}_min'] = least(table.c[f'{metric}_min'], stmt.excluded[f'{metric}_min'])
+            values[f'{metric}_max'] = greatest(table.c[f'{metric}_max'], stmt.excluded[f'{metric}_max'])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.port_id, table.c.resolution, table.c.bucket_start],
+            set_=values
+        )
+        conn.execute(stmt, rows)
+        return
+    for row in rows:
+        key = (table.c.port_id == row['port_id'], table.c.resolution == row['resolution'],
+               table.c.bucket_start == row['bucket_start'])
+        current = conn.execute(select(table).where(*key)).mappings().first()
+        if current is None:
+            conn.execute(table.insert().values(**row))
+            continue
+        values = {'samples': current['samples'] + row['samples']}
+        for metric in METRICS:
+            values[f'{metric}_sum'] = current[f'{metric}_sum'] + row[f'{metric}_sum']
+            values[f'{metric}_min'] = min(current[f'{metric}_min'], row[f'{metric}_min'])
+            values[f'{metric}_max'] = max(current[f'{metric}_max'], row[f'{metric}_max'])
+        conn.execute(table.update().where(*key).values(**values))
+
+
+def record_measurements(conn, measurements):
+    """Дописывает значения метрик в ряд и обновляет свертки.
+
+    ``measurements`` - список dict с port_id, timestamp и значениями METRICS.
+    """
+    if not measurements:
+        return
+    conn.execute(PortMeasurement.__table__.insert(), measurements)
+    _upsert_rollups(conn, _rollup_rows(measurements))
+
+
+@event.listens_for(db.session, 'after_flush')
+def _record_port_history(session, flush_context):
+    now = datetime.utcnow()
+    measurements = []
+    deleted_ids = []
+    for obj in session.new:
+        if isinstance(obj, Port):
+            measurements.append(dict({metric: getattr(obj, metric) for metric in METRICS},
+                                     port_id=obj.id, timestamp=now))
+    for obj in session.dirty:
+        if isinstance(obj, Port) and _metrics_changed(obj):
+            measurements.append(dict({metric: getattr(obj, metric) for metric in METRICS},
+                                     port_id=obj.id, timestamp=now))
+    for obj in session.deleted:
+        if isinstance(obj, Port):
+            deleted_ids.append(obj.id)
+    conn = session.connection() if measurements or deleted_ids else None
+    if deleted_ids:
+        # ON DELETE CASCADE не срабатывает в SQLite без PRAGMA foreign_keys
+        conn.execute(PortMeasurement.__table__.delete().where(PortMeasurement.port_id.in_(deleted_ids)))
+        conn.execute(PortMeasurementRollup.__table__.delete()
+                     .where(PortMeasurementRollup.port_id.in_(deleted_ids)))
+    record_measurements(conn, measurements)
+
+
+def query_history(port_id, start, end, resolution):
+    if resolution == 'raw':
+        rows = db.session.execute(
+            select(PortMeasurement)
+            .where(PortMeasurement.port_id == port_id,
+                   PortMeasurement.timestamp >= start,
+                   PortMeasurement.timestamp <= end)
+            .order_by(PortMeasurement.timestamp)
+            .limit(MAX_HISTORY_POINTS)
+        ).scalars()
+        return [dict({metric: getattr(row, metric) for metric in METRICS},
+                     timestamp=row.timestamp.isoformat()) for row in rows]
+
+    rollup = PortMeasurementRollup
+    rows = db.session.execute(
+        select(rollup)
+        .where(rollup.port_id == port_id,
+               rollup.resolution == resolution,
+               rollup.bucket_start >= bucket_start(start, resolution),
+               rollup.bucket_start <= end)
+        .order_by(rollup.bucket_start)
+        .limit(MAX_HISTORY_POINTS)
+    ).scalars()
+    points = []
+    for row in rows:
+        point = {'timestamp': row.bucket_start.isoformat(), 'samples': row.samples}
+        for metric in METRICS:
+            point[metric] = round(getattr(row, f'{metric}_sum') / row.samples, 2)
+            point[f'{metric}_min'] = getattr(row, f'{metric}_min')
+            point[f'{metric}_max'] = getattr(row, f'{metric}_max')
+        points.append(point)
+    return points
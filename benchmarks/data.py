@@ -0,0 +1,143 @@
+"""Синтетические данные для бенчмарков: порты и станции мониторинга Каспия, отчеты граждан, PDF."""
+import io
+import json
+import random
+import zipfile
+from datetime import datetime, timedelta
+from app import db
+from app.aggregates import rebuild_aggregates
+from app.models import User, Port, Report
+from app.search import bulk_index_reports
+from app.tiles import invalidate_tiles
+from app.timeseries import record_measurements
+
+SCALES = {'1k': 1000, '100k': 100000, '1m': 1000000}
+REPORTS_PER_PORT = 2
+HISTORY_PORTS = 50  # Портов с месячной почасовой историей метрик
+HISTORY_DAYS = 30
+CHUNK = 10000
+ADMIN = ('bench-admin', 'bench-pass')
+
+# Опорные порты; станции мониторинга разбрасываются вокруг них по акватории
+CASPIAN_PORTS = [
+    ('Baku', 40.37, 49.89), ('Aktau', 43.65, 51.16), ('Turkmenbashi', 40.02, 52.97),
+    ('Makhachkala', 42.97, 47.50), ('Astrakhan', 46.35, 48.04), ('Anzali', 37.47, 49.46),
+    ('Nowshahr', 36.65, 51.50), ('Amirabad', 36.87, 54.02), ('Atyrau', 47.10, 51.92),
+    ('Olya', 45.78, 47.55), ('Alat', 39.95, 49.40), ('Fort-Shevchenko', 44.51, 50.26),
+]
+DESCRIPTIONS = [
+    'Oil film on the water near the {port} pier',
+    'Strong smell of fuel at the {port} terminal',
+    'Dead fish washed ashore north of {port}',
+    'Black smoke from a tanker moored at {port}',
+    'Разлив нефти у причала {port}',
+    'Мусор и пластик в акватории порта {port}',
+    'Night-time noise and dust from bulk cargo handling in {port}',
+]
+
+
+def make_pdf(pages):
+    """Минимальный PDF с текстом на каждой странице (как в tests/test_app.py)."""
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>']
+    kids = ' '.join(f'{4 + 2 * i} 0 R' for i in range(len(pages)))
+    objects.append(f'<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>'.encode())
+    objects.append(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+    for i, text in enumerate(pages):
+        lines = ''.join(f'({line}) Tj T* ' for line in text.split('\n'))
+        stream = f'BT /F1 12 Tf 14 TL 50 750 Td {lines}ET'
+        objects.append(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] '
+                       f'/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>'.encode())
+        objects.append(f'<< /Length {len(stream)} >>\nstream\n{stream}\nendstream'.encode())
+    out = b'%PDF-1.4\n'
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f'{number} 0 obj\n'.encode() + body + b'\nendobj\n'
+    xref = len(out)
+    out += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    out += ''.join(f'{offset:010d} 00000 n \n' for offset in offsets).encode()
+    out += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode()
+    return out
+
+
+def report_pdf(rng, pages=3):
+    """Отчет-PDF: сводка на последней странице, перед ней страницы с текстом."""
+    filler = ['Monitoring notes\n' + '\n'.join(f'Sample {i}: nominal' for i in range(20))] * (pages - 1)
+    summary = (f'Summary\nAir quality: {rng.uniform(5, 80):.1f}\nWater quality: {rng.uniform(2, 40):.1f}\n'
+               f'CO2 emissions: {rng.uniform(100, 1500):.1f}\nIncidents: {rng.randint(0, 7)}')
+    return make_pdf(filler + [summary])
+
+
+def report_zip(rng, port_ids, files=5):
+    buffer = io.BytesIO()
+    manifest = {}
+    with zipfile.ZipFile(buffer, 'w') as bundle:
+        for i in range(files):
+            name = f'report-{i}.pdf'
+            bundle.writestr(name, report_pdf(rng, pages=2))
+            manifest[name] = rng.choice(port_ids)
+        bundle.writestr('manifest.json', json.dumps(manifest))
+    return buffer.getvalue()
+
+
+def _port_rows(rng, start, count):
+    rows = []
+    for number in range(start, start + count):
+        base, lat, lng = CASPIAN_PORTS[number % len(CASPIAN_PORTS)]
+        lat, lng = lat + rng.gauss(0, 0.6), lng + rng.gauss(0, 0.6)
+        metrics = {
+            'air_quality': round(rng.uniform(0, 90), 2),
+            'water_quality': round(rng.uniform(0, 45), 2),
+            'co2_emissions': round(rng.uniform(50, 1800), 1),
+            'incidents': rng.randint(0, 9),
+        }
+        rows.append(dict(
+            metrics, name=f'{base} station {number}', lat=lat, lng=lng,
+            green_score=Port.calculate_green_score(metrics['air_quality'], metrics['water_quality'],
+                                                    metrics['co2_emissions'], metrics['incidents']),
+            grid_cell=Port.calculate_grid_cell(lat, lng),
+        ))
+    return rows
+
+
+def generate(scale, seed=1):
+    """Заполняет пустую БД: порты, отчеты, история метрик, администратор.
+
+    Вставка идет Core-запросами пачками по CHUNK строк; ORM-события при этом не
+    срабатывают, поэтому green_score и grid_cell считаются здесь, а агрегаты
+    /ports/stats и кэш тайлов пересчитываются в конце.
+    """
+    total = SCALES[scale]
+    rng = random.Random(seed)
+    conn = db.session.connection()
+    admin = User(username=ADMIN[0], role='admin')
+    admin.set_password(ADMIN[1])
+    db.session.add(admin)
+    for start in range(0, total, CHUNK):
+        conn.execute(Port.__table__.insert(), _port_rows(rng, start, min(CHUNK, total - start)))
+
+    epoch = datetime(2026, 1, 1)
+    span = int(timedelta(days=300).total_seconds())
+    with bulk_index_reports(conn):
+        for start in range(0, total * REPORTS_PER_PORT, CHUNK):
+            rows = []
+            for number in range(start, min(start + CHUNK, total * REPORTS_PER_PORT)):
+                port_id = rng.randint(1, total)
+                base = CASPIAN_PORTS[(port_id - 1) % len(CASPIAN_PORTS)][0]
+                rows.append({'port_id': port_id, 'user_email': f'citizen{number % 5000}@example.com',
+                             'description': rng.choice(DESCRIPTIONS).format(port=base),
+                             'timestamp': epoch + timedelta(seconds=rng.randrange(span))})
+            conn.execute(Report.__table__.insert(), rows)
+
+    history_start = epoch + timedelta(days=300 - HISTORY_DAYS)
+    for port_id in range(1, min(HISTORY_PORTS, total) + 1):
+        record_measurements(conn, [{
+            'port_id': port_id, 'timestamp': history_start + timedelta(hours=hour),
+            'air_quality': rng.uniform(0, 90), 'water_quality': rng.uniform(0, 45),
+            'co2_emissions': rng.uniform(50, 1800), 'incidents': rng.randint(0, 9),
+        } for hour in range(HISTORY_DAYS * 24)])
+
+    rebuild_aggregates(conn)
+    invalidate_tiles(conn)
+    db.session.commit()
+    return {'ports': total, 'reports': total * REPORTS_PER_PORT}
@@ -0,0 +1,380 @@
+"""Нагрузочный бенчмарк всех маршрутов /api на синтетических данных Каспия.
+
+Запуск из корня репозитория:
+  python benchmarks/run.py --scale 1k --output baseline.json
+  python benchmarks/run.py --scale 100k --mode http --spawn --concurrency 16 --output baseline.json
+  python benchmarks/run.py --scale 1k --compare baseline.json --threshold 0.2
+
+Режим client гоняет запросы через Flask test client по одному и считает SQL-запросы
+на маршрут; режим http - параллельный генератор нагрузки против gunicorn (--spawn)
+или уже запущенного сервера (--url). С --compare процесс завершается с кодом 1,
+если p50 или p99 какого-либо маршрута хуже сохраненного базового прогона больше
+чем на --threshold.
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import event  # noqa: E402
+from app import create_app, db  # noqa: E402
+from benchmarks.data import ADMIN, SCALES, generate  # noqa: E402
+from benchmarks.scenarios import select  # noqa: E402
+from config import Config  # noqa: E402
+
+DATABASE_ENV = 'BENCHMARK_DATABASE'
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), 'caspian-bench')
+
+
+class BenchConfig(Config):
+    # Файл SQLite с синтетическими данными; DATABASE_URL не используется, чтобы не
+    # попасть в рабочую БД
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.environ.get(DATABASE_ENV, os.path.join(DEFAULT_DATA_DIR, 'run.db'))
+    # Разбор PDF в запросе: латентность upload_report включает разбор
+    REPORT_JOBS_EAGER = True
+    MAIL_SUPPRESS_SEND = True
+
+
+def server_app():
+    """Точка входа для gunicorn: benchmarks.run:server_app()."""
+    return create_app(BenchConfig)
+
+
+def bench_app(path):
+    config = type('RunConfig', (BenchConfig,), {'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}'})
+    return create_app(config)
+
+
+def _discard_sidecars(path):
+    # WAL и индекс прошлого прогона иначе применятся к новому файлу с тем же именем и испортят его
+    for suffix in ('-wal', '-shm', '-journal'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def prepare_database(scale, data_dir, regenerate=False):
+    """Рабочая копия БД нужного масштаба; сгенерированный оригинал кэшируется в data_dir."""
+    os.makedirs(data_dir, exist_ok=True)
+    cached = os.path.join(data_dir, f'caspian-{scale}.db')
+    if regenerate or not os.path.exists(cached):
+        building = cached + '.building'
+        if os.path.exists(building):
+            os.remove(building)
+        _discard_sidecars(building)
+        started = time.perf_counter()
+        app = bench_app(building)
+        with app.app_context():
+            db.create_all()
+            counts = generate(scale)
+            db.engine.dispose()
+        os.replace(building, cached)
+        print(f'Generated {counts["ports"]} ports and {counts["reports"]} reports '
+              f'in {time.perf_counter() - started:.1f}s -> {cached}', file=sys.stderr)
+    # Сценарии пишут в БД: каждый прогон начинается с одинаковых данных
+    working = os.path.join(data_dir, f'caspian-{scale}-run.db')
+    _discard_sidecars(working)
+    shutil.copyfile(cached, working)
+    return working
+
+
+# --- Транспорты: send(request) -> (status, число SQL-запросов или None) ---
+
+class ClientTransport:
+    def __init__(self, app):
+        self.app = app
+        self.client = app.test_client()
+        self.queries = 0
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.queries += 1
+
+    def send(self, request):
+        before = self.queries
+        response = self.client.open(request.path, method=request.method, data=request.body,
+                                    headers=request.headers)
+        response.get_data()  # Потоковые ответы читаются до конца
+        status = response.status_code
+        response.close()
+        return status, self.queries - before
+
+    def fetch_json(self, request):
+        return self.client.open(request.path, method=request.method, data=request.body,
+                                headers=request.headers).get_json()
+
+
+class HttpTransport:
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+        self.local = threading.local()  # keep-alive соединение на поток генератора
+
+    def _connection(self):
+        if getattr(self.local, 'connection', None) is None:
+            self.local.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        return self.local.connection
+
+    def send(self, request):
+        for attempt in range(2):
+            connection = self._connection()
+            try:
+                connection.request(request.method, self.prefix + request.path, body=request.body or None,
+                                   headers=request.headers)
+                response = connection.getresponse()
+                response.read()
+                if response.will_close:
+                    connection.close()
+                    self.local.connection = None
+                return response.status, None
+            except (http.client.HTTPException, ConnectionError):
+                # Сервер закрыл простаивающее соединение - переподключаемся один раз
+                connection.close()
+                self.local.connection = None
+                if attempt:
+                    raise
+
+    def fetch_json(self, request):
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        try:
+            connection.request(request.method, self.prefix + request.path, body=request.body or None,
+                               headers=request.headers)
+            return json.loads(connection.getresponse().read())
+        finally:
+            connection.close()
+
+
+def spawn_gunicorn(database, workers, threads):
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    env = dict(os.environ, **{DATABASE_ENV: database})
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--threads', str(threads),
+         '--bind', f'127.0.0.1:{port}', '--chdir', ROOT, '--log-level', 'warning',
+         'benchmarks.run:server_app()'],
+        env=env,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'gunicorn exited with code {process.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return process, f'http://127.0.0.1:{port}'
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError('gunicorn did not start in 30s')
+
+
+# --- Замер ---
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank: наименьшее значение, не меньше которого fraction выборки
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+def measure(transport, requests, expect, concurrency):
+    latencies = []
+    errors = 0
+    queries = []
+    lock = threading.Lock()
+
+    def run(request):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            status, count = transport.send(request)
+        except Exception:
+            status, count = None, None
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            if status not in expect:
+                errors += 1
+            if count is not None:
+                queries.append(count)
+
+    started = time.perf_counter()
+    if concurrency == 1:
+        for request in requests:
+            run(request)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(run, requests))
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'requests': len(requests),
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        'throughput_rps': round(len(requests) / wall, 1) if wall else 0.0,
+        'queries': round(sum(queries) / len(queries), 2) if queries else None,
+        'max_queries': max(queries) if queries else None,
+    }
+
+
+def run_scenarios(transport, scenarios, total_ports, count, concurrency, warmup):
+    ctx = {'ports': total_ports, 'username': ADMIN[0], 'password': ADMIN[1]}
+    # Токен для админских маршрутов берется тем же транспортом, что и замеры
+    ctx['token'] = transport.fetch_json(select(['login'])[0].requests(ctx, 1)[0])['access_token']
+    results = {}
+    for scenario in scenarios:
+        requests = scenario.requests(ctx, count)
+        if warmup and all(request.method == 'GET' for request in requests):
+            for request in scenario.requests(ctx, warmup, seed=1):
+                transport.send(request)
+        result = measure(transport, requests, scenario.expect, concurrency)
+        if scenario.name == 'create_port':
+            ctx['created'] = len(requests)
+        elif scenario.name == 'upload_report':
+            ctx['jobs'] = len(requests)
+        results[scenario.name] = result
+        print(_row(scenario.name, result), file=sys.stderr)
+    return results
+
+
+def _row(name, result):
+    queries = '-' if result['queries'] is None else f'{result["queries"]:.1f}'
+    return (f'{name:<24} {result["p50_ms"]:>9.2f} {result["p99_ms"]:>9.2f} '
+            f'{result["throughput_rps"]:>9.1f} {queries:>7} {result["errors"]:>6}')
+
+
+# --- Базовая линия и регрессии ---
+
+def run_key(mode, scale):
+    return f'{mode}/{scale}'
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {'runs': {}}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baseline(path, key, run):
+    baseline = load_baseline(path)
+    baseline['runs'][key] = run
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def find_regressions(baseline_run, endpoints, threshold, noise_ms):
+    """Маршруты, где p50/p99 выросли больше чем на threshold (и больше noise_ms) или появились ошибки."""
+    regressions = []
+    for name, current in endpoints.items():
+        base = baseline_run['endpoints'].get(name)
+        if base is None:
+            continue
+        for metric in ('p50_ms', 'p99_ms'):
+            limit = base[metric] * (1 + threshold)
+            if current[metric] > limit and current[metric] - base[metric] > noise_ms:
+                regressions.append(f'{name}: {metric} {current[metric]:.2f} > {base[metric]:.2f} '
+                                   f'(+{(current[metric] / base[metric] - 1) * 100 if base[metric] else 0:.0f}%)')
+        if current['errors'] and not base['errors']:
+            regressions.append(f'{name}: {current["errors"]} failed requests (baseline had none)')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=sorted(SCALES, key=SCALES.get), default='1k')
+    parser.add_argument('--mode', choices=('client', 'http'), default='client')
+    parser.add_argument('--url', help='Уже запущенный сервер для --mode http (его БД должна быть той же шкалы)')
+    parser.add_argument('--spawn', action='store_true', help='Запустить gunicorn на сгенерированной БД')
+    parser.add_argument('--workers', type=int, default=2, help='Воркеров gunicorn для --spawn')
+    parser.add_argument('--threads', type=int, default=4, help='Потоков на воркер gunicorn для --spawn')
+    parser.add_argument('--requests', type=int, default=200, help='Запросов на маршрут')
+    parser.add_argument('--concurrency', type=int, default=8, help='Параллельных клиентов в режиме http')
+    parser.add_argument('--warmup', type=int, default=5, help='Прогревочных GET-запросов на маршрут')
+    parser.add_argument('--only', nargs='+', metavar='SCENARIO', help='Только эти сценарии')
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    parser.add_argument('--regenerate', action='store_true', help='Сгенерировать данные заново')
+    parser.add_argument('--output', help='Записать результаты в JSON (добавляется к существующим прогонам)')
+    parser.add_argument('--compare', help='JSON базовой линии для поиска регрессий')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Допустимое замедление, доля (0.2 = 20%%)')
+    parser.add_argument('--noise-ms', type=float, default=0.5, help='Игнорировать замедление меньше этого')
+    args = parser.parse_args()
+    if args.mode == 'http' and not (args.url or args.spawn):
+        parser.error('--mode http needs --url or --spawn')
+    scenarios = select(args.only)
+
+    server = None
+    if args.url:
+        transport, concurrency = HttpTransport(args.url), args.concurrency
+    else:
+        database = prepare_database(args.scale, args.data_dir, args.regenerate)
+        if args.mode == 'http':
+            server, url = spawn_gunicorn(database, args.workers, args.threads)
+            transport, concurrency = HttpTransport(url), args.concurrency
+        else:
+            app = bench_app(database)
+            transport, concurrency = ClientTransport(app), 1
+    print(f'{"scenario":<24} {"p50, ms":>9} {"p99, ms":>9} {"req/s":>9} {"queries":>7} {"errors":>6}',
+          file=sys.stderr)
+    try:
+        if args.mode == 'client':
+            with app.app_context():
+                endpoints = run_scenarios(transport, scenarios, SCALES[args.scale], args.requests,
+                                          concurrency, args.warmup)
+        else:
+            endpoints = run_scenarios(transport, scenarios, SCALES[args.scale], args.requests,
+                                      concurrency, args.warmup)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    run = {
+        'scale': args.scale,
+        'mode': args.mode,
+        'requests': args.requests,
+        'concurrency': concurrency,
+        'python': platform.python_version(),
+        'recorded_at': datetime.utcnow().isoformat(timespec='seconds'),
+        'endpoints': endpoints,
+    }
+    key = run_key(args.mode, args.scale)
+    status = 0
+    if args.compare:
+        baseline_run = load_baseline(args.compare)['runs'].get(key)
+        if baseline_run is None:
+            print(f'No {key} run in {args.compare}', file=sys.stderr)
+            status = 2
+        else:
+            regressions = find_regressions(baseline_run, endpoints, args.threshold, args.noise_ms)
+            for line in regressions:
+                print(f'REGRESSION {line}', file=sys.stderr)
+            print(f'{len(regressions)} regressions against {args.compare} ({key}, threshold '
+                  f'{args.threshold:.0%})', file=sys.stderr)
+            status = 1 if regressions else 0
+    if args.output:
+        save_baseline(args.output, key, run)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,199 @@
+"""Сценарии нагрузки: по одному на каждый маршрут /api.
+
+Сценарий строит запросы заранее (до замера), поэтому генерация PDF/zip и
+случайных параметров в латентность не попадает. Запрос - метод, путь, тело в
+байтах и заголовки: одинаково отправляется через test client и по HTTP.
+"""
+import json
+import random
+import uuid
+from collections import namedtuple
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+from app.tiles import tiles_for
+from benchmarks.data import CASPIAN_PORTS, HISTORY_DAYS, HISTORY_PORTS, report_pdf, report_zip
+
+Request = namedtuple('Request', 'method path body headers')
+
+HISTORY_END = datetime(2026, 1, 1) + timedelta(days=300)
+SEARCH_WORDS = ('oil', 'smoke', 'fish', 'tanker', 'fuel', 'нефти', 'пластик')
+
+
+def get(path, **params):
+    query = urlencode({key: value for key, value in params.items() if value is not None})
+    return Request('GET', f'{path}?{query}' if query else path, b'', {})
+
+
+def send(method, path, payload):
+    return Request(method, path, json.dumps(payload).encode(), {'Content-Type': 'application/json'})
+
+
+def multipart(fields=(), files=()):
+    """Тело multipart/form-data: fields - (имя, значение), files - (поле, имя файла, байты)."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields:
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'.encode()
+                     + value.encode() + b'\r\n')
+    for field, filename, data in files:
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; '
+                     f'filename="{filename}"\r\nContent-Type: application/octet-stream\r\n\r\n'.encode()
+                     + data + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def upload(path, fields=(), files=()):
+    body, content_type = multipart(fields, files)
+    return Request('POST', path, body, {'Content-Type': content_type})
+
+
+class Scenario:
+    """``build(ctx, rng, i)`` возвращает i-й запрос; ``expect`` - успешные статусы.
+
+    ``limit`` ограничивает число запросов для тяжелых маршрутов (полная выгрузка,
+    пересчет рейтинга), ``admin`` добавляет токен администратора.
+    """
+
+    def __init__(self, name, build, expect=(200,), admin=False, limit=None):
+        self.name = name
+        self.build = build
+        self.expect = expect
+        self.admin = admin
+        self.limit = limit
+
+    def requests(self, ctx, count, seed=0):
+        rng = random.Random(f'{self.name}:{seed}')
+        count = min(count, self.limit) if self.limit else count
+        requests = []
+        for i in range(count):
+            request = self.build(ctx, rng, i)
+            if self.admin:
+                request = request._replace(headers=dict(request.headers,
+                                                        Authorization=f'Bearer {ctx["token"]}'))
+            requests.append(request)
+        return requests
+
+
+def _port_id(ctx, rng):
+    return rng.randint(1, ctx['ports'])
+
+
+def _point(rng):
+    _, lat, lng = rng.choice(CASPIAN_PORTS)
+    return round(lat + rng.gauss(0, 0.5), 4), round(lng + rng.gauss(0, 0.5), 4)
+
+
+def _bbox(rng, size=1.0):
+    lat, lng = _point(rng)
+    return f'{lng - size / 2:.4f},{lat - size / 2:.4f},{lng + size / 2:.4f},{lat + size / 2:.4f}'
+
+
+def _tile(rng):
+    z = rng.randint(4, 12)
+    _, x, y = tiles_for(*_point(rng), max_zoom=z)[z]
+    return get(f'/api/tiles/{z}/{x}/{y}')
+
+
+def _history(ctx, rng, i):
+    start = HISTORY_END - timedelta(days=rng.choice((1, 7, HISTORY_DAYS)))
+    return get(f'/api/ports/{rng.randint(1, min(HISTORY_PORTS, ctx["ports"]))}/history',
+               **{'from': start.isoformat(), 'to': HISTORY_END.isoformat()})
+
+
+def _new_port(rng, i):
+    lat, lng = _point(rng)
+    return {'name': f'Bench port {uuid.uuid4().hex[:12]}', 'lat': lat, 'lng': lng,
+            'air_quality': round(rng.uniform(0, 45), 2), 'water_quality': round(rng.uniform(0, 25), 2),
+            'co2_emissions': round(rng.uniform(50, 900), 1), 'incidents': rng.randint(0, 4)}
+
+
+def _created_port(ctx, i):
+    # Порты, добавленные сценарием create_port, получают id сразу после синтетических
+    return ctx['ports'] + 1 + i % max(1, ctx.get('created', 1))
+
+
+def _upload_report(ctx, rng, i):
+    return upload(f'/api/ports/{_port_id(ctx, rng)}/upload_report',
+                  files=[('file', f'report-{i}.pdf', report_pdf(rng))])
+
+
+def _reports_batch(ctx, rng, i):
+    return upload('/api/reports/batch',
+                  files=[('archive', 'reports.zip', report_zip(rng, [_port_id(ctx, rng) for _ in range(5)]))])
+
+
+def _bulk_ingest(ctx, rng, i):
+    rows = [{'id': _port_id(ctx, rng), 'air_quality': round(rng.uniform(0, 45), 2),
+             'water_quality': round(rng.uniform(0, 25), 2)} for _ in range(100)]
+    body = ''.join(json.dumps(row) + '\n' for row in rows).encode()
+    return Request('POST', '/api/ports/bulk', body, {'Content-Type': 'application/x-ndjson'})
+
+
+# Порядок важен: create_port создает порты, которые потом удаляет delete_port,
+# upload_report создает задания для job_status
+SCENARIOS = [
+    Scenario('login', lambda ctx, rng, i: send('POST', '/api/login',
+                                              {'username': ctx['username'], 'password': ctx['password']})),
+    Scenario('ports_page', lambda ctx, rng, i: get('/api/ports', page=rng.randint(1, 50), per_page=20)),
+    Scenario('ports_sorted', lambda ctx, rng, i: get('/api/ports', sort='green_score', order='desc',
+                                                     min_score=rng.choice((20, 50, 80)))),
+    Scenario('ports_keyset', lambda ctx, rng, i: get('/api/ports', cursor='', sort='green_score',
+                                                     order=rng.choice(('asc', 'desc')), per_page=50)),
+    Scenario('ports_bbox', lambda ctx, rng, i: get('/api/ports', bbox=_bbox(rng), per_page=50)),
+    Scenario('ports_near', lambda ctx, rng, i: get('/api/ports/near', **dict(zip(('lat', 'lng'), _point(rng))),
+                                                   k=10, radius_km=rng.choice((None, 50)))),
+    Scenario('port', lambda ctx, rng, i: get(f'/api/ports/{_port_id(ctx, rng)}')),
+    Scenario('port_history', _history),
+    Scenario('ports_stats', lambda ctx, rng, i: get('/api/ports/stats')),
+    Scenario('tiles', lambda ctx, rng, i: _tile(rng)),
+    Scenario('ports_score', lambda ctx, rng, i: send('POST', '/api/ports/score',
+                                                     {'weights': {'air_quality': rng.randint(1, 50)},
+                                                      'limit': 50}), admin=True, limit=20),
+    Scenario('scoring_profiles', lambda ctx, rng, i: get('/api/scoring/profiles')),
+    Scenario('scoring_profile_put', lambda ctx, rng, i: send(
+        'PUT', f'/api/scoring/profiles/bench-{i % 10}',
+        {'weights': {'air_quality': rng.randint(1, 50), 'incidents': rng.randint(1, 50)}}),
+        expect=(200, 201), admin=True),
+    Scenario('scoring_profile_delete', lambda ctx, rng, i: Request(
+        'DELETE', f'/api/scoring/profiles/bench-{i}', b'', {}), admin=True, limit=10),
+    Scenario('create_port', lambda ctx, rng, i: send('POST', '/api/ports', _new_port(rng, i)),
+             expect=(201,), admin=True),
+    Scenario('update_port', lambda ctx, rng, i: send('PUT', f'/api/ports/{_port_id(ctx, rng)}',
+                                                     {'air_quality': round(rng.uniform(0, 45), 2)}),
+             admin=True),
+    Scenario('bulk_ingest', _bulk_ingest, admin=True),
+    Scenario('subscribe', lambda ctx, rng, i: send('POST', f'/api/ports/{_port_id(ctx, rng)}/subscribe',
+                                                   {'email': f'bench{rng.randrange(10 ** 6)}@example.com'})),
+    Scenario('create_report', lambda ctx, rng, i: send(
+        'POST', '/api/reports', {'port_id': _port_id(ctx, rng), 'user_email': 'bench@example.com',
+                                 'description': f'Oil sheen spotted near berth {i}'}), expect=(201,)),
+    Scenario('reports_page', lambda ctx, rng, i: get('/api/reports', per_page=50,
+                                                     port_id=rng.choice((None, _port_id(ctx, rng)))),
+             admin=True),
+    Scenario('reports_ndjson', lambda ctx, rng, i: get(
+        '/api/reports', format='ndjson', since=(HISTORY_END - timedelta(days=3)).isoformat()),
+        admin=True, limit=20),
+    Scenario('reports_search', lambda ctx, rng, i: get('/api/reports/search', q=rng.choice(SEARCH_WORDS)),
+             admin=True),
+    Scenario('export_ports', lambda ctx, rng, i: get('/api/export/ports', format=rng.choice(('csv', 'parquet'))),
+             admin=True, limit=3),
+    Scenario('upload_report', _upload_report, expect=(202,), admin=True),
+    Scenario('job_status', lambda ctx, rng, i: get(f'/api/jobs/{1 + i % max(1, ctx.get("jobs", 1))}'),
+             admin=True),
+    Scenario('reports_batch', _reports_batch, expect=(200, 207), admin=True, limit=20),
+    Scenario('report_cache', lambda ctx, rng, i: get('/api/reports/cache'), admin=True),
+    Scenario('notification_stats', lambda ctx, rng, i: get('/api/notifications/stats'), admin=True),
+    Scenario('delete_port', lambda ctx, rng, i: Request('DELETE', f'/api/ports/{_created_port(ctx, i)}',
+                                                        b'', {}), admin=True),
+]
+
+
+def select(names=None):
+    if not names:
+        return list(SCENARIOS)
+    known = {scenario.name: scenario for scenario in SCENARIOS}
+    unknown = [name for name in names if name not in known]
+    if unknown:
+        raise ValueError(f'Unknown scenarios: {", ".join(unknown)}')
+    return [scenario for scenario in SCENARIOS if scenario.name in names]
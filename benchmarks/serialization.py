@@ -0,0 +1,69 @@
+"""Сравнение сериализации списка портов: marshmallow + jsonify против app/serializers.py.
+
+Запуск из корня репозитория: python benchmarks/serialization.py [--repeat N]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import jsonify  # noqa: E402
+from app import create_app, db  # noqa: E402
+from app.models import Port  # noqa: E402
+from app.schemas import PortSchema  # noqa: E402
+from app.serializers import RawJSON, json_response, port_serializer  # noqa: E402
+from config import TestConfig  # noqa: E402
+
+SIZES = (100, 1000, 10000)
+ports_schema = PortSchema(many=True)
+
+
+def schema_path(n):
+    ports = Port.query.order_by(Port.id).limit(n).all()
+    return jsonify({'ports': ports_schema.dump(ports)}).get_data()
+
+
+def fast_path(n):
+    rows = Port.query.with_entities(*port_serializer.columns).order_by(Port.id).limit(n).all()
+    response, _ = json_response({'ports': RawJSON(port_serializer.encode_rows(rows))})
+    return response.get_data()
+
+
+def best_of(fn, n, repeat):
+    timings = []
+    for _ in range(repeat):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        fn(n)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    app = create_app(TestConfig)
+    with app.test_request_context():
+        db.create_all()
+        rng = random.Random(42)
+        db.session.execute(Port.__table__.insert(), [{
+            'name': f'Station {i}', 'lat': rng.uniform(-60, 60), 'lng': rng.uniform(-180, 180),
+            'air_quality': rng.uniform(0, 100), 'water_quality': rng.uniform(0, 50),
+            'co2_emissions': rng.uniform(0, 2000), 'incidents': rng.randint(0, 9),
+            'green_score': rng.uniform(0, 100),
+        } for i in range(max(SIZES))])
+        db.session.commit()
+        print(f"{'rows':>6} {'schema, ms':>11} {'fast, ms':>9} {'speedup':>8}")
+        for n in SIZES:
+            assert schema_path(n) == fast_path(n), 'outputs differ'
+            slow = best_of(schema_path, n, args.repeat)
+            fast = best_of(fast_path, n, args.repeat)
+            print(f'{n:>6} {slow * 1000:>11.2f} {fast * 1000:>9.2f} {slow / fast:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
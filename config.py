@@ -6,11 +6,64 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///ports.db'  # SQLite для локального, PostgreSQL для Heroku
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'jwt_secret_key'
+    # Cost-фактор bcrypt; хэши с другим фактором пересчитываются при следующем входе
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS') or 12)
+    # Потоков для bcrypt при логине и число неудачных попыток до блокировки имени
+    LOGIN_HASH_WORKERS = int(os.environ.get('LOGIN_HASH_WORKERS') or 2)
+    LOGIN_MAX_FAILURES = int(os.environ.get('LOGIN_MAX_FAILURES') or 5)
+    # Как часто (сек) сверять роль из токена с БД; 0 - доверять claim до истечения токена
+    JWT_ROLE_RECHECK_SECONDS = int(os.environ.get('JWT_ROLE_RECHECK_SECONDS') or 0)
     MAIL_SERVER = os.environ.get('MAIL_SERVER') or 'smtp.example.com'
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
+    # Разбор PDF: размер пула процессов диспетчера (`flask jobs run`, один на хост)
+    # и аренда задания (сек) до возврата в очередь
+    REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS') or os.cpu_count() or 1)
+    # Поток-диспетчер в самом приложении - только при одном процессе (run.py, gunicorn -w 1)
+    REPORT_DISPATCHER = os.environ.get('REPORT_DISPATCHER', '').lower() in ('1', 'true', 'yes')
+    # Процессов разбора пакетной загрузки на каждый веб-воркер
+    REPORT_BATCH_WORKERS = int(os.environ.get('REPORT_BATCH_WORKERS') or 2)
+    REPORT_JOB_LEASE_SECONDS = int(os.environ.get('REPORT_JOB_LEASE_SECONDS') or 300)
+    # Кэш разобранных PDF по SHA-256: объем записей (байт) до LRU-вытеснения
+    REPORT_CACHE_MAX_BYTES = int(os.environ.get('REPORT_CACHE_MAX_BYTES') or 64 * 1024 * 1024)
+    # Максимальный размер одного PDF в пакетной загрузке (байт)
+    REPORT_MAX_BYTES = int(os.environ.get('REPORT_MAX_BYTES') or 50 * 1024 * 1024)
+    # Строк в одной порции выгрузки (блок CSV, row group Parquet, record batch Arrow)
+    EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE') or 10000)
+    # Пул соединений PostgreSQL: размер, переполнение, ожидание свободного соединения (сек),
+    # пересоздание (сек), проверка соединения перед выдачей и лимит запроса (мс, 0 - нет)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 5)
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW') or 10)
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT') or 30)
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE') or 1800)
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1').lower() in ('1', 'true', 'yes')
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS') or 0)
+    # SQLite: ожидание блокировки записи (сек), WAL (читатели не ждут писателя),
+    # synchronous=NORMAL и mmap (байт)
+    SQLITE_BUSY_TIMEOUT = float(os.environ.get('SQLITE_BUSY_TIMEOUT') or 5)
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE') or 'WAL'
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS') or 'NORMAL'
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE') or 256 * 1024 * 1024)
+    # Реплика для чтения: GET /ports, /ports/<id>, /ports/stats и /reports идут на нее
+    SQLALCHEMY_REPLICA_URI = (os.environ.get('DATABASE_REPLICA_URL') or '').replace('postgres://', 'postgresql://', 1) or None
+    # /metrics: Bearer-токен для Prometheus (пусто - без проверки) и профилировщик ?profile=1
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None
+    METRICS_PROFILER = os.environ.get('METRICS_PROFILER') or 'cprofile'
+    # Превышение @query_budget маршрута: off, warn - предупреждение в лог, raise - исключение
+    QUERY_BUDGET_MODE = os.environ.get('QUERY_BUDGET_MODE') or 'warn'
 
     # Для Heroku: Парсим DATABASE_URL в PostgreSQL URI
     if os.environ.get('DATABASE_URL'):
         url = urlparse(os.environ['DATABASE_URL'])
-        SQLALCHEMY_DATABASE_URI = f"postgresql://{url.username}:{url.password}@{url.hostname}:{url.port}{url.path}"
\ No newline at end of file
+        SQLALCHEMY_DATABASE_URI = f"postgresql://{url.username}:{url.password}@{url.hostname}:{url.port}{url.path}"
+
+class TestConfig(Config):
+    TESTING = True
+    # Flask-SQLAlchemy 3 создает engine в init_app, поэтому URI задается до create_app
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    # Задания разбора отчетов выполняются синхронно в запросе
+    REPORT_JOBS_EAGER = True
+    # Минимальный cost bcrypt: тесты не тратят время на хэширование
+    BCRYPT_LOG_ROUNDS = 4
+    # Маршрут, превысивший свой бюджет SQL-запросов, роняет тест
+    QUERY_BUDGET_MODE = 'raise'
@@ -2,17 +2,16 @@ import os
 import sys
 import pytest
 from app import create_app, db
+from config import TestConfig
 from app.models import User, Port
+from app.query_budget import QueryBudget
 
 # Добавляем корневую папку в PYTHONPATH
 sys.path.insert(0, os.path.abspath('.'))
 
 @pytest.fixture
 def client():
-    app = create_app()
-    app.config['TESTING'] = True
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app = create_app(TestConfig)
     
     with app.test_client() as client:
         with app.app_context():
@@ -37,4 +36,11 @@ def client():
             db.session.add(port)
             db.session.commit()  # Добавлено commit
             
-            yield client
\ No newline at end of file
+            yield client
+
+@pytest.fixture
+def assert_max_queries():
+    """with assert_max_queries(3): ... - тест падает, если внутри больше 3 SQL-запросов."""
+    def guard(limit, label=None):
+        return QueryBudget(limit, label, mode='raise')
+    return guard
@@ -90,9 +90,21 @@ def run_migrations_online():
                 directives[:] = []
                 logger.info('No changes in schema detected.')
 
+    # Полнотекстовый индекс отчетов (app/search.py) создается DDL вне моделей:
+    # autogenerate не должен предлагать удалить таблицы FTS5 и GIN-индекс
+    def include_object(object, name, type_, reflected, compare_to):
+        if reflected and compare_to is None:
+            if type_ == 'table' and name.startswith('report_fts'):
+                return False
+            if type_ == 'index' and name == 'ix_report_description_fts':
+                return False
+        return True
+
     conf_args = current_app.extensions['migrate'].configure_args
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
+    if conf_args.get("include_object") is None:
+        conf_args["include_object"] = include_object
 
     connectable = get_engine()
 
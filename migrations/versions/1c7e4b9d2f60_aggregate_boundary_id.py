@@ -0,0 +1,28 @@
+"""Tie-break id for the top_polluted heap boundary
+
+Revision ID: 1c7e4b9d2f60
+Revises: f3a8d2c6b957
+Create Date: 2026-10-18 19:05:12.318470
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1c7e4b9d2f60'
+down_revision = 'f3a8d2c6b957'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('port_aggregate', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('top_boundary_id', sa.Integer(), nullable=True))
+    # Граница без id неполна: агрегаты перестроятся при первом запросе /ports/stats
+    op.execute('DELETE FROM port_aggregate')
+
+
+def downgrade():
+    with op.batch_alter_table('port_aggregate', schema=None) as batch_op:
+        batch_op.drop_column('top_boundary_id')
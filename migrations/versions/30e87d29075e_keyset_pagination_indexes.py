@@ -0,0 +1,32 @@
+"""Composite indexes for keyset pagination over ports
+
+Revision ID: 30e87d29075e
+Revises: ca2b094d586c
+Create Date: 2026-10-18 11:04:09.527816
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '30e87d29075e'
+down_revision = 'ca2b094d586c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('port', schema=None) as batch_op:
+        batch_op.create_index('ix_port_air_quality_id', ['air_quality', 'id'], unique=False)
+        batch_op.create_index('ix_port_water_quality_id', ['water_quality', 'id'], unique=False)
+        batch_op.create_index('ix_port_co2_emissions_id', ['co2_emissions', 'id'], unique=False)
+        batch_op.create_index('ix_port_incidents_id', ['incidents', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('port', schema=None) as batch_op:
+        batch_op.drop_index('ix_port_incidents_id')
+        batch_op.drop_index('ix_port_co2_emissions_id')
+        batch_op.drop_index('ix_port_water_quality_id')
+        batch_op.drop_index('ix_port_air_quality_id')
@@ -0,0 +1,67 @@
+"""Normalized port subscriptions
+
+Revision ID: 3f6a0c8e2d71
+Revises: e41a9d7b3c55
+Create Date: 2026-10-18 17:02:11.417630
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f6a0c8e2d71'
+down_revision = 'e41a9d7b3c55'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    subscription = op.create_table('subscription',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('port_id', sa.Integer(), nullable=False),
+    sa.Column('email', sa.String(length=254), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['port_id'], ['port.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('port_id', 'email', name='uq_subscription_port_email')
+    )
+    with op.batch_alter_table('subscription', schema=None) as batch_op:
+        batch_op.create_index('ix_subscription_port_id_id', ['port_id', 'id'], unique=False)
+
+    # Разносим строки "a@x,b@y" по записям, дубликаты и пустые значения отбрасываем
+    conn = op.get_bind()
+    now = datetime.utcnow()
+    rows = []
+    for port_id, subscribers in conn.execute(sa.text(
+            "SELECT id, subscribers FROM port WHERE subscribers IS NOT NULL AND subscribers != ''")):
+        seen = set()
+        for email in subscribers.split(','):
+            email = email.strip()
+            if email and email not in seen:
+                seen.add(email)
+                rows.append({'port_id': port_id, 'email': email, 'created_at': now})
+    if rows:
+        op.bulk_insert(subscription, rows)
+
+    with op.batch_alter_table('port', schema=None) as batch_op:
+        batch_op.drop_column('subscribers')
+
+
+def downgrade():
+    with op.batch_alter_table('port', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('subscribers', sa.Text(), nullable=True))
+
+    conn = op.get_bind()
+    emails = {}
+    for port_id, email in conn.execute(sa.text('SELECT port_id, email FROM subscription ORDER BY id')):
+        emails.setdefault(port_id, []).append(email)
+    for port_id, port_emails in emails.items():
+        conn.execute(sa.text('UPDATE port SET subscribers = :subscribers WHERE id = :id'),
+                     {'subscribers': ','.join(port_emails), 'id': port_id})
+
+    with op.batch_alter_table('subscription', schema=None) as batch_op:
+        batch_op.drop_index('ix_subscription_port_id_id')
+
+    op.drop_table('subscription')
@@ -0,0 +1,27 @@
+"""Per-tile map tile generations: reset tiles keep a row with a NULL body
+
+Revision ID: 4d9f2b7e6a15
+Revises: 7a3e5c1d9b48
+Create Date: 2026-10-18 21:42:51.230964
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d9f2b7e6a15'
+down_revision = '7a3e5c1d9b48'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('map_tile', schema=None) as batch_op:
+        batch_op.alter_column('body', existing_type=sa.Text(), nullable=True)
+
+
+def downgrade():
+    op.execute('DELETE FROM map_tile WHERE body IS NULL')
+    with op.batch_alter_table('map_tile', schema=None) as batch_op:
+        batch_op.alter_column('body', existing_type=sa.Text(), nullable=False)
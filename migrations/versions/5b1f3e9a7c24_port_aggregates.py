@@ -0,0 +1,39 @@
+"""Incrementally maintained aggregates for /ports/stats
+
+Revision ID: 5b1f3e9a7c24
+Revises: 30e87d29075e
+Create Date: 2026-10-18 12:20:33.604112
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1f3e9a7c24'
+down_revision = '30e87d29075e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Таблицы заполняются при первом запросе /ports/stats или командой flask stats rebuild
+    op.create_table('port_aggregate',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('port_count', sa.Integer(), nullable=False),
+    sa.Column('score_sum', sa.Float(), nullable=False),
+    sa.Column('top_polluted', sa.Text(), nullable=False),
+    sa.Column('top_boundary', sa.Float(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('metric_histogram',
+    sa.Column('metric', sa.String(length=32), nullable=False),
+    sa.Column('bucket', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('metric', 'bucket')
+    )
+
+
+def downgrade():
+    op.drop_table('metric_histogram')
+    op.drop_table('port_aggregate')
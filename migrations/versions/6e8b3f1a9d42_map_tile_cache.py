@@ -0,0 +1,40 @@
+"""Clustered map tile cache
+
+Revision ID: 6e8b3f1a9d42
+Revises: 9c1d5e7a4b20
+Create Date: 2026-10-18 18:20:04.551378
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6e8b3f1a9d42'
+down_revision = '9c1d5e7a4b20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('map_tile',
+    sa.Column('z', sa.Integer(), nullable=False),
+    sa.Column('x', sa.Integer(), nullable=False),
+    sa.Column('y', sa.Integer(), nullable=False),
+    sa.Column('format_version', sa.String(length=16), nullable=False),
+    sa.Column('generation', sa.Integer(), nullable=False),
+    sa.Column('body', sa.Text(), nullable=False),
+    sa.Column('built_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('z', 'x', 'y')
+    )
+    map_tile_state = op.create_table('map_tile_state',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('generation', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.bulk_insert(map_tile_state, [{'id': 1, 'generation': 0}])
+
+
+def downgrade():
+    op.drop_table('map_tile_state')
+    op.drop_table('map_tile')
@@ -0,0 +1,25 @@
+"""Parsed report cache size_bytes counts the stored entry, not the PDF
+
+Revision ID: 7a3e5c1d9b48
+Revises: 1c7e4b9d2f60
+Create Date: 2026-10-18 21:14:37.902115
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a3e5c1d9b48'
+down_revision = '1c7e4b9d2f60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Раньше здесь был размер PDF; лимит REPORT_CACHE_MAX_BYTES считает ключ и JSON записи
+    op.execute('UPDATE parsed_report_cache SET size_bytes = length(content_hash) + length(fields)')
+
+
+def downgrade():
+    pass
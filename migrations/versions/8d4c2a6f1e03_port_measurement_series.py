@@ -0,0 +1,59 @@
+"""Port measurement series with hourly and daily rollups
+
+Revision ID: 8d4c2a6f1e03
+Revises: 5b1f3e9a7c24
+Create Date: 2026-10-18 13:41:57.220930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d4c2a6f1e03'
+down_revision = '5b1f3e9a7c24'
+branch_labels = None
+depends_on = None
+
+METRICS = ['air_quality', 'water_quality', 'co2_emissions', 'incidents']
+
+
+def upgrade():
+    op.create_table('port_measurement',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('port_id', sa.Integer(), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=False),
+    sa.Column('air_quality', sa.Float(), nullable=False),
+    sa.Column('water_quality', sa.Float(), nullable=False),
+    sa.Column('co2_emissions', sa.Float(), nullable=False),
+    sa.Column('incidents', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['port_id'], ['port.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('port_measurement', schema=None) as batch_op:
+        batch_op.create_index('ix_port_measurement_port_id_timestamp', ['port_id', 'timestamp'], unique=False)
+
+    rollup_columns = []
+    for metric in METRICS:
+        rollup_columns += [
+            sa.Column(f'{metric}_sum', sa.Float(), nullable=False),
+            sa.Column(f'{metric}_min', sa.Float(), nullable=False),
+            sa.Column(f'{metric}_max', sa.Float(), nullable=False),
+        ]
+    op.create_table('port_measurement_rollup',
+    sa.Column('port_id', sa.Integer(), nullable=False),
+    sa.Column('resolution', sa.String(length=8), nullable=False),
+    sa.Column('bucket_start', sa.DateTime(), nullable=False),
+    sa.Column('samples', sa.Integer(), nullable=False),
+    *rollup_columns,
+    sa.ForeignKeyConstraint(['port_id'], ['port.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('port_id', 'resolution', 'bucket_start')
+    )
+
+
+def downgrade():
+    op.drop_table('port_measurement_rollup')
+    with op.batch_alter_table('port_measurement', schema=None) as batch_op:
+        batch_op.drop_index('ix_port_measurement_port_id_timestamp')
+
+    op.drop_table('port_measurement')
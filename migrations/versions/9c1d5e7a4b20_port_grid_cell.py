@@ -0,0 +1,47 @@
+"""Spatial grid cell index for ports
+
+Revision ID: 9c1d5e7a4b20
+Revises: 3f6a0c8e2d71
+Create Date: 2026-10-18 17:41:36.092215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c1d5e7a4b20'
+down_revision = '3f6a0c8e2d71'
+branch_labels = None
+depends_on = None
+
+# Та же сетка, что в app/models.py на момент миграции
+GRID_CELL_DEG = 0.25
+GRID_ROWS = int(180 / GRID_CELL_DEG)
+GRID_COLS = int(360 / GRID_CELL_DEG)
+
+
+def _grid_cell(lat, lng):
+    row = min(int((lat + 90) // GRID_CELL_DEG), GRID_ROWS - 1)
+    col = min(int((lng + 180) // GRID_CELL_DEG), GRID_COLS - 1)
+    return row * GRID_COLS + col
+
+
+def upgrade():
+    with op.batch_alter_table('port', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('grid_cell', sa.Integer(), nullable=True))
+
+    conn = op.get_bind()
+    cells = [{'id': port_id, 'grid_cell': _grid_cell(lat, lng)}
+             for port_id, lat, lng in conn.execute(sa.text('SELECT id, lat, lng FROM port'))]
+    if cells:
+        conn.execute(sa.text('UPDATE port SET grid_cell = :grid_cell WHERE id = :id'), cells)
+
+    with op.batch_alter_table('port', schema=None) as batch_op:
+        batch_op.create_index('ix_port_grid_cell', ['grid_cell', 'lat', 'lng'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('port', schema=None) as batch_op:
+        batch_op.drop_index('ix_port_grid_cell')
+        batch_op.drop_column('grid_cell')
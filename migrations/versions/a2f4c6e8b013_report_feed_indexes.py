@@ -0,0 +1,28 @@
+"""Composite indexes for the report feed
+
+Revision ID: a2f4c6e8b013
+Revises: 6e8b3f1a9d42
+Create Date: 2026-10-18 18:52:27.310946
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a2f4c6e8b013'
+down_revision = '6e8b3f1a9d42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('report', schema=None) as batch_op:
+        batch_op.create_index('ix_report_timestamp_id', ['timestamp', 'id'], unique=False)
+        batch_op.create_index('ix_report_port_id_timestamp_id', ['port_id', 'timestamp', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('report', schema=None) as batch_op:
+        batch_op.drop_index('ix_report_port_id_timestamp_id')
+        batch_op.drop_index('ix_report_timestamp_id')
@@ -0,0 +1,63 @@
+"""Store green_score as an indexed column
+
+Revision ID: ca2b094d586c
+Revises: 920684ee3a4f
+Create Date: 2026-10-18 10:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ca2b094d586c'
+down_revision = '920684ee3a4f'
+branch_labels = None
+depends_on = None
+
+
+def _green_score(air_quality, water_quality, co2_emissions, incidents):
+    # Копия Port.calculate_green_score на момент миграции
+    score = (
+        (1 - min(air_quality / 50, 1)) * 25 +
+        (1 - min(water_quality / 30, 1)) * 25 +
+        (1 - min(co2_emissions / 1000, 1)) * 25 +
+        (1 - min(incidents / 5, 1)) * 25
+    )
+    return round(score, 2)
+
+
+def upgrade():
+    with op.batch_alter_table('port', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('green_score', sa.Float(), nullable=False, server_default='0'))
+
+    # Backfill существующих портов
+    port = sa.table(
+        'port',
+        sa.column('id', sa.Integer),
+        sa.column('air_quality', sa.Float),
+        sa.column('water_quality', sa.Float),
+        sa.column('co2_emissions', sa.Float),
+        sa.column('incidents', sa.Integer),
+        sa.column('green_score', sa.Float),
+    )
+    bind = op.get_bind()
+    rows = bind.execute(sa.select(
+        port.c.id, port.c.air_quality, port.c.water_quality, port.c.co2_emissions, port.c.incidents
+    )).fetchall()
+    if rows:
+        bind.execute(
+            port.update().where(port.c.id == sa.bindparam('port_id')).values(green_score=sa.bindparam('score')),
+            [{'port_id': row.id, 'score': _green_score(row.air_quality, row.water_quality,
+                                                       row.co2_emissions, row.incidents or 0)}
+             for row in rows]
+        )
+
+    with op.batch_alter_table('port', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_port_green_score'), ['green_score'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('port', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_port_green_score'))
+        batch_op.drop_column('green_score')
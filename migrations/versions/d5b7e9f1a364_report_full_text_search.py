@@ -0,0 +1,51 @@
+"""Full-text search index over report descriptions
+
+Revision ID: d5b7e9f1a364
+Revises: a2f4c6e8b013
+Create Date: 2026-10-18 19:24:51.807734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5b7e9f1a364'
+down_revision = 'a2f4c6e8b013'
+branch_labels = None
+depends_on = None
+
+# Копия DDL из app/search.py на момент миграции
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS report_fts USING fts5("
+    "description, content='report', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS report_fts_ai AFTER INSERT ON report BEGIN "
+    "INSERT INTO report_fts(rowid, description) VALUES (new.id, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS report_fts_ad AFTER DELETE ON report BEGIN "
+    "INSERT INTO report_fts(report_fts, rowid, description) VALUES ('delete', old.id, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS report_fts_au AFTER UPDATE OF description ON report BEGIN "
+    "INSERT INTO report_fts(report_fts, rowid, description) VALUES ('delete', old.id, old.description); "
+    "INSERT INTO report_fts(rowid, description) VALUES (new.id, new.description); END",
+    # Индексируем уже существующие отчеты
+    "INSERT INTO report_fts(report_fts) VALUES ('rebuild')",
+]
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for statement in SQLITE_DDL:
+            op.execute(statement)
+    elif dialect == 'postgresql':
+        op.execute("CREATE INDEX IF NOT EXISTS ix_report_description_fts ON report "
+                   "USING gin (to_tsvector('simple', description))")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for trigger in ('report_fts_au', 'report_fts_ad', 'report_fts_ai'):
+            op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        op.execute('DROP TABLE IF EXISTS report_fts')
+    elif dialect == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_report_description_fts')
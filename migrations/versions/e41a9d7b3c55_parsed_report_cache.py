@@ -0,0 +1,46 @@
+"""Content-hash cache for parsed PDF reports
+
+Revision ID: e41a9d7b3c55
+Revises: b7e25c0d9f18
+Create Date: 2026-10-18 16:25:48.903117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e41a9d7b3c55'
+down_revision = 'b7e25c0d9f18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('parsed_report_cache',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('content_hash', sa.String(length=64), nullable=False),
+    sa.Column('parser_version', sa.String(length=16), nullable=False),
+    sa.Column('fields', sa.Text(), nullable=False),
+    sa.Column('size_bytes', sa.Integer(), nullable=False),
+    sa.Column('hits', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('last_used_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('content_hash', 'parser_version', name='uq_parsed_report_cache_key')
+    )
+    with op.batch_alter_table('parsed_report_cache', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_parsed_report_cache_last_used_at'), ['last_used_at'], unique=False)
+
+    with op.batch_alter_table('report_job', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('report_job', schema=None) as batch_op:
+        batch_op.drop_column('content_hash')
+
+    with op.batch_alter_table('parsed_report_cache', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_parsed_report_cache_last_used_at'))
+
+    op.drop_table('parsed_report_cache')
@@ -0,0 +1,33 @@
+"""Named scoring profiles
+
+Revision ID: f3a8d2c6b957
+Revises: d5b7e9f1a364
+Create Date: 2026-10-18 20:11:42.675120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a8d2c6b957'
+down_revision = 'd5b7e9f1a364'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('scoring_profile',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('description', sa.Text(), nullable=False),
+    sa.Column('weights', sa.Text(), nullable=False),
+    sa.Column('thresholds', sa.Text(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('scoring_profile')
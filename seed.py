@@ -1,79 +1,320 @@
-from flask import Blueprint
-from app import db
+import csv
+import io
+import json
+import random
+import time
+from datetime import datetime
+import click
+from flask import Blueprint, current_app
+from sqlalchemy import select, func
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db, bcrypt
+from app.aggregates import rebuild_aggregates
 from app.models import User, Port, Report
+from app.search import bulk_index_reports
+from app.tiles import invalidate_tiles
+from app.timeseries import METRICS, record_measurements
+
+# Идемпотентное наполнение БД: фикстуры (демо-пользователи, порты Каспия, отчеты)
+# и сгенерированные станции мониторинга для нагрузочных тестов. Запись идет пачками
+# через Core (executemany, COPY в PostgreSQL); повторный запуск ничего не дублирует.
+# Порты идентифицируются по имени, отчеты фикстур ссылаются на порт по имени.
 
 seed_bp = Blueprint('seed', __name__)
 
-@seed_bp.cli.command('run')
-def run_seed():
-    seed_database()
-
-def seed_database():
-    # Убрали db.create_all() — используйте миграции
-    # Добавление пользователей с проверками
-    if not User.query.filter_by(username='admin').first():
-        admin = User()
-        admin.username = 'admin'
-        admin.role = 'admin'
-        admin.set_password('adminpass')
-        db.session.add(admin)
-    
-    if not User.query.filter_by(username='user').first():
-        user = User()
-        user.username = 'user'
-        user.role = 'user'
-        user.set_password('userpass')
-        db.session.add(user)
-    
-    if not User.query.filter_by(username='moderator').first():
-        user2 = User()
-        user2.username = 'moderator'
-        user2.role = 'user'
-        user2.set_password('modpass')
-        db.session.add(user2)
-    
-    if not User.query.filter_by(username='citizen').first():
-        user3 = User()
-        user3.username = 'citizen'
-        user3.role = 'user'
-        user3.set_password('citizenpass')
-        db.session.add(user3)
-    
-    # Порты
-    ports_data = [
-        {'name': 'Port of Baku', 'lat': 40.37, 'lng': 49.89, 'air_quality': 45.0, 'water_quality': 25.0, 'co2_emissions': 800.0, 'incidents': 3},
-        {'name': 'Port of Aktau', 'lat': 43.65, 'lng': 51.16, 'air_quality': 50.0, 'water_quality': 30.0, 'co2_emissions': 600.0, 'incidents': 2},
-        {'name': 'Port of Astrakhan', 'lat': 46.35, 'lng': 48.04, 'air_quality': 40.0, 'water_quality': 20.0, 'co2_emissions': 500.0, 'incidents': 1},
-        {'name': 'Port of Turkmenbashi', 'lat': 40.02, 'lng': 52.97, 'air_quality': 55.0, 'water_quality': 35.0, 'co2_emissions': 700.0, 'incidents': 4},
-        {'name': 'Port of Makhachkala', 'lat': 42.97, 'lng': 47.50, 'air_quality': 42.0, 'water_quality': 22.0, 'co2_emissions': 550.0, 'incidents': 2},
-        {'name': 'Port of Bandar Anzali', 'lat': 37.47, 'lng': 49.46, 'air_quality': 48.0, 'water_quality': 28.0, 'co2_emissions': 650.0, 'incidents': 3},
-        {'name': 'Port of Neka', 'lat': 36.65, 'lng': 53.30, 'air_quality': 52.0, 'water_quality': 32.0, 'co2_emissions': 720.0, 'incidents': 5},
-        {'name': 'Port of Amirabad', 'lat': 36.87, 'lng': 54.02, 'air_quality': 47.0, 'water_quality': 27.0, 'co2_emissions': 680.0, 'incidents': 2},
-        {'name': 'Port of Nowshahr', 'lat': 36.65, 'lng': 51.50, 'air_quality': 44.0, 'water_quality': 24.0, 'co2_emissions': 590.0, 'incidents': 1},
-        {'name': 'Port of Lagan', 'lat': 45.40, 'lng': 47.35, 'air_quality': 38.0, 'water_quality': 18.0, 'co2_emissions': 450.0, 'incidents': 0},
-    ]
-    for port_data in ports_data:
-        if not Port.query.filter_by(name=port_data['name']).first():
-            port = Port(**port_data)
-            db.session.add(port)
-    
-    # Отчеты
-    reports_data = [
-        {'port_id': 1, 'user_email': 'citizen@example.com', 'description': 'High pollution in Baku port area.'},
-        {'port_id': 2, 'user_email': 'sailor@example.com', 'description': 'Oil spill observed near Aktau.'},
-        {'port_id': 3, 'user_email': 'environmentalist@example.com', 'description': 'Water contamination in Astrakhan.'},
-        {'port_id': 4, 'user_email': 'local@example.com', 'description': 'Excessive emissions in Turkmenbashi.'},
-        {'port_id': 5, 'user_email': 'fisherman@example.com', 'description': 'Fish die-off near Makhachkala.'},
-        {'port_id': 6, 'user_email': 'traveler@example.com', 'description': 'Poor air quality in Bandar Anzali.'},
-        {'port_id': 7, 'user_email': 'worker@example.com', 'description': 'Industrial waste in Neka.'},
-        {'port_id': 8, 'user_email': 'activist@example.com', 'description': 'Noise pollution in Amirabad.'},
-        {'port_id': 9, 'user_email': 'resident@example.com', 'description': 'Chemical smell in Nowshahr.'},
-        {'port_id': 10, 'user_email': 'scientist@example.com', 'description': 'Low pollution levels in Lagan.'},
-    ]
-    for report_data in reports_data:
-        if not Report.query.filter_by(port_id=report_data['port_id'], description=report_data['description']).first():
-            report = Report(**report_data)
-            db.session.add(report)
-    
+SEED_BATCH_SIZE = 10000
+# Транзакция на столько сгенерированных станций: реже сбрасываются одни и те же страницы индексов
+SEED_COMMIT_ROWS = 100000
+SQLITE_CACHE_KB = 256 * 1024  # Кэш страниц на время загрузки: индексы port не вытесняются на диск
+
+USERS = [
+    {'username': 'admin', 'role': 'admin', 'password': 'adminpass'},
+    {'username': 'user', 'role': 'user', 'password': 'userpass'},
+    {'username': 'moderator', 'role': 'user', 'password': 'modpass'},
+    {'username': 'citizen', 'role': 'user', 'password': 'citizenpass'},
+]
+
+PORTS = [
+    {'name': 'Port of Baku', 'lat': 40.37, 'lng': 49.89, 'air_quality': 45.0, 'water_quality': 25.0, 'co2_emissions': 800.0, 'incidents': 3},
+    {'name': 'Port of Aktau', 'lat': 43.65, 'lng': 51.16, 'air_quality': 50.0, 'water_quality': 30.0, 'co2_emissions': 600.0, 'incidents': 2},
+    {'name': 'Port of Astrakhan', 'lat': 46.35, 'lng': 48.04, 'air_quality': 40.0, 'water_quality': 20.0, 'co2_emissions': 500.0, 'incidents': 1},
+    {'name': 'Port of Turkmenbashi', 'lat': 40.02, 'lng': 52.97, 'air_quality': 55.0, 'water_quality': 35.0, 'co2_emissions': 700.0, 'incidents': 4},
+    {'name': 'Port of Makhachkala', 'lat': 42.97, 'lng': 47.50, 'air_quality': 42.0, 'water_quality': 22.0, 'co2_emissions': 550.0, 'incidents': 2},
+    {'name': 'Port of Bandar Anzali', 'lat': 37.47, 'lng': 49.46, 'air_quality': 48.0, 'water_quality': 28.0, 'co2_emissions': 650.0, 'incidents': 3},
+    {'name': 'Port of Neka', 'lat': 36.65, 'lng': 53.30, 'air_quality': 52.0, 'water_quality': 32.0, 'co2_emissions': 720.0, 'incidents': 5},
+    {'name': 'Port of Amirabad', 'lat': 36.87, 'lng': 54.02, 'air_quality': 47.0, 'water_quality': 27.0, 'co2_emissions': 680.0, 'incidents': 2},
+    {'name': 'Port of Nowshahr', 'lat': 36.65, 'lng': 51.50, 'air_quality': 44.0, 'water_quality': 24.0, 'co2_emissions': 590.0, 'incidents': 1},
+    {'name': 'Port of Lagan', 'lat': 45.40, 'lng': 47.35, 'air_quality': 38.0, 'water_quality': 18.0, 'co2_emissions': 450.0, 'incidents': 0},
+]
+
+REPORTS = [
+    {'port': 'Port of Baku', 'user_email': 'citizen@example.com', 'description': 'High pollution in Baku port area.'},
+    {'port': 'Port of Aktau', 'user_email': 'sailor@example.com', 'description': 'Oil spill observed near Aktau.'},
+    {'port': 'Port of Astrakhan', 'user_email': 'environmentalist@example.com', 'description': 'Water contamination in Astrakhan.'},
+    {'port': 'Port of Turkmenbashi', 'user_email': 'local@example.com', 'description': 'Excessive emissions in Turkmenbashi.'},
+    {'port': 'Port of Makhachkala', 'user_email': 'fisherman@example.com', 'description': 'Fish die-off near Makhachkala.'},
+    {'port': 'Port of Bandar Anzali', 'user_email': 'traveler@example.com', 'description': 'Poor air quality in Bandar Anzali.'},
+    {'port': 'Port of Neka', 'user_email': 'worker@example.com', 'description': 'Industrial waste in Neka.'},
+    {'port': 'Port of Amirabad', 'user_email': 'activist@example.com', 'description': 'Noise pollution in Amirabad.'},
+    {'port': 'Port of Nowshahr', 'user_email': 'resident@example.com', 'description': 'Chemical smell in Nowshahr.'},
+    {'port': 'Port of Lagan', 'user_email': 'scientist@example.com', 'description': 'Low pollution levels in Lagan.'},
+]
+
+GENERATED_DESCRIPTIONS = [
+    'Oil film on the water near {port}.',
+    'Fuel smell at the {port} terminal.',
+    'Plastic waste in the {port} harbour.',
+    'Black smoke from a vessel moored at {port}.',
+]
+
+PORT_FIELDS = ['name', 'lat', 'lng', *METRICS]
+PORT_COLUMNS = [*PORT_FIELDS, 'green_score', 'grid_cell']
+REPORT_COLUMNS = ['port_id', 'user_email', 'description', 'timestamp']
+
+
+class SeedError(ValueError):
+    pass
+
+
+def load_fixtures(path):
+    """JSON {"users": [...], "ports": [...], "reports": [...]}; отчеты ссылаются на порт по имени."""
+    with open(path, encoding='utf-8') as f:
+        try:
+            fixtures = json.load(f)
+        except ValueError as e:
+            raise SeedError(f'Invalid fixtures file: {e}')
+    if not isinstance(fixtures, dict):
+        raise SeedError('Fixtures must be a JSON object with "users", "ports" and "reports" lists')
+    required = {'users': ('username', 'password'), 'ports': PORT_FIELDS,
+                'reports': ('port', 'user_email', 'description')}
+    for section, fields in required.items():
+        items = fixtures.setdefault(section, [])
+        if not isinstance(items, list):
+            raise SeedError(f'"{section}" must be a list')
+        for number, item in enumerate(items, start=1):
+            missing = [field for field in fields if not isinstance(item, dict) or field not in item]
+            if missing:
+                raise SeedError(f'{section}[{number}]: missing {", ".join(missing)}')
+    return fixtures
+
+
+def generate_ports(scale, rng):
+    """Станции мониторинга вокруг портов-фикстур; имя однозначно задается номером."""
+    for number in range(1, scale + 1):
+        base = PORTS[number % len(PORTS)]
+        yield {
+            'name': f"{base['name'].replace('Port of ', '')} monitoring station {number}",
+            'lat': round(base['lat'] + rng.gauss(0, 0.5), 5),
+            'lng': round(base['lng'] + rng.gauss(0, 0.5), 5),
+            'air_quality': round(rng.uniform(5, 80), 1),
+            'water_quality': round(rng.uniform(2, 45), 1),
+            'co2_emissions': round(rng.uniform(100, 1500), 1),
+            'incidents': rng.randint(0, 8),
+        }
+
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _copy_rows(conn, table, columns, rows):
+    # COPY ... FROM STDIN в той же транзакции, что и остальные запросы сессии
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([row[column] for column in columns] for row in rows)
+    buffer.seek(0)
+    with conn.connection.cursor() as cursor:
+        cursor.copy_expert(f'COPY {table.name} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)', buffer)
+
+
+def _executemany_rows(conn, table, columns, rows):
+    # executemany драйвера с кортежами: без построения параметров SQLAlchemy на каждую
+    # строку; bind-процессоры (даты в формате SQLAlchemy) применяются только где нужны
+    processors = [(index, table.c[column].type.bind_processor(conn.dialect))
+                  for index, column in enumerate(columns)]
+    processors = [(index, process) for index, process in processors if process is not None]
+    params = []
+    for row in rows:
+        values = [row[column] for column in columns]
+        for index, process in processors:
+            values[index] = process(values[index])
+        params.append(tuple(values))
+    placeholders = ', '.join('?' * len(columns))
+    conn.exec_driver_sql(f'INSERT INTO {table.name} ({", ".join(columns)}) VALUES ({placeholders})', params)
+
+
+def _insert_rows(conn, table, columns, rows):
+    if conn.dialect.name == 'postgresql' and conn.dialect.driver == 'psycopg2':
+        _copy_rows(conn, table, columns, rows)
+    elif conn.dialect.name == 'sqlite':
+        _executemany_rows(conn, table, columns, rows)
+    else:
+        conn.execute(table.insert(), rows)
+
+
+def seed_users(conn, users, rounds):
+    """Добавляет отсутствующих пользователей; пароль хэшируется только у новых."""
+    existing = set(conn.execute(select(User.username).where(
+        User.username.in_([user['username'] for user in users]))).scalars())
+    rows = [{'username': user['username'], 'role': user.get('role', 'user'),
+             'password_hash': bcrypt.generate_password_hash(user['password'], rounds).decode('utf-8')}
+            for user in users if user['username'] not in existing]
+    if not rows:
+        return 0
+    table = User.__table__
+    dialect = conn.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        conn.execute(insert(table).on_conflict_do_nothing(index_elements=[table.c.username]), rows)
+    else:
+        conn.execute(table.insert(), rows)
+    return len(rows)
+
+
+def port_ids_by_name(conn, names):
+    """{имя: id}; при одинаковых именах берется порт с меньшим id, как в resolve_ports."""
+    rows = conn.execute(select(Port.name, func.min(Port.id)).where(Port.name.in_(list(set(names))))
+                        .group_by(Port.name))
+    return dict(rows.all())
+
+
+def seed_ports(conn, ports, history=True):
+    """Вставляет порты, которых еще нет (по имени). Возвращает {имя: id} вставленных.
+
+    Core-вставка минует ORM-события, поэтому green_score и grid_cell считаются
+    здесь, а начальное измерение (``history``) пишется в ряд метрик явно.
+    """
+    existing = port_ids_by_name(conn, [port['name'] for port in ports])
+    rows, seen = [], set(existing)
+    for port in ports:
+        if port['name'] in seen:
+            continue
+        seen.add(port['name'])
+        row = {field: port[field] for field in PORT_FIELDS}
+        row['green_score'] = Port.calculate_green_score(*(row[metric] for metric in METRICS))
+        row['grid_cell'] = Port.calculate_grid_cell(row['lat'], row['lng'])
+        rows.append(row)
+    if not rows:
+        return {}
+    last_id = conn.execute(select(func.coalesce(func.max(Port.id), 0))).scalar()
+    _insert_rows(conn, Port.__table__, PORT_COLUMNS, rows)
+    # id вставленных - сканом по первичному ключу после last_id, а не вторым поиском по именам
+    names = {row['name'] for row in rows}
+    inserted = {}
+    for port_id, name in conn.execute(select(Port.id, Port.name).where(Port.id > last_id).order_by(Port.id)):
+        if name in names:
+            inserted.setdefault(name, port_id)
+    if history:
+        now = datetime.utcnow()
+        record_measurements(conn, [dict({metric: row[metric] for metric in METRICS},
+                                        port_id=inserted[row['name']], timestamp=now) for row in rows])
+    return inserted
+
+
+def seed_reports(conn, reports):
+    """Отчеты фикстур: порт по имени, повтор (порт, описание) пропускается."""
+    ports = port_ids_by_name(conn, [report['port'] for report in reports])
+    missing = sorted({report['port'] for report in reports} - set(ports))
+    if missing:
+        raise SeedError(f'Reports refer to unknown ports: {", ".join(missing)}')
+    existing = set(conn.execute(select(Report.port_id, Report.description)
+                                .where(Report.port_id.in_(list(ports.values())))).all())
+    now = datetime.utcnow()
+    rows = []
+    for report in reports:
+        key = (ports[report['port']], report['description'])
+        if key in existing:
+            continue
+        existing.add(key)
+        rows.append({'port_id': key[0], 'user_email': report['user_email'],
+                     'description': report['description'], 'timestamp': now})
+    if rows:
+        _insert_rows(conn, Report.__table__, REPORT_COLUMNS, rows)
+    return len(rows)
+
+
+def _generated_reports(inserted, per_port, rng):
+    # Только для только что вставленных станций: у них еще нет отчетов, проверка не нужна
+    now = datetime.utcnow()
+    for name, port_id in inserted.items():
+        for number in range(per_port):
+            yield {'port_id': port_id, 'user_email': f'observer{rng.randrange(1000)}@example.com',
+                   'description': rng.choice(GENERATED_DESCRIPTIONS).format(port=name), 'timestamp': now}
+
+
+def seed_database(fixtures=None, scale=0, reports_per_port=1, batch_size=SEED_BATCH_SIZE,
+                  password_rounds=None, history=False, seed=0):
+    """Наполняет БД фикстурами и ``scale`` сгенерированными станциями. Возвращает счетчики.
+
+    Порты фикстур всегда получают начальное измерение, как при создании через API;
+    сгенерированные станции - только с ``history`` (удваивает объем записи).
+    """
+    fixtures = fixtures or {'users': USERS, 'ports': PORTS, 'reports': REPORTS}
+    rounds = password_rounds or current_app.config['BCRYPT_LOG_ROUNDS']
+    counts = {'users': 0, 'ports': 0, 'reports': 0}
+    conn = db.session.connection()
+    if conn.dialect.name == 'sqlite':
+        conn.exec_driver_sql(f'PRAGMA cache_size = -{SQLITE_CACHE_KB}')
+    counts['users'] = seed_users(conn, fixtures['users'], rounds)
+    for batch in _batches(fixtures['ports'], batch_size):
+        counts['ports'] += len(seed_ports(conn, batch))
+    for batch in _batches(fixtures['reports'], batch_size):
+        counts['reports'] += seed_reports(conn, batch)
+    db.session.commit()
+
+    rng = random.Random(seed)
+    pending = 0
+    for batch in _batches(generate_ports(scale, rng), batch_size):
+        # Станции и их отчеты коммитятся вместе: прерванный запуск доделывается повтором
+        conn = db.session.connection()
+        inserted = seed_ports(conn, batch, history=history)
+        counts['ports'] += len(inserted)
+        with bulk_index_reports(conn):
+            for reports in _batches(_generated_reports(inserted, reports_per_port, rng), batch_size):
+                _insert_rows(conn, Report.__table__, REPORT_COLUMNS, reports)
+                counts['reports'] += len(reports)
+        pending += len(batch)
+        if pending >= SEED_COMMIT_ROWS:
+            db.session.commit()
+            pending = 0
     db.session.commit()
-    print("Seed completed!")
\ No newline at end of file
+
+    if counts['ports']:
+        conn = db.session.connection()
+        rebuild_aggregates(conn)
+        invalidate_tiles(conn)
+        db.session.commit()
+    return counts
+
+
+@seed_bp.cli.command('run')
+@click.option('--scale', type=click.IntRange(min=0), default=0, show_default=True,
+              help='Сгенерировать N станций мониторинга вдобавок к фикстурам')
+@click.option('--reports-per-port', type=click.IntRange(min=0), default=1, show_default=True,
+              help='Отчетов на каждую сгенерированную станцию')
+@click.option('--fixtures', 'fixtures_path', type=click.Path(exists=True, dir_okay=False),
+              help='JSON {"users": [...], "ports": [...], "reports": [...]} вместо встроенных фикстур')
+@click.option('--batch-size', type=click.IntRange(min=1), default=SEED_BATCH_SIZE, show_default=True)
+@click.option('--password-rounds', type=click.IntRange(4, 31), default=None,
+              help='Cost bcrypt для новых пользователей (по умолчанию BCRYPT_LOG_ROUNDS); '
+                   'хэш пересчитывается при первом входе')
+@click.option('--history/--no-history', default=False, show_default=True,
+              help='Записывать начальные значения сгенерированных станций в ряд метрик')
+def run_seed(scale, reports_per_port, fixtures_path, batch_size, password_rounds, history):
+    """Идемпотентно наполнить БД фикстурами и сгенерированными данными."""
+    started = time.perf_counter()
+    try:
+        fixtures = load_fixtures(fixtures_path) if fixtures_path else None
+        counts = seed_database(fixtures, scale=scale, reports_per_port=reports_per_port,
+                               batch_size=batch_size, password_rounds=password_rounds, history=history)
+    except SeedError as e:
+        db.session.rollback()
+        raise click.ClickException(str(e))
+    click.echo(f"Seed completed in {time.perf_counter() - started:.1f}s: {counts['users']} users, "
+               f"{counts['ports']} ports, {counts['reports']} reports added")
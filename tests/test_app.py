@@ -1,12 +1,16 @@
+import io
+import json
+import socketserver
+import threading
+import zipfile
 import pytest
 from app import create_app, db
-from app.models import User, Port
+from config import TestConfig
+from app.models import User, Port, Subscription
 
 @pytest.fixture
 def client():
-    app = create_app()
-    app.config['TESTING'] = True
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app = create_app(TestConfig)
     with app.test_client() as client:
         with app.app_context():
             db.drop_all()
@@ -38,6 +42,23 @@ def test_login(client):
     assert response.status_code == 200
     assert 'access_token' in response.get_json()
 
+# Пересчет хэша при смене cost-фактора и блокировка имени после неудачных попыток
+def test_login_rehash_and_lockout(client):
+    app = client.application
+    assert db.session.get(User, 1).password_hash.startswith('$2b$04$')
+    app.config['BCRYPT_LOG_ROUNDS'] = 5
+    assert client.post('/api/login', json={'username': 'testadmin', 'password': 'testpass'}).status_code == 200
+    db.session.expire_all()
+    assert db.session.get(User, 1).password_hash.startswith('$2b$05$')
+    
+    app.config['LOGIN_MAX_FAILURES'] = 2
+    for _ in range(2):
+        response = client.post('/api/login', json={'username': 'testadmin', 'password': 'wrong'})
+        assert response.status_code == 401
+    response = client.post('/api/login', json={'username': 'testadmin', 'password': 'testpass'})
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 0
+
 # Тест для получения списка портов
 def test_get_ports(client):
     response = client.get('/api/ports')
@@ -45,6 +66,325 @@ def test_get_ports(client):
     assert isinstance(response.get_json(), dict)
     assert 'ports' in response.get_json()
 
+# Сортировка по green_score и min_score выполняются в SQL
+def test_get_ports_green_score_sort_and_filter(client):
+    for i, air in enumerate([5.0, 45.0, 60.0]):
+        db.session.add(Port(name=f'Port {i}', lat=40.0, lng=50.0, air_quality=air,
+                            water_quality=10.0, co2_emissions=500.0, incidents=2))
+    db.session.commit()
+    
+    response = client.get('/api/ports?sort=green_score&order=desc&per_page=2')
+    data = response.get_json()
+    scores = [p['green_score'] for p in data['ports']]
+    assert scores == sorted(scores, reverse=True)
+    assert data['total'] == 4
+    
+    response = client.get('/api/ports?min_score=50&per_page=1')
+    data = response.get_json()
+    assert data['total'] == 2
+    assert data['pages'] == 2
+    assert all(p['green_score'] >= 50 for p in data['ports'])
+
+# Keyset-пагинация обходит весь каталог без пропусков и повторов
+def test_get_ports_keyset_pagination(client):
+    for i in range(6):
+        db.session.add(Port(name=f'Port {i}', lat=40.0, lng=50.0, air_quality=float(i % 3),
+                            water_quality=10.0, co2_emissions=500.0, incidents=i))
+    db.session.commit()
+    
+    for sort_by in ['name', 'air_quality', 'green_score']:
+        seen = []
+        cursor = ''
+        while cursor is not None:
+            response = client.get('/api/ports', query_string={
+                'sort': sort_by, 'order': 'desc', 'per_page': 2, 'cursor': cursor})
+            data = response.get_json()
+            assert 'total' not in data
+            seen.extend(data['ports'])
+            cursor = data['next_cursor']
+        assert len(seen) == 7
+        assert len({p['id'] for p in seen}) == 7
+        keys = [(p[sort_by], p['id']) for p in seen]
+        assert keys == sorted(keys, reverse=True)
+    
+    response = client.get('/api/ports?cursor=&with_total=1&per_page=3')
+    assert response.get_json()['total'] == 7
+    response = client.get('/api/ports?cursor=garbage')
+    assert response.status_code == 400
+
+# Хранимый green_score пересчитывается при обновлении
+def test_green_score_updated_on_write(client):
+    port = db.session.get(Port, 1)
+    assert port.green_score == Port.calculate_green_score(20.0, 10.0, 500.0, 2)
+    access_token = get_access_token(client)
+    headers = {'Authorization': f'Bearer {access_token}'}
+    response = client.put('/api/ports/1', headers=headers, json={'air_quality': 0.0})
+    assert response.get_json()['green_score'] == Port.calculate_green_score(0.0, 10.0, 500.0, 2)
+
+# Статистика из инкрементальных агрегатов совпадает с полным сканом
+def test_ports_stats_incremental(client):
+    from app.aggregates import check_aggregates
+    from app.query_budget import QueryCounter
+    access_token = get_access_token(client)
+    headers = {'Authorization': f'Bearer {access_token}'}
+    for i in range(25):
+        response = client.post('/api/ports', headers=headers, json={
+            'name': f'Station {i}', 'lat': 40.0, 'lng': 50.0, 'air_quality': float(i * 3),
+            'water_quality': 10.0, 'co2_emissions': 400.0, 'incidents': i % 6})
+        assert response.status_code == 201
+    client.put('/api/ports/26', headers=headers, json={'air_quality': 0.0, 'incidents': 0})
+    for port_id in [20, 21, 22, 23, 24, 25]:
+        client.delete(f'/api/ports/{port_id}', headers=headers)
+    
+    assert check_aggregates(db.session.connection()) == []
+    data = client.get('/api/ports/stats').get_json()
+    ports = Port.query.all()
+    assert data['total_ports'] == len(ports) == 20
+    assert data['avg_green_score'] == round(sum(p.green_score for p in ports) / len(ports), 2)
+    expected = sorted(ports, key=lambda p: (p.green_score, p.id))[:5]
+    assert data['top_polluted'] == [{'name': p.name, 'score': p.green_score} for p in expected]
+    assert sum(b['count'] for b in data['histograms']['incidents']) == 20
+    # Без ?trends=1 ответ собирается только из агрегатов, таблица port не читается
+    assert 'co2_trend' not in data
+    with QueryCounter() as counter:
+        assert client.get('/api/ports/stats').status_code == 200
+    assert not any('port.' in statement for statement in counter.statements)
+    data = client.get('/api/ports/stats?trends=1').get_json()
+    assert data['incidents_trend'] == [p.incidents for p in sorted(ports, key=lambda p: p.id)]
+    
+    # Равные score: порт, догнавший границу кучи, с меньшим id идет первым
+    worst = {'lat': 40.0, 'lng': 50.0, 'air_quality': 90.0, 'water_quality': 90.0,
+             'co2_emissions': 1900.0, 'incidents': 9}
+    late = client.post('/api/ports', headers=headers, json={**worst, 'name': 'Late', 'air_quality': 1.0}).get_json()
+    for i in range(25):
+        client.post('/api/ports', headers=headers, json={**worst, 'name': f'Worst {i}'})
+    client.put(f"/api/ports/{late['id']}", headers=headers, json={'air_quality': 90.0})
+    assert client.get('/api/ports/stats').get_json()['top_polluted'][0]['name'] == 'Late'
+    assert check_aggregates(db.session.connection()) == []
+    
+    result = client.application.test_cli_runner().invoke(args=['stats', 'check'])
+    assert result.exit_code == 0
+
+# Пространственный поиск совпадает с полным перебором, в т.ч. через 180-й меридиан
+def test_spatial_queries(client):
+    import random
+    from app.spatial import haversine_km
+    rng = random.Random(7)
+    points = [(rng.uniform(-60, 60), rng.uniform(-180, 180)) for _ in range(300)]
+    points += [(rng.uniform(-5, 5), rng.choice([-1, 1]) * rng.uniform(178, 180)) for _ in range(40)]
+    db.session.add_all(Port(name=f'Station {i}', lat=lat, lng=lng, air_quality=10, water_quality=5,
+                            co2_emissions=100, incidents=0) for i, (lat, lng) in enumerate(points))
+    db.session.commit()
+    everything = [(port.id, port.lat, port.lng) for port in Port.query]
+    
+    for lat, lng, radius in ((10.0, 20.0, 1500.0), (0.0, 179.9, 300.0), (40.0, 50.0, None)):
+        params = {'lat': lat, 'lng': lng, 'k': 7}
+        if radius is not None:
+            params['radius_km'] = radius
+        found = client.get('/api/ports/near', query_string=params).get_json()['ports']
+        expected = sorted((float(haversine_km(lat, lng, [p_lat], [p_lng])[0]), port_id)
+                          for port_id, p_lat, p_lng in everything)
+        if radius is not None:
+            expected = [item for item in expected if item[0] <= radius]
+        assert [port['id'] for port in found] == [port_id for _, port_id in expected[:7]]
+        assert found == sorted(found, key=lambda port: port['distance_km'])
+    
+    response = client.get('/api/ports', query_string={'bbox': '170,-5,-170,5', 'per_page': 100})
+    ids = {port['id'] for port in response.get_json()['ports']}
+    assert ids == {port_id for port_id, lat, lng in everything
+                   if -5 <= lat <= 5 and (lng >= 170 or lng <= -170)}
+    assert ids
+    assert client.get('/api/ports', query_string={'bbox': '1,2,3'}).status_code == 400
+    assert client.get('/api/ports/near', query_string={'lat': 95, 'lng': 0}).status_code == 400
+
+# Тайлы карты: кластеры с числом портов, кэш сбрасывается только для затронутых тайлов
+def test_map_tiles(client):
+    from app.models import MapTile
+    for i in range(5):
+        db.session.add(Port(name=f'Baku {i}', lat=40.3 + i * 0.01, lng=49.8, air_quality=10,
+                            water_quality=5, co2_emissions=100, incidents=0))
+    db.session.add(Port(name='Lima', lat=-12.0, lng=-77.0, air_quality=60, water_quality=40,
+                        co2_emissions=2000, incidents=9))
+    db.session.commit()
+    world = client.get('/api/tiles/0/0/0')
+    assert world.mimetype == 'application/geo+json'
+    features = world.get_json()['features']
+    assert sum(feature['properties']['count'] for feature in features) == 7
+    lima = [f for f in features if f['properties'].get('name') == 'Lima']
+    assert lima and lima[0]['properties']['mean_green_score'] == 0.0
+    assert client.get('/api/tiles/0/0/0', headers={'If-None-Match': world.headers['ETag']}).status_code == 304
+    
+    caspian = client.get('/api/tiles/5/20/12').get_json()['features']
+    assert sum(f['properties']['count'] for f in caspian) == 6 and len(caspian) < 6
+    assert client.get('/api/tiles/5/32/0').status_code == 404
+    cached = MapTile.query.filter(MapTile.body.isnot(None))
+    assert {(tile.z, tile.x, tile.y) for tile in cached} == {(0, 0, 0), (5, 20, 12)}
+    
+    # Перенос Lima затрагивает тайл z=0, но не тайл Каспия
+    headers = {'Authorization': f'Bearer {get_access_token(client)}'}
+    lima_id = Port.query.filter_by(name='Lima').one().id
+    client.put(f'/api/ports/{lima_id}', headers=headers, json={'lat': 10.0})
+    assert {(tile.z, tile.x, tile.y) for tile in cached} == {(5, 20, 12)}
+    moved = client.get('/api/tiles/0/0/0').get_json()['features']
+    assert [f['geometry']['coordinates'] for f in moved if f['properties'].get('name') == 'Lima'] == [[-77.0, 10.0]]
+
+# Сброс тайла во время его построения отменяет сохранение, сброс другого тайла - нет
+def test_map_tile_generation_per_tile(client, monkeypatch):
+    from app import tiles
+    from app.models import MapTile
+    original = tiles.build_tile
+    def build_during_write(touched):
+        def build(z, x, y):
+            body = original(z, x, y)
+            tiles.invalidate_tiles(db.session.connection(), {touched})
+            return body
+        return build
+    for touched, stored in (((4, 10, 6), False), ((5, 20, 12), True)):
+        tiles.invalidate_tiles(db.session.connection(), {(4, 10, 6)})
+        db.session.commit()
+        monkeypatch.setattr(tiles, 'build_tile', build_during_write(touched))
+        assert client.get('/api/tiles/4/10/6').status_code == 200
+        db.session.expire_all()
+        tile = db.session.get(MapTile, (4, 10, 6))
+        assert (tile.body is not None) == stored
+
+# История метрик: каждая запись порта дописывает ряд, свертки считаются инкрементально
+def test_port_history(client):
+    from datetime import datetime, timedelta
+    from app.timeseries import record_measurements
+    access_token = get_access_token(client)
+    headers = {'Authorization': f'Bearer {access_token}'}
+    client.put('/api/ports/1', headers=headers, json={'air_quality': 30.0})
+    client.put('/api/ports/1', headers=headers, json={'name': 'Renamed only'})
+    
+    data = client.get('/api/ports/1/history').get_json()
+    assert data['resolution'] == 'hour'
+    assert sum(p['samples'] for p in data['points']) == 2  # insert из фикстуры + одно изменение метрик
+    assert max(p['air_quality_max'] for p in data['points']) == 30.0
+    
+    base = datetime(2024, 1, 1)
+    record_measurements(db.session.connection(), [
+        {'port_id': 1, 'timestamp': base + timedelta(hours=h), 'air_quality': float(h),
+         'water_quality': 10.0, 'co2_emissions': 500.0, 'incidents': 1}
+        for h in range(48)
+    ])
+    db.session.commit()
+    response = client.get('/api/ports/1/history', query_string={
+        'from': '2024-01-01T00:00:00', 'to': '2024-12-31T00:00:00'})
+    data = response.get_json()
+    assert data['resolution'] == 'day'
+    assert [p['samples'] for p in data['points']] == [24, 24]
+    assert data['points'][0]['air_quality'] == 11.5
+    assert data['points'][1]['air_quality_min'] == 24.0
+    
+    response = client.get('/api/ports/1/history', query_string={
+        'from': '2024-01-01T00:00:00', 'to': '2024-01-01T05:30:00'})
+    assert [p['air_quality'] for p in response.get_json()['points']] == [0.0, 1.0, 2.0, 3.0, 4.0, 5.0]
+    assert client.get('/api/ports/1/history?resolution=week').status_code == 400
+
+# Массовая загрузка метрик NDJSON/CSV с построчными ошибками
+def test_bulk_ingest_ports(client):
+    from app.aggregates import check_aggregates
+    access_token = get_access_token(client)
+    headers = {'Authorization': f'Bearer {access_token}'}
+    lines = [json.dumps({'name': f'Sensor {i}', 'lat': 41.0, 'lng': 51.0, 'air_quality': 10.0,
+                         'water_quality': 5.0, 'co2_emissions': 100.0, 'incidents': 0})
+             for i in range(1200)]
+    lines.append(json.dumps({'id': 1, 'air_quality': 12.5}))
+    lines.append(json.dumps({'id': 99999, 'air_quality': 1.0}))
+    lines.append(json.dumps({'name': 'Broken', 'lat': 200}))
+    lines.append('not json')
+    response = client.post('/api/ports/bulk', headers=headers, data='\n'.join(lines),
+                           content_type='application/x-ndjson')
+    data = response.get_json()
+    assert response.status_code == 207
+    assert data['created'] == 1200
+    assert data['updated'] == 1
+    assert sorted(e['line'] for e in data['errors']) == [1202, 1203, 1204]
+    assert db.session.get(Port, 1).air_quality == 12.5
+    
+    csv_body = 'id,name,air_quality,water_quality\n1,,60,\n,Only name,,\n'
+    response = client.post('/api/ports/bulk', headers=headers, data=csv_body, content_type='text/csv')
+    data = response.get_json()
+    assert data['updated'] == 1
+    assert data['errors'][0]['line'] == 3
+    assert db.session.get(Port, 1).air_quality == 60.0
+    assert Port.query.count() == 1201
+    assert check_aggregates(db.session.connection()) == []
+    
+    response = client.post('/api/ports/bulk', headers=headers, data='{}', content_type='application/json')
+    assert response.status_code == 415
+
+# Новые порты пишутся пачкой: число запросов на чанк не зависит от числа строк в нем
+def test_bulk_ingest_statements_per_chunk(client, assert_max_queries):
+    from app.aggregates import check_aggregates
+    from app.ingest import ingest_rows, iter_ndjson_rows
+    lines = [json.dumps({'name': f'Sensor {i}', 'lat': 41.0, 'lng': 51.0, 'air_quality': 10.0 + i % 50,
+                         'water_quality': 5.0, 'co2_emissions': 100.0, 'incidents': 0}).encode()
+             for i in range(1000)]
+    lines.append(json.dumps({'id': 1, 'air_quality': 12.5}).encode())
+    with assert_max_queries(8, 'one chunk of 10 ports'):
+        result = ingest_rows(iter_ndjson_rows(lines[:10]), on_alerts=lambda alerts: None)
+    assert result.created == 10
+    with assert_max_queries(2 * 8 + 1 + 8, 'two chunks of 500 ports and one update'):
+        result = ingest_rows(iter_ndjson_rows(lines), on_alerts=lambda alerts: None, chunk_size=500)
+    assert (result.created, result.updated) == (1000, 1)
+    assert Port.query.count() == 1011
+    assert check_aggregates(db.session.connection()) == []
+    
+    # Обновления разных столбцов (частичные строки NDJSON, пустые ячейки CSV) - тоже
+    # один UPDATE на чанк; две строки одного порта сливаются
+    from app.models import PortMeasurement
+    ids = [port_id for (port_id,) in db.session.query(Port.id).filter(Port.name.like('Sensor %')).limit(200)]
+    lines = [json.dumps({'id': port_id, ('air_quality' if k % 2 else 'water_quality'): 60.0 + k % 7}).encode()
+             for k, port_id in enumerate(ids)]
+    lines.append(json.dumps({'id': ids[0], 'lat': 42.0, 'name': 'Moved'}).encode())
+    measurements = PortMeasurement.query.count()
+    with assert_max_queries(8, 'one chunk of mixed-column updates'):
+        result = ingest_rows(iter_ndjson_rows(lines), on_alerts=lambda alerts: None)
+    assert result.updated == 201
+    moved = db.session.get(Port, ids[0])
+    assert (moved.name, moved.lat, moved.water_quality) == ('Moved', 42.0, 60.0)
+    assert moved.green_score == Port.calculate_green_score(10.0, 60.0, 100.0, 0)
+    assert moved.grid_cell == Port.calculate_grid_cell(42.0, 51.0)
+    assert db.session.get(Port, ids[1]).air_quality == 61.0
+    assert PortMeasurement.query.count() == measurements + 200
+    assert check_aggregates(db.session.connection()) == []
+
+# Роль в claim токена: админская запись без запроса пользователя к БД
+def test_admin_role_claim(client):
+    from flask_jwt_extended import create_access_token
+    from sqlalchemy import event
+    claim_headers = {'Authorization': f'Bearer {get_access_token(client)}'}
+    legacy_headers = {'Authorization': f"Bearer {create_access_token(identity='1')}"}
+    statements = []
+    def count_statement(*args):
+        statements.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', count_statement)
+    try:
+        counts = []
+        for incidents, headers in ((3, legacy_headers), (4, claim_headers)):
+            statements.clear()
+            assert client.put('/api/ports/1', headers=headers, json={'incidents': incidents}).status_code == 200
+            counts.append(len(statements))
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count_statement)
+    assert counts[0] - counts[1] == 1
+    
+    # Понижение роли при включенной перепроверке закрывает доступ старому токену сразу,
+    # хотя роль уже закэширована: запись роли сбрасывает кэш
+    client.application.config['JWT_ROLE_RECHECK_SECONDS'] = 60
+    assert client.put('/api/ports/1', headers=claim_headers, json={'incidents': 5}).status_code == 200
+    db.session.get(User, 1).role = 'user'
+    db.session.commit()
+    assert client.put('/api/ports/1', headers=claim_headers, json={'incidents': 5}).status_code == 403
+    db.session.get(User, 1).role = 'admin'
+    db.session.commit()
+    assert client.put('/api/ports/1', headers=claim_headers, json={'incidents': 6}).status_code == 200
+    db.session.delete(db.session.get(User, 1))
+    db.session.commit()
+    assert client.put('/api/ports/1', headers=claim_headers, json={'incidents': 7}).status_code == 403
+
 # Тест для создания нового порта (исправлены данные для валидации)
 def test_create_port(client):
     access_token = get_access_token(client)
@@ -77,6 +417,69 @@ def test_update_port(client):
     assert response.status_code == 200
     assert 'name' in response.get_json()
 
+# Диспетчер уведомлений: одно SMTP-соединение, пачки получателей, схлопывание повторов
+def test_notification_dispatcher_smtp():
+    from app.notifications import notifications
+    server = start_smtp_server()
+    class SMTPConfig(TestConfig):
+        MAIL_SERVER = '127.0.0.1'
+        MAIL_PORT = server.server_address[1]
+        MAIL_SUPPRESS_SEND = False
+        MAIL_DISPATCH_WORKERS = 1
+        MAIL_BATCH_SIZE = 2
+    app = create_app(SMTPConfig)
+    try:
+        with app.app_context():
+            db.create_all()
+            port = Port(name='Alert Port', lat=0, lng=0, air_quality=0, water_quality=0,
+                        co2_emissions=0, incidents=0)
+            db.session.add(port)
+            db.session.flush()
+            db.session.add_all(Subscription(port_id=port.id, email=f'user{i}@example.com') for i in range(5))
+            db.session.commit()
+            # Получатели читаются из subscription чанками по MAIL_BATCH_SIZE
+            assert notifications.notify(port.id, 'Alert', 'High pollution')
+            assert not notifications.notify(port.id, 'Alert', 'High pollution')
+            assert notifications.notify(port.id + 1, 'Alert', 'High pollution', recipients=['one@example.com'])
+            assert notifications.drain()
+            stats = notifications.stats()
+    finally:
+        server.shutdown()
+    assert server.connections == 1
+    assert [len(rcpts) for rcpts in server.messages] == [2, 2, 1, 1]
+    assert (stats['sent'], stats['batches'], stats['collapsed'], stats['queue_depth']) == (6, 4, 1, 0)
+
+# Окно схлопывания: запись о тревоге удаляется, когда окно истекло
+def test_notification_dedup_window_is_pruned(client):
+    import time
+    from app.notifications import notifications
+    client.application.config['MAIL_DEDUP_SECONDS'] = 0.05
+    state = client.application.extensions['notifications']
+    for port_id in range(1, 51):
+        assert notifications.notify(port_id, 'Alert', 'High pollution', recipients=['a@example.com'])
+    assert not notifications.notify(1, 'Alert', 'High pollution', recipients=['a@example.com'])
+    time.sleep(0.06)
+    assert notifications.notify(2, 'Alert', 'High pollution', recipients=['a@example.com'])
+    assert list(state.last_alert) == [2]
+    assert notifications.drain()
+
+# Тревога из update_port отправляется диспетчером без ORM-объектов в потоке
+def test_update_port_sends_alert(client):
+    from app import mail
+    from app.notifications import notifications
+    client.post('/api/ports/1/subscribe', json={'email': 'a@example.com'})
+    client.post('/api/ports/1/subscribe', json={'email': 'b@example.com'})
+    access_token = get_access_token(client)
+    headers = {'Authorization': f'Bearer {access_token}'}
+    with mail.record_messages() as outbox:
+        client.put('/api/ports/1', headers=headers, json={'air_quality': 75.0})
+        assert notifications.drain()
+    assert len(outbox) == 1
+    assert outbox[0].bcc == ['a@example.com', 'b@example.com']
+    assert outbox[0].body == 'Alert: High pollution in Test Port'
+    stats = client.get('/api/notifications/stats', headers=headers).get_json()
+    assert stats['sent'] == 2
+
 # Тест для удаления порта
 def test_delete_port(client):
     access_token = get_access_token(client)
@@ -85,6 +488,194 @@ def test_delete_port(client):
     assert response.status_code == 200
     assert 'message' in response.get_json()
 
+# Загрузка отчета: 202 с заданием, статус через /api/jobs/<id>
+def test_upload_report_job(client):
+    access_token = get_access_token(client)
+    headers = {'Authorization': f'Bearer {access_token}'}
+    pdf = make_pdf(['Summary\nAir quality: 12.5\nWater quality: 8\nCO2 emissions: 300\nIncidents: 1'])
+    response = client.post('/api/ports/1/upload_report', headers=headers,
+                           data={'file': (io.BytesIO(pdf), 'report.pdf')})
+    assert response.status_code == 202
+    job_id = response.get_json()['id']
+    
+    data = client.get(f'/api/jobs/{job_id}', headers=headers).get_json()
+    assert data['status'] == 'done'
+    assert data['fields'] == {'air_quality': 12.5, 'water_quality': 8, 'co2_emissions': 300, 'incidents': 1}
+    port = db.session.get(Port, 1)
+    assert (port.air_quality, port.incidents) == (12.5, 1)
+    
+    response = client.post('/api/ports/1/upload_report', headers=headers,
+                           data={'file': (io.BytesIO(make_pdf(['Nothing here'])), 'empty.pdf')})
+    data = client.get(f"/api/jobs/{response.get_json()['id']}", headers=headers).get_json()
+    assert data['status'] == 'failed'
+    assert data['error'] == 'No matching data found in PDF'
+
+# Пакетная загрузка: zip с манифестом, разбор и одна транзакция на все порты
+def test_upload_reports_batch(client):
+    access_token = get_access_token(client)
+    headers = {'Authorization': f'Bearer {access_token}'}
+    db.session.add(Port(name='Port of Aktau', lat=43.65, lng=51.16, air_quality=1.0,
+                        water_quality=1.0, co2_emissions=1.0, incidents=0))
+    db.session.commit()
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as bundle:
+        bundle.writestr('manifest.json', json.dumps({
+            'baku.pdf': 1, 'aktau.pdf': 'Port of Aktau', 'empty.pdf': 1,
+            'unknown.pdf': 'Port of Nowhere', 'absent.pdf': 1}))
+        bundle.writestr('baku.pdf', make_pdf(['Air quality: 31.5\nCO2 emissions: 720']))
+        bundle.writestr('aktau.pdf', make_pdf(['Water quality: 17', 'Incidents: 2']))
+        bundle.writestr('empty.pdf', make_pdf(['No data']))
+        bundle.writestr('unknown.pdf', make_pdf(['Air quality: 1']))
+        bundle.writestr('extra.pdf', make_pdf(['Air quality: 1']))
+    archive.seek(0)
+    response = client.post('/api/reports/batch', headers=headers,
+                           data={'archive': (archive, 'bundle.zip')})
+    assert response.status_code == 207
+    data = response.get_json()
+    results = {item['file']: item for item in data['results']}
+    assert results['baku.pdf']['fields'] == {'air_quality': 31.5, 'co2_emissions': 720}
+    assert results['aktau.pdf']['status'] == 'updated'
+    assert results['empty.pdf']['error'] == 'No matching data found in PDF'
+    assert results['unknown.pdf']['error'] == 'Port not found: Port of Nowhere'
+    assert results['extra.pdf']['error'] == 'File is not listed in the manifest'
+    assert results['absent.pdf']['error'] == 'File is missing from the upload'
+    assert (data['updated'], data['failed']) == (2, 4)
+    assert db.session.get(Port, 1).co2_emissions == 720
+    assert db.session.get(Port, 2).incidents == 2
+    
+    # multipart с несколькими файлами и манифестом в поле формы
+    response = client.post('/api/reports/batch', headers=headers, data={
+        'files': [(io.BytesIO(make_pdf(['Incidents: 4'])), 'a.pdf')],
+        'manifest': json.dumps([{'file': 'a.pdf', 'port_id': 2}])})
+    assert response.status_code == 200
+    assert db.session.get(Port, 2).incidents == 4
+    response = client.post('/api/reports/batch', headers=headers, data={
+        'files': [(io.BytesIO(b'x'), 'a.pdf')], 'manifest': 'not json'})
+    assert response.status_code == 400
+
+# Бюджет пакета растет с числом файлов, а запись в кэш разбора идет одной пачкой
+def test_upload_reports_batch_query_budget(client):
+    access_token = get_access_token(client)
+    headers = {'Authorization': f'Bearer {access_token}'}
+    db.session.add_all(Port(name=f'Port {i}', lat=41.0, lng=51.0, air_quality=1.0, water_quality=1.0,
+                            co2_emissions=1.0, incidents=0) for i in range(30))
+    db.session.commit()
+    
+    def upload():
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as bundle:
+            bundle.writestr('manifest.json', json.dumps({f'{i}.pdf': f'Port {i}' for i in range(30)}))
+            for i in range(30):
+                bundle.writestr(f'{i}.pdf', make_pdf([f'Air quality: {i + 0.5}\nIncidents: {i % 3}']))
+        archive.seek(0)
+        # QUERY_BUDGET_MODE = 'raise': превышение бюджета маршрута уронит запрос
+        response = client.post('/api/reports/batch', headers=headers,
+                               data={'archive': (archive, 'bundle.zip')})
+        assert response.status_code == 200
+        return response.get_json()['results']
+    
+    assert not any(item['cached'] for item in upload())
+    assert all(item['cached'] for item in upload())
+    stats = client.get('/api/reports/cache', headers=headers).get_json()
+    assert stats['entries'] == 30
+    assert Port.query.filter_by(name='Port 3').one().air_quality == 3.5
+
+# Повторная загрузка того же PDF берет значения из кэша по SHA-256
+def test_report_cache(client, monkeypatch):
+    from app import jobs
+    from app.report_cache import entry_size
+    access_token = get_access_token(client)
+    headers = {'Authorization': f'Bearer {access_token}'}
+    # Лимит на две записи размера первого отчета
+    report_entry = entry_size('0' * 64, json.dumps({'air_quality': 44.4, 'incidents': 4}))
+    client.application.config['REPORT_CACHE_MAX_BYTES'] = 2 * report_entry
+    db.session.add(Port(name='Second', lat=41.0, lng=51.0, air_quality=1.0,
+                        water_quality=1.0, co2_emissions=1.0, incidents=0))
+    db.session.commit()
+    parsed = []
+    original = jobs.extract_report_fields
+    monkeypatch.setattr(jobs, 'extract_report_fields', lambda data: parsed.append(1) or original(data))
+    
+    def upload(port_id, pdf):
+        response = client.post(f'/api/ports/{port_id}/upload_report', headers=headers,
+                               data={'file': (io.BytesIO(pdf), 'report.pdf')})
+        return response.get_json()
+    
+    before = client.get('/api/reports/cache', headers=headers).get_json()
+    report = make_pdf(['Air quality: 44.4\nIncidents: 4'])
+    assert upload(1, report)['status'] == 'done'
+    job = upload(2, report)
+    assert job['status'] == 'done'
+    assert job['fields'] == {'air_quality': 44.4, 'incidents': 4}
+    assert db.session.get(Port, 2).air_quality == 44.4
+    assert len(parsed) == 1
+    
+    stats = client.get('/api/reports/cache', headers=headers).get_json()
+    assert stats['hits'] - before['hits'] == 1
+    assert stats['misses'] - before['misses'] == 1
+    assert (stats['entries'], stats['size_bytes']) == (1, report_entry)
+    
+    # LRU: третий уникальный файл выходит за лимит и вытесняет самый давно использованный
+    upload(1, make_pdf(['Air quality: 1']))
+    upload(1, make_pdf(['Air quality: 2']))
+    stats = client.get('/api/reports/cache', headers=headers).get_json()
+    assert stats['entries'] == 2
+    assert stats['size_bytes'] <= stats['max_bytes']
+    upload(2, report)
+    assert len(parsed) == 4
+
+# Разбор PDF постранично с ранним выходом после нахождения всех полей
+def test_extract_report_fields_stops_early(monkeypatch):
+    from pdfplumber.page import Page
+    from app.report_parser import extract_report_fields
+    calls = []
+    original = Page.extract_text
+    def counting_extract_text(self, **kwargs):
+        calls.append(self.page_number)
+        return original(self, **kwargs)
+    monkeypatch.setattr(Page, 'extract_text', counting_extract_text)
+    
+    pdf = make_pdf(['Air quality: 41.5\nWater quality: 12', 'CO2 emissions: 640\nIncidents: 3',
+                    'Appendix', 'Appendix'])
+    fields = extract_report_fields(pdf)
+    assert fields == {'air_quality': 41.5, 'water_quality': 12, 'co2_emissions': 640, 'incidents': 3}
+    assert calls == [1, 2]
+    
+    calls.clear()
+    assert extract_report_fields(make_pdf(['Air quality: 5', 'Nothing', 'More'])) == {'air_quality': 5}
+    assert calls == [1, 2, 3]
+
+# Диспетчер: задание с истекшей арендой возвращается в очередь и разбирается в пуле процессов
+def test_report_job_dispatcher_recovers_stale_jobs(client):
+    from datetime import datetime, timedelta
+    from app.jobs import report_jobs
+    from app.models import ReportJob
+    app = client.application
+    app.config['REPORT_WORKERS'] = 1
+    state = app.extensions['report_jobs']
+    pdf = make_pdf(['Air quality: 33.3'])
+    db.session.add(ReportJob(port_id=1, filename='r.pdf', payload=pdf, status='running', attempts=1,
+                             updated_at=datetime.utcnow() - timedelta(hours=1)))
+    db.session.commit()
+    try:
+        report_jobs._recover_stale(state)
+        assert db.session.get(ReportJob, 1).status == 'queued'
+        report_jobs._claim_jobs(state)
+        assert state.in_flight == {1}
+        state.results.put(state.results.get(timeout=60))
+        report_jobs._drain_results(state)
+    finally:
+        state.executor.shutdown()
+    db.session.expire_all()
+    job = db.session.get(ReportJob, 1)
+    assert (job.status, job.attempts, job.payload) == ('done', 2, None)
+    assert db.session.get(Port, 1).air_quality == 33.3
+    # Диспетчер запускается только явно: запросы его не поднимают
+    assert client.get('/api/ports').status_code == 200
+    assert state.thread is None
+    result = app.test_cli_runner().invoke(args=['jobs', 'run'])
+    assert result.exit_code != 0 and 'REPORT_JOBS_EAGER' in result.output
+
 # Тест для загрузки отчета (убран, так как файл test_report.pdf может отсутствовать)
 # def test_upload_report(client):
 #     ...
@@ -93,7 +684,11 @@ def test_delete_port(client):
 def test_subscribe(client):
     response = client.post('/api/ports/1/subscribe', json={'email': 'test@example.com'})
     assert response.status_code == 200
-    assert 'message' in response.get_json()
+    assert response.get_json()['message'] == 'Subscribed'
+    response = client.post('/api/ports/1/subscribe', json={'email': 'test@example.com'})
+    assert response.get_json()['message'] == 'Already subscribed'
+    with client.application.app_context():
+        assert Subscription.query.filter_by(port_id=1).count() == 1
 
 # Тест для создания отчета от граждан
 def test_create_report(client):
@@ -105,7 +700,345 @@ def test_create_report(client):
     assert response.status_code == 201
     assert 'id' in response.get_json()
 
+# Лента отчетов: keyset-страницы с фильтрами и потоковый NDJSON
+def test_get_reports_pages_and_stream(client):
+    from datetime import datetime, timedelta
+    from app.models import Report
+    headers = {'Authorization': f'Bearer {get_access_token(client)}'}
+    other = Port(name='Other Port', lat=1, lng=1, air_quality=1, water_quality=1, co2_emissions=1, incidents=0)
+    db.session.add(other)
+    db.session.flush()
+    start = datetime(2026, 1, 1)
+    db.session.add_all(Report(port_id=1 if i % 3 else other.id, user_email=f'user{i}@example.com',
+                              description=f'Report {i}', timestamp=start + timedelta(hours=i // 2))
+                       for i in range(25))
+    db.session.commit()
+    
+    seen, cursor = [], None
+    while True:
+        params = {'port_id': 1, 'per_page': 4, 'since': '2026-01-01T03:00:00'}
+        if cursor:
+            params['cursor'] = cursor
+        page = client.get('/api/reports', headers=headers, query_string=params).get_json()
+        seen.extend(page['reports'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    expected = sorted((r for r in Report.query.filter(Report.port_id == 1) if r.timestamp >= start + timedelta(hours=3)),
+                      key=lambda r: (r.timestamp, r.id), reverse=True)
+    assert [r['id'] for r in seen] == [r.id for r in expected]
+    
+    response = client.get('/api/reports', headers=headers,
+                          query_string={'format': 'ndjson', 'until': '2026-01-01T02:00:00'})
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [line['id'] for line in lines] == [4, 3, 2, 1]
+    assert client.get('/api/reports', headers=headers, query_string={'since': 'yesterday'}).status_code == 400
+
+# Полнотекстовый поиск: индекс обновляется при create_report, подсветка экранирует HTML
+def test_search_reports(client, monkeypatch):
+    headers = {'Authorization': f'Bearer {get_access_token(client)}'}
+    for description in ('Oil spill near the <pier>', 'Oil smell, oil film and a spill on water',
+                        'Разлив нефти у причала', 'Noise at night'):
+        client.post('/api/reports', json={'port_id': 1, 'user_email': 'a@example.com', 'description': description})
+    
+    results = client.get('/api/reports/search', headers=headers, query_string={'q': 'oil spill'}).get_json()['results']
+    assert len(results) == 2
+    assert results[0]['rank'] >= results[1]['rank']
+    pier = [r for r in results if 'pier' in r['snippet']][0]
+    assert pier['snippet'] == '<mark>Oil</mark> <mark>spill</mark> near the &lt;pier&gt;'
+    
+    results = client.get('/api/reports/search', headers=headers, query_string={'q': 'нефти'}).get_json()['results']
+    assert [r['snippet'] for r in results] == ['Разлив <mark>нефти</mark> у причала']
+    assert client.get('/api/reports/search', headers=headers,
+                      query_string={'q': 'oil', 'port_id': 2}).get_json()['results'] == []
+    assert client.get('/api/reports/search', headers=headers, query_string={'q': '" OR'}).status_code == 200
+    assert client.get('/api/reports/search', headers=headers, query_string={'q': '*'}).status_code == 400
+    
+    # БД без полнотекстового поиска - 501 с JSON-ошибкой, а не 500
+    monkeypatch.setattr('app.search.SEARCH_DIALECTS', ('postgresql',))
+    response = client.get('/api/reports/search', headers=headers, query_string={'q': 'oil'})
+    assert response.status_code == 501
+    assert 'not available' in response.get_json()['error']
+
+# Выгрузка порциями: CSV, Parquet и Arrow совпадают с таблицей
+def test_export_ports(client):
+    import csv
+    pyarrow = pytest.importorskip('pyarrow')
+    import pyarrow.ipc
+    import pyarrow.parquet
+    from app.export import iter_export
+    headers = {'Authorization': f'Bearer {get_access_token(client)}'}
+    db.session.add_all(Port(name=f'Port, "{i}"', lat=i, lng=i, air_quality=i, water_quality=1, co2_emissions=1,
+                            incidents=i % 3) for i in range(30))
+    db.session.commit()
+    expected = [(port.id, port.name, port.green_score) for port in Port.query.order_by(Port.id)]
+    
+    response = client.get('/api/export/ports', headers=headers)
+    assert response.headers['Content-Disposition'] == 'attachment; filename=ports.csv'
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [(int(r['id']), r['name'], float(r['green_score'])) for r in rows] == expected
+    
+    table = pyarrow.parquet.read_table(io.BytesIO(b''.join(iter_export('ports', 'parquet', batch_size=7))))
+    assert table.num_rows == 31 and table.schema.field('incidents').type == pyarrow.int64()
+    assert list(zip(table['id'].to_pylist(), table['name'].to_pylist(), table['green_score'].to_pylist())) == expected
+    response = client.get('/api/export/ports', headers=headers, query_string={'format': 'arrow'})
+    assert pyarrow.ipc.open_stream(response.get_data()).read_all().equals(table)
+    assert client.get('/api/export/users', headers=headers).status_code == 400
+
+# Быстрый сериализатор дает те же байты, что jsonify(schema.dump(...))
+def test_fast_serializer_matches_schema(client):
+    from datetime import datetime
+    from flask import jsonify
+    from app.models import Report
+    from app.routes import ports_schema, report_schema
+    db.session.add_all([
+        Port(name='Порт "Актау" \\ <x>', lat=43.65, lng=51.2, air_quality=1e-7, water_quality=3,
+             co2_emissions=1e16, incidents=4),
+        Report(port_id=1, user_email='a@example.com', description='Ünïcode\n"quoted"', timestamp=datetime(2026, 5, 1, 12, 30, 1, 250)),
+        Report(port_id=1, user_email='b@example.com', description='plain', timestamp=datetime(2026, 5, 1)),
+    ])
+    db.session.commit()
+    
+    response = client.get('/api/ports', query_string={'per_page': 50, 'sort': 'green_score'})
+    ports = Port.query.order_by(Port.green_score, Port.id).all()
+    expected = jsonify({'ports': ports_schema.dump(ports), 'total': 2, 'pages': 1, 'current_page': 1})
+    assert response.get_data() == expected.get_data()
+    
+    headers = {'Authorization': f'Bearer {get_access_token(client)}'}
+    response = client.get('/api/reports', headers=headers)
+    reports = Report.query.order_by(Report.timestamp.desc(), Report.id.desc()).all()
+    assert response.get_data() == jsonify({'reports': report_schema.dump(reports, many=True),
+                                            'next_cursor': None}).get_data()
+
+# Векторный расчет: профиль default совпадает с хранимым green_score, профили не меняют данные
+def test_scoring_profiles(client):
+    import random
+    import numpy as np
+    from app.scoring import default_profile, score_matrix
+    rng = random.Random(3)
+    values = [(rng.choice([0, 12.5, 49.999, 50, 75]) + rng.random() * rng.choice([0, 1]), rng.uniform(0, 45),
+               rng.uniform(0, 1500), rng.randint(0, 8)) for _ in range(2000)]
+    expected = [Port.calculate_green_score(*row) for row in values]
+    assert score_matrix(np.array(values, dtype=float), default_profile()).tolist() == expected
+    # Суммы на границе .xx5: np.round и round() округляют их по-разному
+    ties = [(0, 0, 1.0, 0), (0.05, 0, 0, 0), (0.01, 0, 250, 0), (0.5, 0.3, 10, 0), (0, 0, 0.2, 0)]
+    expected = [Port.calculate_green_score(*row) for row in ties]
+    assert expected[:3] == [99.97, 99.97, 93.75]
+    assert score_matrix(np.array(ties, dtype=float), default_profile()).tolist() == expected
+    
+    headers = {'Authorization': f'Bearer {get_access_token(client)}'}
+    db.session.add(Port(name='Clean', lat=0, lng=0, air_quality=0, water_quality=0, co2_emissions=900, incidents=0))
+    db.session.commit()
+    ranked = client.post('/api/ports/score', headers=headers).get_json()
+    assert [(p['name'], p['score']) for p in ranked['ports']] == [('Clean', 77.5), ('Test Port', 59.17)]
+    assert all(p['score'] == p['green_score'] for p in ranked['ports'])
+    
+    response = client.put('/api/scoring/profiles/co2-heavy', headers=headers,
+                          json={'weights': {'co2_emissions': 70, 'air_quality': 10, 'water_quality': 10,
+                                            'incidents': 10}})
+    assert response.status_code == 201
+    ranked = client.post('/api/ports/score?profile=co2-heavy', headers=headers).get_json()
+    assert [p['name'] for p in ranked['ports']] == ['Test Port', 'Clean']
+    what_if = client.post('/api/ports/score?profile=co2-heavy', headers=headers,
+                          json={'thresholds': {'co2_emissions': 5000}}).get_json()
+    assert what_if['profile']['thresholds']['co2_emissions'] == 5000
+    assert db.session.get(Port, 1).green_score == 59.17
+    assert client.put('/api/scoring/profiles/default', headers=headers, json={}).status_code == 400
+    assert client.post('/api/ports/score?profile=missing', headers=headers).status_code == 404
+    assert client.post('/api/ports/score', headers=headers, json={'weights': {'noise': 1}}).status_code == 400
+    assert client.post('/api/ports/score').status_code == 401
+
+# Наполнение БД: повторный запуск ничего не дублирует, отчеты фикстур привязаны к портам по имени
+def test_seed_is_idempotent(client):
+    from app.models import Report
+    from app.search import search_reports
+    runner = client.application.test_cli_runner()
+    args = ['seed', 'run', '--scale', '25', '--reports-per-port', '2', '--batch-size', '10']
+    result = runner.invoke(args=args)
+    assert result.exit_code == 0, result.output
+    assert '4 users, 35 ports, 60 reports added' in result.output
+    assert '0 users, 0 ports, 0 reports added' in runner.invoke(args=args).output
+    
+    assert User.query.count() == 5 and Port.query.count() == 36 and Report.query.count() == 60
+    aktau = Port.query.filter_by(name='Port of Aktau').one()
+    assert [r.description for r in Report.query.filter_by(port_id=aktau.id)] == ['Oil spill observed near Aktau.']
+    station = Port.query.filter(Port.name.like('%monitoring station 7')).one()
+    assert station.green_score == Port.calculate_green_score(
+        station.air_quality, station.water_quality, station.co2_emissions, station.incidents)
+    assert station.grid_cell == Port.calculate_grid_cell(station.lat, station.lng)
+    assert len(search_reports('spill aktau')) == 1
+    assert len(search_reports(station.name.split()[0], per_page=100)) >= 2
+    assert runner.invoke(args=['stats', 'check']).exit_code == 0
+
+# Реплика для чтения: GET-маршруты читают из нее, записи идут в основную БД (обе - файлы SQLite в WAL)
+def test_read_replica_routing(tmp_path):
+    from sqlalchemy import text
+    
+    class ReplicaConfig(TestConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'primary.db'}"
+        SQLALCHEMY_REPLICA_URI = f"sqlite:///{tmp_path / 'replica.db'}"
+    
+    app = create_app(ReplicaConfig)
+    with app.app_context():
+        replica = db.engines['replica']
+        db.create_all()
+        db.metadata.create_all(replica)
+        user = User(username='testadmin', role='admin')
+        user.set_password('testpass')
+        db.session.add(user)
+        db.session.commit()
+        with replica.begin() as conn:
+            conn.execute(Port.__table__.insert(), {'name': 'Replica Port', 'lat': 40.0, 'lng': 50.0, 'air_quality': 1,
+                                                   'water_quality': 1, 'co2_emissions': 1, 'incidents': 0,
+                                                   'green_score': 99.0})
+        client = app.test_client()
+        headers = {'Authorization': f'Bearer {get_access_token(client)}'}
+        
+        assert client.get('/api/ports/1').get_json()['name'] == 'Replica Port'
+        response = client.post('/api/ports', headers=headers, json={
+            'name': 'Primary Port', 'lat': 41.0, 'lng': 51.0, 'air_quality': 10, 'water_quality': 5,
+            'co2_emissions': 100, 'incidents': 1})
+        assert response.status_code == 201
+        assert [p['name'] for p in client.get('/api/ports').get_json()['ports']] == ['Replica Port']
+        assert client.post('/api/reports', json={'port_id': 1, 'user_email': 'a@example.com',
+                                                 'description': 'Oil'}).status_code == 201
+        assert client.get('/api/reports', headers=headers).get_json()['reports'] == []
+        # Вне маршрутов с @read_replica - основная БД
+        assert db.session.execute(text('SELECT name FROM port')).scalars().all() == ['Primary Port']
+        assert db.session.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+        with replica.connect() as conn:
+            assert conn.execute(text('PRAGMA synchronous')).scalar() == 1  # NORMAL
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+
+# Метрики Prometheus на /metrics и профиль одного запроса по ?profile=1 для администратора
+def test_metrics_and_profile(client):
+    headers = {'Authorization': f'Bearer {get_access_token(client)}'}
+    assert client.get('/api/ports').status_code == 200
+    client.post('/api/ports/1/upload_report', headers=headers,
+                data={'file': (io.BytesIO(make_pdf(['Air quality: 7'])), 'metrics.pdf')})
+    
+    response = client.get('/metrics')
+    assert response.status_code == 200 and response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    assert 'http_requests_total{endpoint="api.get_ports",method="GET",status="200"}' in text
+    assert 'http_request_duration_seconds_bucket{endpoint="api.get_ports",method="GET",le="+Inf"}' in text
+    assert 'http_request_queries_count{endpoint="api.upload_report"}' in text
+    assert 'db_queries_total{endpoint="api.get_ports"}' in text
+    assert 'report_parse_duration_seconds_count{mode="inline",status="done"}' in text
+    assert 'notifications_total{event="sent"}' in text
+    
+    profiled = client.get('/api/ports?profile=1', headers=headers)
+    assert profiled.mimetype == 'text/plain' and 'cumulative' in profiled.get_data(as_text=True)
+    assert profiled.headers['X-Profiled-Status'] == '200' and int(profiled.headers['X-Profiled-Queries']) >= 1
+    assert client.get('/api/ports?profile=1').mimetype == 'application/json'
+    
+    client.application.config['METRICS_TOKEN'] = 'scrape-secret'
+    assert client.get('/metrics').status_code == 403
+    assert client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'}).status_code == 200
+
+# Бюджет SQL-запросов: он объявлен у каждого маршрута, превышение роняет тест или пишет предупреждение
+def test_query_budget(client, assert_max_queries, caplog):
+    from app.query_budget import QueryBudgetExceeded
+    app = client.application
+    views = {name: view for name, view in app.view_functions.items() if name.startswith('api.')}
+    assert [name for name, view in views.items() if not hasattr(view, 'query_budget')] == []
+    
+    with assert_max_queries(2):
+        assert client.get('/api/ports').status_code == 200
+    with pytest.raises(QueryBudgetExceeded, match='ran 4 SQL statements, budget is 2'):
+        with assert_max_queries(2):
+            client.get('/api/ports')
+            client.get('/api/ports?page=2')
+    
+    views['api.get_ports'].query_budget = 1
+    try:
+        with pytest.raises(QueryBudgetExceeded, match=r'GET /api/ports \(api.get_ports\) ran 2'):
+            client.get('/api/ports')
+        app.config['QUERY_BUDGET_MODE'] = 'warn'
+        assert client.get('/api/ports').status_code == 200
+        assert 'ran 2 SQL statements, budget is 1' in caplog.text
+    finally:
+        views['api.get_ports'].query_budget = 2
+    
+    # Наполнение БД пишет пачками: число запросов не зависит от числа строк
+    with assert_max_queries(40, 'seed run'):
+        result = app.test_cli_runner().invoke(args=['seed', 'run', '--scale', '500'])
+    assert result.exit_code == 0, result.output
+    
+    # Бюджет массовой загрузки - на чанк: обновления разных столбцов (пустые ячейки
+    # CSV) в него укладываются
+    app.config['QUERY_BUDGET_MODE'] = 'raise'
+    ids = [port_id for (port_id,) in db.session.query(Port.id).order_by(Port.id).limit(600)]
+    assert len(ids) > 500
+    csv_body = 'id,air_quality,water_quality\n' + ''.join(
+        f'{port_id},61,\n' if k % 2 else f'{port_id},,31\n' for k, port_id in enumerate(ids))
+    headers = {'Authorization': f'Bearer {get_access_token(client)}'}
+    response = client.post('/api/ports/bulk', headers=headers, data=csv_body, content_type='text/csv')
+    assert response.status_code == 200
+    assert response.get_json()['updated'] == len(ids)
+
 # Вспомогательная функция для получения JWT
 def get_access_token(client):
     response = client.post('/api/login', json={'username': 'testadmin', 'password': 'testpass'})
-    return response.get_json()['access_token']
\ No newline at end of file
+    return response.get_json()['access_token']
+
+# Минимальный PDF с текстом на каждой странице (для тестов разбора отчетов)
+def make_pdf(pages):
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>']
+    kids = ' '.join(f'{4 + 2 * i} 0 R' for i in range(len(pages)))
+    objects.append(f'<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>'.encode())
+    objects.append(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+    for i, text in enumerate(pages):
+        lines = ''.join(f'({line}) Tj T* ' for line in text.split('\n'))
+        stream = f'BT /F1 12 Tf 14 TL 50 750 Td {lines}ET'
+        objects.append(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] '
+                       f'/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>'.encode())
+        objects.append(f'<< /Length {len(stream)} >>\nstream\n{stream}\nendstream'.encode())
+    out = b'%PDF-1.4\n'
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f'{number} 0 obj\n'.encode() + body + b'\nendobj\n'
+    xref = len(out)
+    out += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    out += ''.join(f'{offset:010d} 00000 n \n' for offset in offsets).encode()
+    out += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode()
+    return out
+
+# Локальная замена SMTP-сервера: считает соединения и принятые письма
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.server.connections += 1
+        self.wfile.write(b'220 localhost ESMTP\r\n')
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            verb = line.decode().strip().split(' ', 1)[0].upper()
+            if verb == 'RCPT':
+                recipients.append(line.decode().strip())
+            if verb == 'DATA':
+                self.wfile.write(b'354 End data with <CR><LF>.<CR><LF>\r\n')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                self.server.messages.append(recipients)
+                recipients = []
+            if verb == 'QUIT':
+                self.wfile.write(b'221 Bye\r\n')
+                return
+            if verb != 'DATA':
+                self.wfile.write(b'250 OK\r\n')
+            else:
+                self.wfile.write(b'250 Queued\r\n')
+
+def start_smtp_server():
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), _SMTPHandler)
+    server.daemon_threads = True
+    server.connections = 0
+    server.messages = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server